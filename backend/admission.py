@@ -0,0 +1,186 @@
+"""
+Admission control and load shedding for the prediction endpoints
+Per-client token buckets, a bounded in-flight limit with a bounded FIFO queue in front of it,
+and deadline-aware shedding so requests that can no longer finish in time are dropped early
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class Rejected(Exception):
+    """A request turned away: `reason` is rate_limited (429), queue_full or deadline (503)"""
+
+    MESSAGES = {
+        'rate_limited': 'Too many requests, please slow down',
+        'queue_full': 'Server is busy, please retry shortly',
+        'deadline': 'Request could not be served in time, please retry shortly',
+    }
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(self.MESSAGES[reason])
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucketLimiter:
+    """
+    One token bucket per client: `rate` tokens per second, holding at most
+    `burst`. A request costs one token per image. Buckets of the least
+    recently seen clients are dropped beyond `max_clients` (a dropped client
+    simply starts again with a full bucket).
+    """
+
+    def __init__(self, rate, burst, max_clients=10000):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be > 0 and burst >= 1")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def acquire(self, client, cost=1):
+        """Take `cost` tokens; returns 0 if admitted, else the seconds until they would be available"""
+        cost = min(float(cost), self.burst)  # a request larger than the burst waits for a full bucket
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class _Waiter:
+    __slots__ = ('event',)
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+class AdmissionController:
+    """
+    At most `max_in_flight` requests run at once; up to `max_queue` more wait
+    in FIFO order and the rest are rejected immediately. A waiting request
+    gives up when its deadline passes, so nothing is run after the client
+    has stopped waiting for it. Freed slots are handed straight to the
+    oldest waiter, so new arrivals cannot overtake the queue.
+    """
+
+    def __init__(self, max_in_flight, max_queue, ewma_alpha=0.2):
+        if max_in_flight < 1 or max_queue < 0:
+            raise ValueError("max_in_flight must be >= 1 and max_queue >= 0")
+        self.max_in_flight = int(max_in_flight)
+        self.max_queue = int(max_queue)
+        self.ewma_alpha = ewma_alpha
+        self.in_flight = 0
+        self.service_seconds = None  # moving average, used for Retry-After
+        self.rejections = {'queue_full': 0, 'deadline': 0}
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def _retry_after(self):
+        """Rough time until the current queue has drained"""
+        per_request = self.service_seconds or 1.0
+        return per_request * (len(self._waiters) + 1) / self.max_in_flight
+
+    def _reject(self, reason):
+        self.rejections[reason] += 1
+        return Rejected(reason, 503, self._retry_after())
+
+    def acquire(self, deadline=None):
+        """
+        Take a slot, waiting until `deadline` (a time.monotonic() value) at the
+        latest. Returns the seconds spent queued; raises Rejected if the queue
+        is full or the deadline passes first.
+        """
+        with self._lock:
+            if deadline is not None and deadline <= time.monotonic():
+                raise self._reject('deadline')
+            if self.in_flight < self.max_in_flight and not self._waiters:
+                self.in_flight += 1
+                return 0.0
+            if len(self._waiters) >= self.max_queue:
+                raise self._reject('queue_full')
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+
+        queued_at = time.monotonic()
+        waiter.event.wait(None if deadline is None else max(0.0, deadline - queued_at))
+        with self._lock:
+            # Checked under the lock: a slot may have been handed over just as the wait timed out
+            if not waiter.event.is_set():
+                self._waiters.remove(waiter)
+                raise self._reject('deadline')
+        return time.monotonic() - queued_at
+
+    def release(self, service_seconds=None):
+        with self._lock:
+            if service_seconds is not None:
+                if self.service_seconds is None:
+                    self.service_seconds = service_seconds
+                else:
+                    self.service_seconds += self.ewma_alpha * (service_seconds - self.service_seconds)
+            if self._waiters:
+                self._waiters.popleft().event.set()  # the slot passes to the oldest waiter
+            else:
+                self.in_flight -= 1
+
+    @contextmanager
+    def admit(self, deadline=None):
+        """Hold a slot for the body of the `with` block; yields the seconds spent queued"""
+        queued = self.acquire(deadline)
+        started = time.monotonic()
+        try:
+            yield queued
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'queued': len(self._waiters),
+            'max_in_flight': self.max_in_flight,
+            'max_queue': self.max_queue,
+            'service_ms': round(self.service_seconds * 1000, 1) if self.service_seconds else None,
+            'rejections': dict(self.rejections),
+        }
+
+
+def upstream_queue_seconds(header, now=None):
+    """
+    Time a request waited in front of the app, from an X-Request-Start header
+    set by the load balancer or reverse proxy ('t=<epoch>' in seconds,
+    milliseconds or microseconds). Returns 0 when absent or unparseable.
+    """
+    if not header:
+        return 0.0
+    try:
+        started = float(header.strip().split('=', 1)[-1])
+    except ValueError:
+        return 0.0
+    # Tell the units apart by magnitude
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, (now or time.time()) - started)
@@ -0,0 +1,229 @@
+"""
+Concurrent Agmarknet fetcher
+Issues one filtered query per commodity (and state) in parallel over a pooled keep-alive session
+"""
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Our commodity key -> exact Agmarknet commodity names to filter on
+AGMARKNET_COMMODITY_FILTERS = {
+    'wheat': ['Wheat'],
+    'rice': ['Rice'],
+    'cotton': ['Cotton'],
+    'sugarcane': ['Sugarcane'],
+    'soybean': ['Soyabean'],
+    'maize': ['Maize'],
+    'gram': ['Bengal Gram(Gram)(Whole)'],
+    'tur': ['Arhar (Tur/Red Gram)(Whole)'],
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class _AgmarknetClient:
+    """
+    What the sync and async fetchers share: query building, the retry policy
+    and result merging. Subclasses only supply the I/O (get, fetch_all, close).
+    """
+
+    def __init__(self, base_url, api_key, max_concurrency=8, timeout=10, retries=2, backoff=0.5):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def _query(self, params):
+        query = {'api-key': self.api_key, 'format': 'json'}
+        query.update(params)
+        return query
+
+    def _check_status(self, status_code, response=None):
+        """Record the outcome; None on success, the error to retry on, or raise when not retryable"""
+        outcome = 'ok' if status_code == 200 else f'http_{status_code}'
+        metrics.AGMARKNET_REQUESTS.labels('fetcher', outcome).inc()
+        if status_code == 200:
+            return None
+        error = requests.HTTPError(f"Agmarknet API error: Status {status_code}", response=response)
+        if status_code not in RETRY_STATUS_CODES:
+            raise error
+        return error
+
+    def _transport_failed(self, error, timed_out):
+        metrics.AGMARKNET_REQUESTS.labels('fetcher', 'timeout' if timed_out else 'connection_error').inc()
+        return error
+
+    def _retry_delay(self, attempt):
+        """Seconds to wait before the next attempt, or None after the last one"""
+        if attempt >= self.retries:
+            return None
+        return self.backoff * (2 ** attempt) * (1 + random.random())
+
+    @staticmethod
+    def _commodity_params(commodity_key, state, limit):
+        """One query per Agmarknet name of the commodity, most recent records first"""
+        for name in AGMARKNET_COMMODITY_FILTERS.get(commodity_key, [commodity_key]):
+            params = {
+                'limit': limit,
+                'filters[commodity]': name,
+                'sort[arrival_date]': 'desc',
+            }
+            if state:
+                params['filters[state]'] = state
+            yield params
+
+    @staticmethod
+    def _queries(commodities, states):
+        commodities = list(commodities or AGMARKNET_COMMODITY_FILTERS)
+        return [(key, state) for key in commodities for state in (states or [None])]
+
+    @staticmethod
+    def _merge(queries, outcomes):
+        """Pair each query with its records or exception: ({commodity_key: [records]}, {query: error})"""
+        records, errors = {}, {}
+        for (key, state), outcome in zip(queries, outcomes):
+            if isinstance(outcome, Exception):
+                errors[f"{key}/{state}" if state else key] = str(outcome)
+            else:
+                records.setdefault(key, []).extend(outcome)
+        return records, errors
+
+
+class AgmarknetFetcher(_AgmarknetClient):
+    """
+    Fan-out fetcher for the Agmarknet resource API.
+
+    All requests share one requests.Session (keep-alive connection pool sized
+    to the concurrency limit). A global semaphore caps in-flight requests
+    across every caller, each request has its own timeout, and transient
+    failures (connection errors, 429 and 5xx) are retried with exponential
+    backoff plus jitter.
+    """
+
+    def __init__(self, base_url, api_key, max_concurrency=8, timeout=10, retries=2, backoff=0.5):
+        super().__init__(base_url, api_key, max_concurrency, timeout, retries, backoff)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='agmarknet')
+
+    def get(self, params):
+        """GET with the global concurrency limit, per-request timeout and retry with backoff"""
+        query = self._query(params)
+        for attempt in range(self.retries + 1):
+            try:
+                with self._semaphore, metrics.AGMARKNET_SECONDS.labels('fetcher').time():
+                    response = self.session.get(self.base_url, params=query, timeout=self.timeout)
+                error = self._check_status(response.status_code, response)
+                if error is None:
+                    return response.json()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = self._transport_failed(e, isinstance(e, requests.Timeout))
+
+            delay = self._retry_delay(attempt)
+            if delay is not None:
+                time.sleep(delay)
+        raise error
+
+    def fetch_commodity(self, commodity_key, state=None, limit=100):
+        """Most recent records for one commodity (optionally one state)"""
+        records = []
+        for params in self._commodity_params(commodity_key, state, limit):
+            records.extend(self.get(params).get('records', []))
+        return records
+
+    def fetch_all(self, commodities=None, states=None, limit=100):
+        """
+        Fetch every (commodity, state) query concurrently.
+        Returns ({commodity_key: [records]}, {query: error}) - a failing query
+        only loses its own records.
+        """
+        queries = self._queries(commodities, states)
+        futures = [self._executor.submit(self.fetch_commodity, key, state, limit) for key, state in queries]
+
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+        return self._merge(queries, outcomes)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class AsyncAgmarknetFetcher(_AgmarknetClient):
+    """
+    asyncio version of AgmarknetFetcher for the ASGI app (requires httpx).
+
+    Same queries, limits and retry policy, but every call runs on the event
+    loop over one pooled httpx.AsyncClient, so a slow upstream holds no threads.
+    """
+
+    def __init__(self, base_url, api_key, max_concurrency=8, timeout=10, retries=2, backoff=0.5):
+        import httpx
+
+        super().__init__(base_url, api_key, max_concurrency, timeout, retries, backoff)
+        self._httpx = httpx
+        self._client = None
+        self._semaphore = None
+
+    def _ensure_client(self):
+        # Created lazily so they bind to the running event loop
+        if self._client is None:
+            limits = self._httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = self._httpx.AsyncClient(timeout=self.timeout, limits=limits)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def get(self, params):
+        client = self._ensure_client()
+        query = self._query(params)
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    with metrics.AGMARKNET_SECONDS.labels('fetcher').time():
+                        response = await client.get(self.base_url, params=query)
+                error = self._check_status(response.status_code)
+                if error is None:
+                    return response.json()
+            except (self._httpx.TransportError, self._httpx.TimeoutException) as e:
+                error = self._transport_failed(e, isinstance(e, self._httpx.TimeoutException))
+
+            delay = self._retry_delay(attempt)
+            if delay is not None:
+                await asyncio.sleep(delay)
+        raise error
+
+    async def fetch_commodity(self, commodity_key, state=None, limit=100):
+        records = []
+        for params in self._commodity_params(commodity_key, state, limit):
+            records.extend((await self.get(params)).get('records', []))
+        return records
+
+    async def fetch_all(self, commodities=None, states=None, limit=100):
+        """Same contract as AgmarknetFetcher.fetch_all: ({commodity_key: [records]}, {query: error})"""
+        queries = self._queries(commodities, states)
+        outcomes = await asyncio.gather(
+            *(self.fetch_commodity(key, state, limit) for key, state in queries), return_exceptions=True)
+        return self._merge(queries, outcomes)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
@@ -0,0 +1,160 @@
+"""
+Local stand-in for the data.gov.in Agmarknet resource API
+Serves deterministic mandi price records so the backend can be tested and benchmarked offline
+
+Usage:
+    python agmarknet_stub.py --port 8765 [--latency-ms 200] [--days 90]
+    AGMARKNET_BASE_URL=http://127.0.0.1:8765/resource/stub python app.py
+
+Supports the query parameters the backend uses: api-key, format, limit,
+offset, filters[commodity|state|market|arrival_date] and sort[arrival_date].
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STUB_COMMODITIES = {
+    'Wheat': 2300, 'Rice': 3100, 'Cotton': 6800, 'Sugarcane': 350,
+    'Soyabean': 4600, 'Maize': 2100, 'Bengal Gram(Gram)(Whole)': 5400, 'Arhar (Tur/Red Gram)(Whole)': 7200,
+    'Onion': 1800, 'Tomato': 1500,
+}
+STUB_MARKETS = [
+    ('Punjab', 'Ludhiana', 'Khanna'),
+    ('Maharashtra', 'Nagpur', 'Nagpur'),
+    ('Madhya Pradesh', 'Indore', 'Indore'),
+    ('Gujarat', 'Rajkot', 'Rajkot'),
+]
+
+
+def generate_records(days=90, end=None, seed=42):
+    """Daily records for every commodity/market pair, oldest first"""
+    rng = random.Random(seed)
+    end = end or date.today()
+    records = []
+    for offset in range(days, 0, -1):
+        day = end - timedelta(days=offset - 1)
+        for commodity, base in STUB_COMMODITIES.items():
+            for state, district, market in STUB_MARKETS:
+                modal = round(base * (1 + rng.uniform(-0.08, 0.08)))
+                records.append({
+                    'state': state,
+                    'district': district,
+                    'market': market,
+                    'commodity': commodity,
+                    'variety': 'Other',
+                    'grade': 'FAQ',
+                    'arrival_date': day.strftime('%d/%m/%Y'),
+                    'min_price': str(round(modal * 0.95)),
+                    'max_price': str(round(modal * 1.05)),
+                    'modal_price': str(modal),
+                })
+    return records
+
+
+class AgmarknetStub:
+    """Threaded HTTP server holding a fixed set of records"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, days=90, fail_rate=0.0, records=None, max_limit=None):
+        self.records = records if records is not None else generate_records(days)
+        self.latency = latency_ms / 1000.0
+        self.fail_rate = fail_rate
+        self.max_limit = max_limit  # like the sample API key, which returns at most 10 records per request
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/resource/stub"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='agmarknet-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _query(self, params):
+        records = self.records
+        for field in ('commodity', 'state', 'market', 'arrival_date'):
+            wanted = params.get(f'filters[{field}]', [None])[0]
+            if wanted:
+                records = [r for r in records if r[field].lower() == wanted.lower()]
+        if params.get('sort[arrival_date]', [''])[0] == 'desc':
+            records = list(reversed(records))
+        return records
+
+    def _handle(self, handler):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        params = parse_qs(urlparse(handler.path).query)
+        if not params.get('api-key'):
+            return self._send(handler, 403, {'error': 'Key not authorised'})
+        if self.fail_rate and random.random() < self.fail_rate:
+            return self._send(handler, 503, {'error': 'Service unavailable'})
+
+        records = self._query(params)
+        offset = int(params.get('offset', ['0'])[0])
+        limit = int(params.get('limit', ['10'])[0])
+        if self.max_limit:
+            limit = min(limit, self.max_limit)
+        page = records[offset:offset + limit]
+        self._send(handler, 200, {
+            'status': 'ok',
+            'total': len(records),
+            'count': len(page),
+            'limit': str(limit),
+            'offset': str(offset),
+            'records': page,
+        })
+
+    @staticmethod
+    def _send(handler, status, payload):
+        body = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Agmarknet API stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Artificial latency per request')
+    parser.add_argument('--days', type=int, default=90, help='Days of history to serve')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--max-limit', type=int, help='Records per request at most (10 mimics the sample API key)')
+    args = parser.parse_args()
+
+    stub = AgmarknetStub(args.host, args.port, args.latency_ms, args.days, args.fail_rate, max_limit=args.max_limit)
+    print(f"✓ Agmarknet stub serving {len(stub.records)} records at {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
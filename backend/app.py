@@ -1,16 +1,37 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
+from contextlib import contextmanager
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import random
 import os
 import numpy as np
-from PIL import Image
-import tensorflow as tf
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 import io
-import requests
 from dotenv import load_dotenv
-import urllib.request
+from email.utils import formatdate
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+from batching import MicroBatcher
+from inference import INFERENCE_BACKENDS, CascadePredictor, backend_model_paths, load_predictor, parse_buckets
+from prediction_cache import PredictionCache, content_key
+from preprocessing import IMAGE_SIZE, PreprocessBuffers, decode_image_into
+from price_cache import StaleWhileRevalidateCache
+from price_store import PriceStore, PriceSyncThread, parse_arrival_date
+from agmarknet_fetcher import AgmarknetFetcher
+from admission import AdmissionController, Rejected, TokenBucketLimiter, upstream_queue_seconds
+from model_loader import BackgroundLoader, file_lock
+from model_registry import ModelManager, ModelRegistry, RegistryError, RegistryWatcher, ServingModel
+from inference_server import RemotePredictor
+from model_download import ModelCache, sha256_file
+from runtime_config import configure_threading
+import metrics
 
 # Load environment variables
 load_dotenv()
@@ -18,15 +39,120 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
+# Number of reverse proxies in front of the app (e.g. 1 on Render); their X-Forwarded-For
+# entries are trusted for the client address used by the per-client rate limit
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
 # Agmarknet API Configuration
 AGMARKNET_API_KEY = os.getenv('AGMARKNET_API_KEY', '579b464db66ec23bdd000001cdd3946e44ce4aad7209ff7b23ac571b')
-AGMARKNET_BASE_URL = 'https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070'
+AGMARKNET_BASE_URL = os.getenv('AGMARKNET_BASE_URL', 'https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070')
+
+# Concurrent Agmarknet fetching (one filtered query per commodity, optionally per state)
+AGMARKNET_MAX_CONCURRENCY = int(os.getenv('AGMARKNET_MAX_CONCURRENCY', '8'))
+AGMARKNET_TIMEOUT = float(os.getenv('AGMARKNET_TIMEOUT', '10'))
+AGMARKNET_RETRIES = int(os.getenv('AGMARKNET_RETRIES', '2'))
+AGMARKNET_FETCH_LIMIT = int(os.getenv('AGMARKNET_FETCH_LIMIT', '100'))  # records per query (sample key caps at 10)
+AGMARKNET_STATES = [s.strip() for s in os.getenv('AGMARKNET_STATES', '').split(',') if s.strip()]
+agmarknet_fetcher = AgmarknetFetcher(
+    AGMARKNET_BASE_URL, AGMARKNET_API_KEY,
+    max_concurrency=AGMARKNET_MAX_CONCURRENCY,
+    timeout=AGMARKNET_TIMEOUT,
+    retries=AGMARKNET_RETRIES
+)
+
+# Commodity price cache: served fresh for COMMODITY_CACHE_TTL seconds, then served stale
+# (while one background refresh runs) for up to COMMODITY_CACHE_MAX_STALE seconds
+COMMODITY_CACHE_TTL = int(os.getenv('COMMODITY_CACHE_TTL', '900'))
+COMMODITY_CACHE_MAX_STALE = int(os.getenv('COMMODITY_CACHE_MAX_STALE', '86400'))
+COMMODITY_CACHE_ERROR_TTL = int(os.getenv('COMMODITY_CACHE_ERROR_TTL', '60'))
+
+# Local price history store, kept up to date by an incremental background sync
+PRICE_DB_PATH = os.getenv('PRICE_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'prices.sqlite3'))
+PRICE_SYNC_INTERVAL = int(os.getenv('PRICE_SYNC_INTERVAL', '3600'))  # seconds, 0 disables the background sync
+PRICE_SYNC_BACKFILL_DAYS = int(os.getenv('PRICE_SYNC_BACKFILL_DAYS', '30'))
+PRICE_HISTORY_DAYS = int(os.getenv('PRICE_HISTORY_DAYS', '30'))
 
 # Configure upload settings
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', '16')) * 1024 * 1024  # 16MB max upload size by default
+MAX_UPLOAD_BYTES = app.config['MAX_CONTENT_LENGTH']
+
+# Batch endpoint settings (/predict/batch)
+PREDICT_BATCH_MAX_FILES = int(os.getenv('PREDICT_BATCH_MAX_FILES', '100'))
+# Entries of any kind (directories, non-image files) read from an archive before it is rejected
+PREDICT_BATCH_MAX_MEMBERS = int(os.getenv('PREDICT_BATCH_MAX_MEMBERS', str(PREDICT_BATCH_MAX_FILES * 10)))
+PREPROCESS_WORKERS = int(os.getenv('PREPROCESS_WORKERS', str(min(4, os.cpu_count() or 1))))
+ARCHIVE_CONTENT_TYPES = {
+    'application/zip', 'application/x-zip-compressed',
+    'application/x-tar', 'application/gzip', 'application/x-gzip'
+}
+# Decode JPEGs at reduced scale (close to 128x128) instead of full camera resolution
+PREPROCESS_DRAFT = os.getenv('PREPROCESS_DRAFT', 'true').lower() == 'true'
+
+# Micro-batching settings for /predict (concurrent requests share one forward pass)
+PREDICT_BATCHING = os.getenv('PREDICT_BATCHING', 'true').lower() == 'true'
+PREDICT_BATCH_MAX_SIZE = int(os.getenv('PREDICT_BATCH_MAX_SIZE', '32'))
+PREDICT_BATCH_MAX_WAIT_MS = float(os.getenv('PREDICT_BATCH_MAX_WAIT_MS', '5'))
+
+# Admission control for /predict and /predict/batch (per worker): at most ADMISSION_MAX_IN_FLIGHT
+# predictions run at once, ADMISSION_MAX_QUEUE more wait, the rest get 503 + Retry-After.
+# Requests still waiting PREDICT_DEADLINE_MS after they arrived (counting time queued at the
+# proxy, from X-Request-Start) are dropped instead of being run for a client that has given up.
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'true').lower() == 'true'
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '8'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '32'))
+PREDICT_DEADLINE = float(os.getenv('PREDICT_DEADLINE_MS', '10000')) / 1000
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE) if ADMISSION_CONTROL else None
+
+# Per-client token bucket, one token per image (0 disables): 429 + Retry-After when empty.
+# On by default only with TRUSTED_PROXIES: behind a proxy that is not trusted every client
+# has the proxy's address, and all of them would share a single bucket
+RATE_LIMIT_PER_SECOND = float(os.getenv('RATE_LIMIT_PER_SECOND', '10' if TRUSTED_PROXIES else '0'))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '100'))
+rate_limiter = TokenBucketLimiter(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST) if RATE_LIMIT_PER_SECOND > 0 else None
+
+# Inference backend: 'keras' (compiled tf.function), 'tflite' or 'onnx'
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'keras').lower()
+if INFERENCE_BACKEND not in INFERENCE_BACKENDS:
+    raise ValueError(f"Unknown INFERENCE_BACKEND '{INFERENCE_BACKEND}'. Choose one of: {', '.join(INFERENCE_BACKENDS)}")
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', '0')) or None
+INFERENCE_INTER_OP_THREADS = int(os.getenv('INFERENCE_INTER_OP_THREADS', '0')) or None
+
+# Split the host's cores between worker processes (gunicorn sets no variable for -w, so pass the
+# count here or in WEB_CONCURRENCY); unset falls back to the tuned config, then to one worker
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', os.getenv('WEB_CONCURRENCY', '0'))) or None
+INFERENCE_CPU_AFFINITY = os.getenv('INFERENCE_CPU_AFFINITY', 'false').lower() == 'true'
+# Written by tune_threading.py; ignored if missing
+INFERENCE_TUNED_CONFIG = os.getenv('INFERENCE_TUNED_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'threading.json'))
+
+# Bucketed batch sizes, each compiled/allocated once at startup
+INFERENCE_BUCKETS = parse_buckets(os.getenv('INFERENCE_BUCKETS', '1,8,32'))
+INFERENCE_XLA = os.getenv('INFERENCE_XLA', 'false').lower() == 'true'
+INFERENCE_WARMUP_RUNS = int(os.getenv('INFERENCE_WARMUP_RUNS', '2'))
+
+# Cascade: a distilled student model (distill_model.py, same backend format) answers images
+# whose top-1 confidence reaches CASCADE_THRESHOLD; the rest are escalated to the full model
+CASCADE_MODEL_PATH = os.getenv('CASCADE_MODEL_PATH', '')
+CASCADE_THRESHOLD = float(os.getenv('CASCADE_THRESHOLD', '0.9'))
+
+# Shared inference server: one process per host owns the model, gunicorn workers send it
+# tensors through shared memory instead of each importing TensorFlow and loading a copy
+INFERENCE_SERVER = os.getenv('INFERENCE_SERVER', 'false').lower() == 'true'
+INFERENCE_SERVER_SOCKET = os.getenv('INFERENCE_SERVER_SOCKET', os.path.join(tempfile.gettempdir(), 'agrishield-inference.sock'))
+INFERENCE_SERVER_START_TIMEOUT = float(os.getenv('INFERENCE_SERVER_START_TIMEOUT', '300'))
+
+# Prediction cache (keyed by a hash of the upload bytes and of the decoded tensor)
+PREDICTION_CACHE_ENABLED = os.getenv('PREDICTION_CACHE', 'true').lower() == 'true'
+PREDICTION_CACHE_TENSOR_KEY = os.getenv('PREDICTION_CACHE_TENSOR_KEY', 'true').lower() == 'true'
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv('PREDICTION_CACHE_MAX_ENTRIES', '10000')),
+    max_bytes=int(os.getenv('PREDICTION_CACHE_MAX_MB', '32')) * 1024 * 1024,
+    ttl_seconds=int(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+)
 
 # Create upload folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -35,48 +161,75 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 MODEL_DOWNLOAD_URL = os.getenv('MODEL_DOWNLOAD_URL', '')  # Set this in Render env vars
 # Example: https://drive.google.com/uc?export=download&id=YOUR_FILE_ID
 
+# Downloads are verified against MODEL_SHA256 / MODEL_SIZE when set and kept in a
+# content-addressed cache, so restarts and other workers on the host reuse them
+MODEL_SHA256 = os.getenv('MODEL_SHA256', '').strip().lower() or None
+MODEL_SIZE = int(os.getenv('MODEL_SIZE', '0')) or None
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'models'))
+MODEL_DOWNLOAD_TIMEOUT = float(os.getenv('MODEL_DOWNLOAD_TIMEOUT', '30'))
+MODEL_DOWNLOAD_RETRIES = int(os.getenv('MODEL_DOWNLOAD_RETRIES', '3'))
+
+# Versioned model registry (model_registry.py). Its active version is served in preference to
+# the local model files; activating another version (or rolling back) swaps it in on every
+# worker within MODEL_REGISTRY_POLL_INTERVAL seconds, without a restart. The previous version
+# stays loaded for instant rollback; older ones are dropped MODEL_RETIRE_AFTER seconds after a swap.
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'registry'))
+MODEL_REGISTRY_POLL_INTERVAL = float(os.getenv('MODEL_REGISTRY_POLL_INTERVAL', '5'))  # 0 disables hot-swap
+MODEL_RETIRE_AFTER = float(os.getenv('MODEL_RETIRE_AFTER', '60'))
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR)
+
+# Startup: the model is downloaded and loaded in a background thread. Until it is ready,
+# /predict waits up to MODEL_WAIT_TIMEOUT seconds, then answers 503 with Retry-After.
+MODEL_WAIT_TIMEOUT = float(os.getenv('MODEL_WAIT_TIMEOUT', '5'))
+MODEL_RETRY_AFTER = int(os.getenv('MODEL_RETRY_AFTER', '5'))
+
 def download_model_if_needed():
-    """Download model from cloud storage if not present locally"""
-    model_filename = 'trained_model_tf215.keras'
+    """
+    Fetch the model from MODEL_DOWNLOAD_URL into the local model cache if it is not present.
+    Returns the path of the downloaded (verified) artifact, or None to use the local model files.
+    """
+    model_filename = 'trained_model_tf215' + INFERENCE_BACKENDS[INFERENCE_BACKEND][0]
     model_path = os.path.join(os.path.dirname(__file__), model_filename)
     
-    # Check if model exists locally
+    # Check if model exists locally (and matches the configured checksum)
     if os.path.exists(model_path):
-        print(f"✅ Model file found at {model_path}")
-        return True
+        if not MODEL_SHA256 or sha256_file(model_path) == MODEL_SHA256:
+            print(f"✅ Model file found at {model_path}")
+            return None
+        print(f"⚠️  {model_path} does not match MODEL_SHA256, ignoring it")
     
     # If MODEL_DOWNLOAD_URL is not set, skip download
     if not MODEL_DOWNLOAD_URL:
         print("⚠️  MODEL_DOWNLOAD_URL not set. Skipping model download.")
         print("💡 To enable automatic download, set MODEL_DOWNLOAD_URL in Render environment variables")
         print("   Example: https://drive.google.com/uc?export=download&id=YOUR_FILE_ID")
-        return False
+        return None
     
-    # Download model
-    print(f"📥 Model not found locally. Downloading from cloud storage...")
+    # Download model (a no-op when this host already has it in the cache)
+    print(f"📥 Fetching model into {MODEL_CACHE_DIR}...")
     print(f"   URL: {MODEL_DOWNLOAD_URL}")
     
     try:
-        urllib.request.urlretrieve(MODEL_DOWNLOAD_URL, model_path)
-        
-        # Verify download
-        if os.path.exists(model_path):
-            file_size = os.path.getsize(model_path) / (1024 * 1024)  # Convert to MB
-            print(f"✅ Model downloaded successfully!")
-            print(f"   Size: {file_size:.2f} MB")
-            print(f"   Path: {model_path}")
-            return True
-        else:
-            print(f"❌ Download completed but file not found at {model_path}")
-            return False
+        started = time.perf_counter()
+        cached_path = ModelCache(MODEL_CACHE_DIR).fetch(
+            MODEL_DOWNLOAD_URL,
+            sha256=MODEL_SHA256,
+            size=MODEL_SIZE,
+            suffix=INFERENCE_BACKENDS[INFERENCE_BACKEND][0],
+            timeout=MODEL_DOWNLOAD_TIMEOUT,
+            retries=MODEL_DOWNLOAD_RETRIES
+        )
+        file_size = os.path.getsize(cached_path) / (1024 * 1024)  # Convert to MB
+        print(f"✅ Model ready!")
+        print(f"   Size: {file_size:.2f} MB")
+        print(f"   Path: {cached_path}")
+        print(f"   Time: {time.perf_counter() - started:.1f}s")
+        return cached_path
             
     except Exception as e:
         print(f"❌ Error downloading model: {e}")
         print(f"⚠️  Will use fallback predictions (mock data)")
-        return False
-
-# Download model on startup if needed
-download_model_if_needed()
+        return None
 
 # Load the ML model
 model = None
@@ -92,25 +245,172 @@ MODEL_PATHS = [
     os.path.join(os.path.dirname(__file__), 'trained_model.keras'),
     os.path.join(os.path.dirname(__file__), 'AgriShield.keras'),
 ]
+# .tflite / .onnx artifacts are looked up next to the .keras files (see convert_model_to_tf215.py --export)
+BACKEND_MODEL_PATHS = backend_model_paths(INFERENCE_BACKEND, MODEL_PATHS)
+# Explicit artifact, e.g. a quantized variant: MODEL_PATH=trained_model_tf215_int8.tflite
+if os.getenv('MODEL_PATH'):
+    BACKEND_MODEL_PATHS.insert(0, os.getenv('MODEL_PATH'))
+
+def model_fingerprint(model_path):
+    """Identify a model artifact (used to invalidate cached predictions)"""
+    stat = os.stat(model_path)
+    return f"{INFERENCE_BACKEND}:{os.path.basename(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+inference_server_process = None
+
+def ensure_inference_server(predictor, model_path):
+    """
+    Start this host's inference server with `model_path` unless it is already running.
+    The first worker to get here starts it; the others wait on the lock and find it up.
+    Also called by `predictor` when the server has died, so a crash is repaired on the next request.
+    """
+    global inference_server_process
+    with file_lock(INFERENCE_SERVER_SOCKET + '.lock'):
+        if predictor.wait_until_ready(timeout=0):
+            return
+
+        # Under gunicorn the server lives as long as the master, not this (recyclable) worker
+        owner_pid = os.getppid() if 'gunicorn' in sys.modules else os.getpid()
+        command = [
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inference_server.py'),
+            '--socket', INFERENCE_SERVER_SOCKET,
+            '--model', model_path,
+            '--backend', INFERENCE_BACKEND,
+            '--buckets', ','.join(str(b) for b in INFERENCE_BUCKETS),
+            '--threads', str(INFERENCE_THREADS or 0),
+            '--inter-op-threads', str(INFERENCE_INTER_OP_THREADS or 0),
+            '--warmup-runs', str(INFERENCE_WARMUP_RUNS),
+            '--cascade-model', CASCADE_MODEL_PATH,
+            '--cascade-threshold', str(CASCADE_THRESHOLD),
+            '--max-batch-size', str(PREDICT_BATCH_MAX_SIZE),
+            '--max-wait-ms', str(PREDICT_BATCH_MAX_WAIT_MS),
+            '--owner-pid', str(owner_pid),
+        ]
+        if INFERENCE_XLA:
+            command.append('--xla')
+        print(f"Starting inference server for {model_path}")
+        inference_server_process = subprocess.Popen(command, start_new_session=True)
+
+        if not predictor.wait_until_ready(timeout=INFERENCE_SERVER_START_TIMEOUT):
+            inference_server_process.terminate()
+            raise RuntimeError(f"Inference server did not start within {INFERENCE_SERVER_START_TIMEOUT:.0f}s")
+
+def connect_inference_server(model_path):
+    """Connect to this host's inference server, starting (and later restarting) it as needed"""
+    predictor = RemotePredictor(
+        INFERENCE_SERVER_SOCKET,
+        capacity=max(INFERENCE_BUCKETS),
+        restart=lambda: ensure_inference_server(predictor, model_path)
+    )
+    ensure_inference_server(predictor, model_path)
+    print(f"✓ Connected to inference server at {INFERENCE_SERVER_SOCKET}")
+    return predictor
+
+def load_serving_model(version, model_path):
+    """
+    Load and warm up one model version with the configured backend, with its own micro-batcher.
+    With the inference server, batching happens there instead, so no second queue is added here.
+    Runs in the background loader thread, and in the registry watcher for hot-swaps.
+    """
+    if INFERENCE_SERVER:
+        predictor = connect_inference_server(model_path)
+    else:
+        predictor = load_predictor(
+            INFERENCE_BACKEND, model_path,
+            buckets=INFERENCE_BUCKETS,
+            jit_compile=INFERENCE_XLA,
+            num_threads=threading_config['intra_op']
+        )
+        if CASCADE_MODEL_PATH:
+            student = load_predictor(
+                INFERENCE_BACKEND, CASCADE_MODEL_PATH,
+                buckets=INFERENCE_BUCKETS,
+                jit_compile=INFERENCE_XLA,
+                num_threads=threading_config['intra_op']
+            )
+            predictor = CascadePredictor(student, predictor, CASCADE_THRESHOLD)
+            print(f"✓ Cascade enabled: {CASCADE_MODEL_PATH} first, "
+                  f"escalating below {CASCADE_THRESHOLD:.0%} confidence")
+    # Publish the model only once it is warmed up
+    predictor.warmup(INFERENCE_WARMUP_RUNS)
+
+    batcher = None
+    if PREDICT_BATCHING and not INFERENCE_SERVER:
+        def run_batch(batch):
+            metrics.MICROBATCH_BATCHES.inc()
+            metrics.MICROBATCH_ITEMS.inc(len(batch))
+            return predictor(batch)
+        batcher = MicroBatcher(
+            run_batch,
+            max_batch_size=PREDICT_BATCH_MAX_SIZE,
+            max_wait_ms=PREDICT_BATCH_MAX_WAIT_MS,
+            name=f'predict-batcher-{version}'
+        ).start()
+    return ServingModel(version, predictor, batcher, source=model_path, fingerprint=serving_fingerprint(model_path))
+
+def serving_fingerprint(model_path):
+    """Cache version of what answers predictions: the model, plus the cascade in front of it (in-worker or in the server)"""
+    fingerprint = model_fingerprint(model_path)
+    if CASCADE_MODEL_PATH:
+        fingerprint += f"+{model_fingerprint(CASCADE_MODEL_PATH)}@{CASCADE_THRESHOLD}"
+    return fingerprint
 
-def load_model():
-    """Load the trained model"""
+def publish_model(serving):
+    """Make `serving` the model new requests use (called by the model manager on every swap)"""
     global model
+    prediction_cache.set_model_version(serving.fingerprint)
+    model = serving.predictor
+    metrics.MODEL_LOADED.set(1)
+
+model_manager = ModelManager(load_serving_model, on_swap=publish_model, retire_after=MODEL_RETIRE_AFTER)
+registry_watcher = None
+threading_config = None
+
+def initialize_model():
+    """
+    Download (if needed), load and warm up the model with the configured inference backend.
+    The registry's active version is preferred over the local model files. Runs once, in the
+    background loader thread, then starts watching the registry for new versions.
+    """
+    global model, threading_config, registry_watcher
+    downloaded_path = download_model_if_needed()
     if model is None:
         try:
             model_loaded = False
-            for model_path in MODEL_PATHS:
+            if not INFERENCE_SERVER:
+                # Thread pools must be sized before the runtime starts, so once, ahead of any load
+                threading_config = configure_threading(
+                    INFERENCE_BACKEND,
+                    workers=INFERENCE_WORKERS,
+                    intra_op=INFERENCE_THREADS,
+                    inter_op=INFERENCE_INTER_OP_THREADS,
+                    affinity=INFERENCE_CPU_AFFINITY,
+                    tuned_config_path=INFERENCE_TUNED_CONFIG
+                )
+                print(f"✓ Inference threads: {threading_config['intra_op']} intra-op, "
+                      f"{threading_config['inter_op']} inter-op for {threading_config['workers']} "
+                      f"worker(s) on {threading_config['cpus']} CPUs "
+                      f"(cores {threading_config['cores'] or 'unpinned'}, {threading_config['source']})")
+
+            candidates = []
+            try:
+                active_version = model_registry.active()
+                if active_version:
+                    candidates.append((active_version, model_registry.path_for(active_version, INFERENCE_BACKEND)))
+            except (RegistryError, ValueError) as e:
+                print(f"⚠ Model registry unavailable: {e}")
+            for model_path in ([downloaded_path] if downloaded_path else []) + BACKEND_MODEL_PATHS:
+                candidates.append((os.path.basename(model_path), model_path))
+
+            for version, model_path in candidates:
                 if os.path.exists(model_path):
-                    print(f"Loading model from {model_path}")
+                    print(f"Loading {INFERENCE_BACKEND} model {version} from {model_path}")
+                    load_started = time.perf_counter()
                     try:
-                        model = tf.keras.models.load_model(model_path, compile=False)
-                        # Recompile for TF 2.15
-                        model.compile(
-                            optimizer='adam',
-                            loss='sparse_categorical_crossentropy',
-                            metrics=['accuracy']
-                        )
-                        print(f"✓ Successfully loaded model from {model_path}")
+                        model_manager.activate(version, model_path)
+                        metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - load_started)
+                        print(f"✓ Successfully loaded model from {model_path} "
+                              f"(backend {INFERENCE_BACKEND}, buckets {list(INFERENCE_BUCKETS)})")
                         model_loaded = True
                         break
                     except Exception as e:
@@ -119,15 +419,81 @@ def load_model():
             
             if not model_loaded:
                 print("⚠ Warning: Model file not found in any of the expected locations.")
-                print(f"Searched paths: {MODEL_PATHS}")
+                print(f"Searched paths: {BACKEND_MODEL_PATHS}")
                 print("Using fallback predictions (random results for testing).")
                 print("Run convert_model_to_tf215.py to create a new model.")
                 model = None
         except Exception as e:
             print(f"Error loading model: {e}")
             model = None
+
+    if MODEL_REGISTRY_POLL_INTERVAL > 0 and registry_watcher is None:
+        if INFERENCE_SERVER:
+            print("⚠ Model hot-swap is not available with INFERENCE_SERVER=true; restart to change versions")
+        else:
+            registry_watcher = RegistryWatcher(model_registry, model_manager, INFERENCE_BACKEND,
+                                               interval=MODEL_REGISTRY_POLL_INTERVAL)
+            registry_watcher.start()
+    return model
+
+model_loader = BackgroundLoader(initialize_model, name='model-loader')
+
+def load_model(timeout=None):
+    """
+    Return the predictor: a callable mapping a (N, 128, 128, 3) float32 batch to (N, classes) outputs.
+    Waits up to `timeout` seconds (None: until done) for the background load; returns None while
+    the model is still loading or when no model could be loaded.
+    """
+    model_loader.wait(timeout)
     return model
 
+def rejection_response(rejected):
+    """429/503 response with Retry-After for a request turned away by admission control"""
+    metrics.ADMISSION_REJECTIONS.labels(rejected.reason).inc()
+    response = jsonify({'error': str(rejected), 'reason': rejected.reason})
+    response.status_code = rejected.status
+    response.headers['Retry-After'] = rejected.retry_after_header
+    return response
+
+def rate_limited(images=1):
+    """429 response if this client has used up its rate limit, else None"""
+    if rate_limiter is None:
+        return None
+    wait = rate_limiter.acquire(request.remote_addr or 'unknown', images)
+    if wait:
+        return rejection_response(Rejected('rate_limited', 429, wait))
+    return None
+
+@contextmanager
+def prediction_slot():
+    """Hold an admission slot while the prediction runs; raises Rejected if none frees up in time"""
+    if admission is None:
+        yield
+        return
+    waited = time.perf_counter() - g.request_started + upstream_queue_seconds(request.headers.get('X-Request-Start'))
+    with admission.admit(deadline=time.monotonic() + PREDICT_DEADLINE - waited) as queued:
+        metrics.ADMISSION_QUEUE_SECONDS.observe(queued)
+        yield
+
+def model_warming_up():
+    """503 response with Retry-After if the model is still loading after MODEL_WAIT_TIMEOUT, else None"""
+    if model_loader.wait(MODEL_WAIT_TIMEOUT):
+        return None
+    response = jsonify({'error': 'Model is still loading, please retry shortly', 'model': model_loader.state})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(MODEL_RETRY_AFTER)
+    return response
+
+if PREDICT_BATCHING:
+    print(f"✓ Micro-batching enabled (max batch {PREDICT_BATCH_MAX_SIZE}, "
+          f"max wait {PREDICT_BATCH_MAX_WAIT_MS} ms)")
+
+def run_inference(processed_image, serving):
+    """Run a model version on a single preprocessed (1, 128, 128, 3) image and return its output row"""
+    if serving.batcher is not None:
+        return serving.batcher.predict(processed_image)
+    return serving.predictor(processed_image)[0]
+
 # Disease class names (from main.py)
 CLASS_NAMES = [
     'Apple___Apple_scab',
@@ -158,28 +524,49 @@ CLASS_NAMES = [
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def preprocess_image(image_file):
-    """Preprocess image for model prediction"""
+# Reusable per-thread input buffer for single-image requests
+preprocess_buffers = PreprocessBuffers(IMAGE_SIZE)
+
+# Per-stage latency histograms, resolved once so the hot path only observes
+PREDICT_STAGES = {stage: metrics.STAGE_SECONDS.labels('predict', stage) for stage in
+                  ('parse', 'read', 'cache', 'decode', 'resize', 'normalize', 'inference', 'serialize')}
+BATCH_STAGES = {stage: metrics.STAGE_SECONDS.labels('predict_batch', stage) for stage in
+                ('parse', 'preprocess', 'inference', 'serialize')}
+
+def preprocess_image(image_bytes, timings=None):
+    """
+    Preprocess image for model prediction.
+    Returns this thread's reusable (1, 128, 128, 3) float32 buffer, valid until the next call.
+    """
     try:
-        # Read image from file
-        image = Image.open(io.BytesIO(image_file.read()))
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Resize to 128x128
-        image = image.resize((128, 128))
-        
-        # Convert to array and normalize
-        img_array = np.array(image)
-        img_array = img_array / 255.0
-        img_array = np.expand_dims(img_array, axis=0)
-        
-        return img_array
+        decode_image_into(image_bytes, preprocess_buffers.image[0], IMAGE_SIZE, PREPROCESS_DRAFT, timings)
+        return preprocess_buffers.image
     except Exception as e:
         raise Exception(f"Error preprocessing image: {str(e)}")
 
+# Shared worker pool for decoding uploads (PIL releases the GIL while decoding)
+preprocess_pool = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix='preprocess')
+
+def fallback_prediction():
+    """Random prediction used when no model is available (testing only)"""
+    metrics.FALLBACKS.labels('prediction').inc()
+    disease_index = random.randint(0, len(CLASS_NAMES) - 1)
+    confidence = random.uniform(0.7, 0.95)
+    return {
+        'disease': CLASS_NAMES[disease_index],
+        'confidence': confidence,
+        'class_index': disease_index
+    }
+
+def format_prediction(row):
+    """Turn one row of model output into the /predict response fields"""
+    disease_index = int(np.argmax(row))
+    return {
+        'disease': CLASS_NAMES[disease_index],
+        'confidence': float(row[disease_index]),
+        'class_index': disease_index
+    }
+
 def predict_disease(image_file):
     """Predict disease from image"""
     try:
@@ -187,120 +574,278 @@ def predict_disease(image_file):
         
         if model is None:
             # Fallback: return random prediction for testing
-            import random
-            disease_index = random.randint(0, len(CLASS_NAMES) - 1)
-            confidence = random.uniform(0.7, 0.95)
-            return {
-                'disease': CLASS_NAMES[disease_index],
-                'confidence': confidence,
-                'class_index': disease_index
-            }
+            return fallback_prediction()
+        # Requests keep the version they started with, even if a new one is swapped in meanwhile
+        serving = model_manager.current
         
+        started = time.perf_counter()
+        image_bytes = image_file.read()
+        now = time.perf_counter()
+        PREDICT_STAGES['read'].observe(now - started)
+
+        # A re-upload of the same bytes skips decode, resize and inference
+        raw_key = content_key(image_bytes) if PREDICTION_CACHE_ENABLED else None
+        cache_seconds = 0.0
+        if raw_key:
+            # One request is one lookup in the stats: a miss here is counted by the tensor key lookup
+            cached = prediction_cache.get(raw_key, count_miss=not PREDICTION_CACHE_TENSOR_KEY)
+            cache_seconds = time.perf_counter() - now
+            if cached is not None:
+                PREDICT_STAGES['cache'].observe(cache_seconds)
+                return cached
+
         # Preprocess image
-        processed_image = preprocess_image(image_file)
-        
-        # Make prediction
-        predictions = model.predict(processed_image, verbose=0)
-        disease_index = np.argmax(predictions[0])
-        confidence = float(predictions[0][disease_index])
-        
-        return {
-            'disease': CLASS_NAMES[disease_index],
-            'confidence': confidence,
-            'class_index': int(disease_index)
-        }
+        timings = {}
+        processed_image = preprocess_image(image_bytes, timings)
+        for stage, seconds in timings.items():
+            PREDICT_STAGES[stage].observe(seconds)
+
+        # Re-encoded copies of the same photo decode to the same tensor
+        now = time.perf_counter()
+        tensor_key = content_key(processed_image, 'tensor') if raw_key and PREDICTION_CACHE_TENSOR_KEY else None
+        if tensor_key:
+            cached = prediction_cache.get(tensor_key)
+            if cached is not None:
+                prediction_cache.put(raw_key, cached, version=serving.fingerprint)
+                PREDICT_STAGES['cache'].observe(cache_seconds + time.perf_counter() - now)
+                return cached
+        if raw_key:
+            PREDICT_STAGES['cache'].observe(cache_seconds + time.perf_counter() - now)
+
+        # Make prediction (coalesced with concurrent requests when batching is enabled)
+        now = time.perf_counter()
+        predictions = run_inference(processed_image, serving)
+        PREDICT_STAGES['inference'].observe(time.perf_counter() - now)
+        result = format_prediction(predictions)
+        result['model_version'] = serving.version
+
+        # The cache only holds results of the serving version (checked by the cache, under its lock)
+        for key in (raw_key, tensor_key):
+            if key:
+                prediction_cache.put(key, result, version=serving.fingerprint)
+        return result
     except Exception as e:
         raise Exception(f"Error predicting disease: {str(e)}")
 
+def predict_disease_batch(uploads):
+    """
+    Predict diseases for many uploads with a single forward pass.
+    `uploads` is a list of (filename, bytes); returns per-file results in input order,
+    with an 'error' entry for files that could not be processed.
+    """
+    results = [{'filename': filename} for filename, _ in uploads]
+    model = load_model()
+    serving = model_manager.current
+    started = time.perf_counter()
+
+    # Preallocated input tensor, each upload decodes straight into its own row
+    batch = np.empty((len(uploads),) + IMAGE_SIZE + (3,), dtype=np.float32)
+
+    use_cache = PREDICTION_CACHE_ENABLED and model is not None
+    keys = [[] for _ in uploads]
+
+    futures = {}
+    for i, (filename, image_bytes) in enumerate(uploads):
+        if not allowed_file(filename):
+            results[i]['error'] = 'Invalid file type. Please upload an image.'
+            continue
+        if use_cache:
+            keys[i].append(content_key(image_bytes))
+            cached = prediction_cache.get(keys[i][0], count_miss=not PREDICTION_CACHE_TENSOR_KEY)
+            if cached is not None:
+                results[i].update(cached)
+                continue
+        futures[i] = preprocess_pool.submit(decode_image_into, image_bytes, batch[i], IMAGE_SIZE, PREPROCESS_DRAFT)
+
+    ok = []
+    for i, future in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            results[i]['error'] = f"Error preprocessing image: {str(e)}"
+            continue
+        if use_cache and PREDICTION_CACHE_TENSOR_KEY:
+            keys[i].append(content_key(batch[i], 'tensor'))
+            cached = prediction_cache.get(keys[i][1])
+            if cached is not None:
+                prediction_cache.put(keys[i][0], cached, version=serving.fingerprint)
+                results[i].update(cached)
+                continue
+        ok.append(i)
+
+    if not ok:
+        return results
+
+    if model is None:
+        for i in ok:
+            results[i].update(fallback_prediction())
+        return results
+
+    # Only copy when some rows were skipped (cache hits or decode failures)
+    inputs = batch if len(ok) == len(uploads) else batch[ok]
+    now = time.perf_counter()
+    BATCH_STAGES['preprocess'].observe(now - started)
+    try:
+        predictions = serving.predictor(inputs)
+    except Exception as e:
+        for i in ok:
+            results[i]['error'] = f"Error predicting disease: {str(e)}"
+        return results
+    BATCH_STAGES['inference'].observe(time.perf_counter() - now)
+
+    for i, row in zip(ok, predictions):
+        result = format_prediction(row)
+        result['model_version'] = serving.version
+        for key in keys[i]:
+            prediction_cache.put(key, result, version=serving.fingerprint)
+        results[i].update(result)
+    return results
+
+class ArchiveTooLarge(Exception):
+    """An archive upload with too many entries or more uncompressed data than an upload may have (413)"""
+
+def _read_member(handle, remaining):
+    """Read one archive member, never more than `remaining` bytes (it may inflate past its declared size)"""
+    data = handle.read(remaining + 1)
+    if len(data) > remaining:
+        raise ArchiveTooLarge(f'Archive contents too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB uncompressed)')
+    return data
+
+def read_archive_uploads(stream):
+    """
+    Read image members from a zip or (optionally compressed) tar upload.
+    Non-image members are skipped without being decompressed. Raises ArchiveTooLarge as soon as
+    there are more than PREDICT_BATCH_MAX_FILES images (or PREDICT_BATCH_MAX_MEMBERS entries) or
+    the images add up to more than MAX_CONTENT_LENGTH bytes, checked on the declared sizes
+    before anything is decompressed and again while reading.
+    """
+    data = stream.read()
+    uploads = []
+    remaining = MAX_UPLOAD_BYTES
+
+    def admit(name, declared_size, entries):
+        if entries > PREDICT_BATCH_MAX_MEMBERS:
+            raise ArchiveTooLarge(f'Too many archive entries (max {PREDICT_BATCH_MAX_MEMBERS})')
+        if not allowed_file(name):
+            return False
+        if len(uploads) >= PREDICT_BATCH_MAX_FILES:
+            raise ArchiveTooLarge(f'Too many files (max {PREDICT_BATCH_MAX_FILES})')
+        if declared_size > remaining:
+            raise ArchiveTooLarge(f'Archive contents too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB uncompressed)')
+        return True
+
+    if zipfile.is_zipfile(io.BytesIO(data)):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for entries, info in enumerate(archive.infolist(), 1):
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not admit(name, info.file_size, entries):
+                    continue
+                with archive.open(info) as member:
+                    uploads.append((name, _read_member(member, remaining)))
+                remaining -= len(uploads[-1][1])
+    else:
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as archive:
+            for entries, member in enumerate(archive, 1):
+                name = os.path.basename(member.name)
+                if not member.isfile() or not admit(name, member.size, entries):
+                    continue
+                uploads.append((name, _read_member(archive.extractfile(member), remaining)))
+                remaining -= len(uploads[-1][1])
+    return uploads
+
+def collect_batch_uploads():
+    """Collect (filename, bytes) pairs from a multipart upload or an archive"""
+    if 'archive' in request.files:
+        return read_archive_uploads(request.files['archive'].stream)
+    if request.mimetype in ARCHIVE_CONTENT_TYPES:
+        return read_archive_uploads(request.stream)
+
+    files = request.files.getlist('images') or request.files.getlist('image')
+    return [(f.filename, f.read()) for f in files if f.filename != '']
+
+try:
+    price_store = PriceStore(PRICE_DB_PATH)
+except Exception as e:
+    print(f"⚠ Price store unavailable at {PRICE_DB_PATH}: {e}")
+    price_store = None
+
+# Every worker runs the sync thread, but only the one holding the lock next to the database
+# calls Agmarknet and writes to it. Started by start_background_work(), like the model loader.
+price_sync = None
+if price_store is not None and PRICE_SYNC_INTERVAL > 0:
+    price_sync = PriceSyncThread(price_store, AGMARKNET_BASE_URL, AGMARKNET_API_KEY,
+                                 interval=PRICE_SYNC_INTERVAL, backfill_days=PRICE_SYNC_BACKFILL_DAYS,
+                                 lock_path=PRICE_DB_PATH + '.sync.lock')
+
+def start_background_work():
+    """Start this process's model loader and price sync thread (each only once)"""
+    model_loader.start()
+    if price_sync is not None:
+        price_sync.start()
+
+# Start downloading/loading and syncing right away; the server answers /health in the meantime.
+# Under gunicorn every worker starts them after the fork instead (gunicorn.conf.py, or its first
+# request): with --preload this module is imported in the master, whose threads would not exist
+# in the workers, and TensorFlow must not be initialized before a fork.
+if 'gunicorn' not in sys.modules:
+    start_background_work()
+
+def load_commodity_prices():
+    """Commodity payload from the local price store, or straight from Agmarknet until it has data"""
+    if price_store is not None:
+        try:
+            stored = price_store.summary(PRICE_HISTORY_DAYS)
+            if stored:
+                return stored
+        except Exception as e:
+            print(f"⚠ Price store query failed: {e}")
+    return fetch_agmarknet_data()
+
 # Mock data for commodity prices
+def format_commodity_records(records_by_commodity):
+    """Format {commodity_key: [Agmarknet records]} into the /api/commodity-prices structure"""
+    formatted_data = []
+    for commodity, records in records_by_commodity.items():
+        # Daily average modal price across markets
+        by_date = {}
+        for record in records:
+            arrival_date = parse_arrival_date(record.get('arrival_date'))
+            try:
+                modal_price = float(record.get('modal_price'))
+            except (TypeError, ValueError):
+                continue
+            if arrival_date:
+                by_date.setdefault(arrival_date, []).append(modal_price)
+        if not by_date:
+            continue
+
+        history = [
+            {'date': date, 'price': round(sum(prices) / len(prices), 2)}
+            for date, prices in sorted(by_date.items())
+        ]
+        first, last = history[0]['price'], history[-1]['price']
+        
+        formatted_data.append({
+            'name': commodity,
+            'currentPrice': round(last, 2),
+            'change': round((last - first) / first * 100, 2) if first else 0,
+            'history': history
+        })
+    return formatted_data
+
 def fetch_agmarknet_data():
-    """Fetch live commodity prices from Agmarknet API"""
+    """Fetch live commodity prices from Agmarknet API (one filtered query per commodity, in parallel)"""
     try:
-        # Commodity mapping to Agmarknet commodity names
-        commodities_map = {
-            'Wheat': 'wheat',
-            'Rice': 'rice',
-            'Cotton': 'cotton',
-            'Sugarcane': 'sugarcane',
-            'Soyabean': 'soybean',
-            'Maize': 'maize',
-            'Gram': 'gram',
-            'Tur': 'tur'
-        }
-        
-        params = {
-            'api-key': AGMARKNET_API_KEY,
-            'format': 'json',
-            'limit': 10  # Sample key returns max 10 records
-        }
-        
-        response = requests.get(AGMARKNET_BASE_URL, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Process the API response
-            commodity_data = {}
-            
-            if 'records' in data:
-                for record in data['records']:
-                    commodity_name = record.get('commodity', '').strip()
-                    
-                    # Check if commodity is in our map
-                    normalized_name = None
-                    for key, value in commodities_map.items():
-                        if key.lower() in commodity_name.lower():
-                            normalized_name = value
-                            break
-                    
-                    if normalized_name:
-                        modal_price = float(record.get('modal_price', 0))
-                        
-                        if normalized_name not in commodity_data:
-                            commodity_data[normalized_name] = {
-                                'prices': [modal_price],
-                                'dates': [record.get('arrival_date', datetime.now().strftime('%Y-%m-%d'))],
-                                'min_price': float(record.get('min_price', modal_price)),
-                                'max_price': float(record.get('max_price', modal_price))
-                            }
-                        else:
-                            commodity_data[normalized_name]['prices'].append(modal_price)
-                            commodity_data[normalized_name]['dates'].append(
-                                record.get('arrival_date', datetime.now().strftime('%Y-%m-%d'))
-                            )
-            
-            # Format data for frontend
-            formatted_data = []
-            for commodity, info in commodity_data.items():
-                avg_price = sum(info['prices']) / len(info['prices'])
-                
-                # Calculate price change (using first vs last price if multiple available)
-                if len(info['prices']) > 1:
-                    price_change = ((info['prices'][-1] - info['prices'][0]) / info['prices'][0]) * 100
-                else:
-                    price_change = 0
-                
-                # Generate 30-day history (mix real data with interpolation)
-                history = []
-                for i in range(30):
-                    date = (datetime.now() - timedelta(days=30-i)).strftime('%Y-%m-%d')
-                    price = avg_price * (1 + random.uniform(-0.05, 0.05))
-                    history.append({
-                        'date': date,
-                        'price': round(price, 2)
-                    })
-                
-                formatted_data.append({
-                    'name': commodity,
-                    'currentPrice': round(avg_price, 2),
-                    'change': round(price_change, 2),
-                    'history': history
-                })
-            
-            return formatted_data if formatted_data else None
-        else:
-            print(f"Agmarknet API error: Status {response.status_code}")
-            return None
+        records, errors = agmarknet_fetcher.fetch_all(states=AGMARKNET_STATES, limit=AGMARKNET_FETCH_LIMIT)
+        for query, error in errors.items():
+            print(f"Agmarknet query {query} failed: {error}")
+
+        # Keep what we fetched for the price history
+        if price_store is not None:
+            price_store.upsert_records([r for commodity_records in records.values() for r in commodity_records])
+
+        formatted_data = format_commodity_records(records)
+        return formatted_data if formatted_data else None
             
     except Exception as e:
         print(f"Error fetching from Agmarknet: {e}")
@@ -337,28 +882,106 @@ def generate_mock_price_data():
     
     return data
 
+commodity_cache = StaleWhileRevalidateCache(
+    lambda: load_commodity_prices(),
+    ttl_seconds=COMMODITY_CACHE_TTL,
+    max_stale_seconds=COMMODITY_CACHE_MAX_STALE,
+    error_ttl_seconds=COMMODITY_CACHE_ERROR_TTL,
+    name='commodity-prices'
+)
+
+# Values owned by other components are read when /metrics is scraped
+metrics.PREDICTION_CACHE_EVENTS.labels('hit').set_function(lambda: prediction_cache.hits)
+metrics.PREDICTION_CACHE_EVENTS.labels('miss').set_function(lambda: prediction_cache.misses)
+metrics.PREDICTION_CACHE_EVENTS.labels('eviction').set_function(lambda: prediction_cache.evictions)
+metrics.CASCADE_IMAGES.labels('student').set_function(
+    lambda: model.images - model.escalated if isinstance(model, CascadePredictor) else 0)
+metrics.CASCADE_IMAGES.labels('full').set_function(
+    lambda: model.escalated if isinstance(model, CascadePredictor) else 0)
+metrics.ADMISSION_QUEUED.set_function(lambda: admission.queued if admission else 0)
+metrics.ADMISSION_IN_FLIGHT.set_function(lambda: admission.in_flight if admission else 0)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.IN_FLIGHT.inc()
+    start_background_work()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - g.request_started)
+    metrics.REQUESTS.labels(route, request.method, response.status_code).inc()
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    if 'request_started' in g:
+        metrics.IN_FLIGHT.dec()
+
 @app.route('/api/commodity-prices', methods=['GET'])
 def get_commodity_prices():
     try:
-        # Try to fetch live data from Agmarknet first
-        live_data = fetch_agmarknet_data()
+        # Serve live Agmarknet data from the cache (refreshed in the background when stale)
+        live_data, cache_info = commodity_cache.get()
         
         if live_data and len(live_data) > 0:
-            print(f"✓ Returning {len(live_data)} commodities from Agmarknet API")
-            return jsonify(live_data)
+            response = jsonify(live_data)
+            age = cache_info['age'] or 0
+            response.headers['Cache-Control'] = (
+                f"public, max-age={max(0, COMMODITY_CACHE_TTL - age)}, "
+                f"stale-while-revalidate={COMMODITY_CACHE_MAX_STALE}"
+            )
+            response.headers['Age'] = str(age)
+            response.headers['X-Cache'] = cache_info['state']
+            response.headers['X-Data-Source'] = 'agmarknet'
+            response.headers['Last-Modified'] = formatdate(cache_info['loaded_at'], usegmt=True)
+            return response
         else:
             # Fallback to mock data
             print("⚠ Using fallback mock data")
+            metrics.FALLBACKS.labels('commodity_prices').inc()
             data = generate_mock_price_data()
-            return jsonify(data)
+            response = jsonify(data)
+            response.headers['Cache-Control'] = 'no-store'
+            response.headers['X-Data-Source'] = 'mock'
+            return response
     except Exception as e:
         print(f"Error in commodity prices endpoint: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/commodity-prices/<commodity>/history', methods=['GET'])
+def get_commodity_history(commodity):
+    """Daily price history for one commodity from the local store (?start=YYYY-MM-DD&end=YYYY-MM-DD)"""
+    if price_store is None:
+        return jsonify({'error': 'Price history store is not available'}), 503
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        for value in (start, end):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+    history = price_store.history(commodity.lower(), start, end)
+    return jsonify({
+        'name': commodity.lower(),
+        'history': history,
+        'watermark': price_store.watermark
+    })
+
 @app.route('/predict', methods=['POST'])
 def predict():
     """Predict disease from uploaded image"""
     try:
+        started = time.perf_counter()
+        warming_up = model_warming_up()
+        if warming_up is not None:
+            return warming_up
+        limited = rate_limited()
+        if limited is not None:
+            return limited
         if 'image' not in request.files:
             return jsonify({'error': 'No image file provided'}), 400
         
@@ -372,27 +995,98 @@ def predict():
         
         # Reset file pointer
         file.seek(0)
+        PREDICT_STAGES['parse'].observe(time.perf_counter() - started)
         
         # Predict disease
-        result = predict_disease(file)
+        with prediction_slot():
+            result = predict_disease(file)
         
-        return jsonify(result)
+        with PREDICT_STAGES['serialize'].time():
+            return jsonify(result)
     
+    except Rejected as rejected:
+        return rejection_response(rejected)
     except Exception as e:
         print(f"Prediction error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Predict diseases for many uploaded images (multipart 'images' files or a zip/tar archive)"""
+    try:
+        warming_up = model_warming_up()
+        if warming_up is not None:
+            return warming_up
+        try:
+            with BATCH_STAGES['parse'].time():
+                uploads = collect_batch_uploads()
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            return jsonify({'error': f'Invalid archive: {str(e)}'}), 400
+        except ArchiveTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+
+        if not uploads:
+            return jsonify({'error': 'No image files provided'}), 400
+
+        if len(uploads) > PREDICT_BATCH_MAX_FILES:
+            return jsonify({'error': f'Too many files (max {PREDICT_BATCH_MAX_FILES})'}), 413
+
+        limited = rate_limited(len(uploads))
+        if limited is not None:
+            return limited
+
+        with prediction_slot():
+            results = predict_disease_batch(uploads)
+        failed = sum(1 for r in results if 'error' in r)
+
+        with BATCH_STAGES['serialize'].time():
+            return jsonify({
+                'results': results,
+                'count': len(results),
+                'succeeded': len(results) - failed,
+                'failed': failed
+            })
+
+    except Rejected as rejected:
+        return rejection_response(rejected)
+    except Exception as e:
+        print(f"Batch prediction error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
-    model_status = "loaded" if load_model() is not None else "not loaded"
+    """Liveness check: answers immediately, even while the model is still loading"""
+    if not model_loader.done:
+        model_status = "loading"
+    else:
+        model_status = "loaded" if model is not None else "not loaded"
     return jsonify({
         'status': 'healthy',
-        'model': model_status
+        'model': model_status,
+        'prediction_cache': prediction_cache.stats() if PREDICTION_CACHE_ENABLED else None,
+        'admission': admission.stats() if admission else None,
+        'cascade': model.stats() if isinstance(model, CascadePredictor) else None,
+        'model_versions': model_manager.stats()
     })
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness check: 503 with Retry-After until the model download and load have finished"""
+    status = model_loader.status()
+    status['model'] = "loaded" if model is not None else "not loaded"
+    if not model_loader.done:
+        response = jsonify(dict(status, ready=False))
+        response.status_code = 503
+        response.headers['Retry-After'] = str(MODEL_RETRY_AFTER)
+        return response
+    return jsonify(dict(status, ready=True))
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for this process"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
-    print("Loading ML model...")
-    load_model()
-    print("Starting Flask server on http://localhost:5000")
-    app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False) 
\ No newline at end of file
+    port = int(os.getenv('PORT', '5000'))
+    print(f"Starting Flask server on http://localhost:{port}")
+    app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False) 
\ No newline at end of file
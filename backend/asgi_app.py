@@ -0,0 +1,433 @@
+"""
+ASGI variant of the backend (Starlette), same URLs and JSON responses as app.py
+Uploads and Agmarknet calls are awaited on the event loop; decode and inference run on a bounded thread pool
+
+Usage:
+    pip install starlette uvicorn python-multipart httpx
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+Model loading, caches, the price store and all prediction logic are shared with app.py,
+which is imported as a module.
+"""
+
+import asyncio
+import io
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from email.utils import formatdate
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import app as core
+import metrics
+from admission import Rejected, upstream_queue_seconds
+from agmarknet_fetcher import AsyncAgmarknetFetcher
+from inference import CascadePredictor
+from price_cache import AsyncStaleWhileRevalidateCache
+
+# CPU-bound work (archive extraction, decode, inference) is bounded by this pool; any number
+# of requests can be waiting on slow uploads or Agmarknet without holding one of its threads
+ASGI_CPU_WORKERS = int(os.getenv('ASGI_CPU_WORKERS', str(min(4, os.cpu_count() or 1))))
+cpu_pool = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix='asgi-cpu')
+
+# Requests waiting for an admission slot block one of these threads, never the event loop
+admission_pool = ThreadPoolExecutor(max_workers=core.ADMISSION_MAX_QUEUE + 1, thread_name_prefix='asgi-admission')
+
+MAX_UPLOAD_BYTES = core.MAX_UPLOAD_BYTES
+
+agmarknet_fetcher = AsyncAgmarknetFetcher(
+    core.AGMARKNET_BASE_URL, core.AGMARKNET_API_KEY,
+    max_concurrency=core.AGMARKNET_MAX_CONCURRENCY,
+    timeout=core.AGMARKNET_TIMEOUT,
+    retries=core.AGMARKNET_RETRIES
+)
+
+
+async def run_cpu(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool, fn, *args)
+
+
+def error_response(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+
+async def fetch_agmarknet_data():
+    """Async counterpart of app.fetch_agmarknet_data()"""
+    try:
+        records, errors = await agmarknet_fetcher.fetch_all(states=core.AGMARKNET_STATES, limit=core.AGMARKNET_FETCH_LIMIT)
+        for query, error in errors.items():
+            print(f"Agmarknet query {query} failed: {error}")
+
+        if core.price_store is not None:
+            await run_in_threadpool(
+                core.price_store.upsert_records,
+                [r for commodity_records in records.values() for r in commodity_records])
+
+        formatted_data = core.format_commodity_records(records)
+        return formatted_data if formatted_data else None
+    except Exception as e:
+        print(f"Error fetching from Agmarknet: {e}")
+        return None
+
+
+async def load_commodity_prices():
+    """Payload from the local price store, or live from Agmarknet until it has data"""
+    if core.price_store is not None:
+        try:
+            stored = await run_in_threadpool(core.price_store.summary, core.PRICE_HISTORY_DAYS)
+            if stored:
+                return stored
+        except Exception as e:
+            print(f"⚠ Price store query failed: {e}")
+    return await fetch_agmarknet_data()
+
+
+commodity_cache = AsyncStaleWhileRevalidateCache(
+    load_commodity_prices,
+    ttl_seconds=core.COMMODITY_CACHE_TTL,
+    max_stale_seconds=core.COMMODITY_CACHE_MAX_STALE,
+    error_ttl_seconds=core.COMMODITY_CACHE_ERROR_TTL,
+    name='commodity-prices'
+)
+
+
+async def model_warming_up():
+    """Same contract as app.model_warming_up(), without blocking the event loop"""
+    if core.model_loader.done:
+        return None
+    if await run_in_threadpool(core.model_loader.wait, core.MODEL_WAIT_TIMEOUT):
+        return None
+    return JSONResponse(
+        {'error': 'Model is still loading, please retry shortly', 'model': core.model_loader.state},
+        status_code=503,
+        headers={'Retry-After': str(core.MODEL_RETRY_AFTER)}
+    )
+
+
+def rejection_response(rejected):
+    metrics.ADMISSION_REJECTIONS.labels(rejected.reason).inc()
+    return JSONResponse({'error': str(rejected), 'reason': rejected.reason},
+                        status_code=rejected.status, headers={'Retry-After': rejected.retry_after_header})
+
+
+def client_address(request):
+    """The client's address, trusting the last TRUSTED_PROXIES X-Forwarded-For entries like ProxyFix in app.py"""
+    if core.TRUSTED_PROXIES:
+        forwarded = [value.strip() for value in request.headers.get('x-forwarded-for', '').split(',')]
+        if len(forwarded) >= core.TRUSTED_PROXIES and forwarded[-core.TRUSTED_PROXIES]:
+            return forwarded[-core.TRUSTED_PROXIES]
+    return request.client.host if request.client else 'unknown'
+
+
+def rate_limited(request, images=1):
+    """Same contract as app.rate_limited()"""
+    if core.rate_limiter is None:
+        return None
+    wait = core.rate_limiter.acquire(client_address(request), images)
+    if wait:
+        return rejection_response(Rejected('rate_limited', 429, wait))
+    return None
+
+
+@asynccontextmanager
+async def prediction_slot(request, started):
+    """Async counterpart of app.prediction_slot(); `started` is when the handler began (perf_counter)"""
+    if core.admission is None:
+        yield
+        return
+    waited = time.perf_counter() - started + upstream_queue_seconds(request.headers.get('x-request-start'))
+    deadline = time.monotonic() + core.PREDICT_DEADLINE - waited
+    future = asyncio.get_running_loop().run_in_executor(admission_pool, core.admission.acquire, deadline)
+    try:
+        queued = await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # Client went away while queued: give the slot back if it is granted after all
+        future.add_done_callback(lambda f: f.cancelled() or f.exception() or core.admission.release())
+        raise
+    metrics.ADMISSION_QUEUE_SECONDS.observe(queued)
+    slot_started = time.monotonic()
+    try:
+        yield
+    finally:
+        core.admission.release(time.monotonic() - slot_started)
+
+
+class UploadTooLarge(Exception):
+    """The request body grew past MAX_UPLOAD_BYTES while it was being received"""
+    pass
+
+
+def upload_too_large(request):
+    # Fast path only: chunked or mislabelled bodies are caught by UploadLimitMiddleware
+    length = request.headers.get('content-length')
+    return length is not None and length.isdigit() and int(length) > MAX_UPLOAD_BYTES
+
+
+async def get_commodity_prices(request):
+    try:
+        live_data, cache_info = await commodity_cache.get()
+
+        if live_data and len(live_data) > 0:
+            age = cache_info['age'] or 0
+            return JSONResponse(live_data, headers={
+                'Cache-Control': (
+                    f"public, max-age={max(0, core.COMMODITY_CACHE_TTL - age)}, "
+                    f"stale-while-revalidate={core.COMMODITY_CACHE_MAX_STALE}"
+                ),
+                'Age': str(age),
+                'X-Cache': cache_info['state'],
+                'X-Data-Source': 'agmarknet',
+                'Last-Modified': formatdate(cache_info['loaded_at'], usegmt=True),
+            })
+
+        print("⚠ Using fallback mock data")
+        metrics.FALLBACKS.labels('commodity_prices').inc()
+        return JSONResponse(core.generate_mock_price_data(),
+                            headers={'Cache-Control': 'no-store', 'X-Data-Source': 'mock'})
+    except Exception as e:
+        print(f"Error in commodity prices endpoint: {e}")
+        return error_response(str(e), 500)
+
+
+async def get_commodity_history(request):
+    if core.price_store is None:
+        return error_response('Price history store is not available', 503)
+    commodity = request.path_params['commodity'].lower()
+    start = request.query_params.get('start')
+    end = request.query_params.get('end')
+    try:
+        for value in (start, end):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return error_response('Dates must be in YYYY-MM-DD format', 400)
+
+    history = await run_in_threadpool(core.price_store.history, commodity, start, end)
+    return JSONResponse({
+        'name': commodity,
+        'history': history,
+        'watermark': core.price_store.watermark
+    })
+
+
+async def predict(request):
+    try:
+        started = time.perf_counter()
+        warming_up = await model_warming_up()
+        if warming_up is not None:
+            return warming_up
+        if upload_too_large(request):
+            return error_response('File too large', 413)
+        limited = rate_limited(request)
+        if limited is not None:
+            return limited
+
+        # Streams the multipart body off the socket without holding a worker thread
+        form = await request.form()
+        file = form.get('image')
+        if file is None or isinstance(file, str):
+            return error_response('No image file provided', 400)
+        if file.filename == '':
+            return error_response('No file selected', 400)
+        if not core.allowed_file(file.filename):
+            return error_response('Invalid file type. Please upload an image.', 400)
+
+        image_bytes = await file.read()
+        core.PREDICT_STAGES['parse'].observe(time.perf_counter() - started)
+
+        async with prediction_slot(request, started):
+            result = await run_cpu(core.predict_disease, io.BytesIO(image_bytes))
+
+        with core.PREDICT_STAGES['serialize'].time():
+            return JSONResponse(result)
+    except Rejected as rejected:
+        return rejection_response(rejected)
+    except UploadTooLarge:
+        return error_response('File too large', 413)
+    except Exception as e:
+        print(f"Prediction error: {e}")
+        return error_response(str(e), 500)
+
+
+async def collect_batch_uploads(request):
+    """Async counterpart of app.collect_batch_uploads()"""
+    if request.headers.get('content-type', '').split(';')[0].strip() in core.ARCHIVE_CONTENT_TYPES:
+        body = await request.body()
+        return await run_cpu(core.read_archive_uploads, io.BytesIO(body))
+
+    form = await request.form(max_files=core.PREDICT_BATCH_MAX_FILES + 1)
+    archive = form.get('archive')
+    if archive is not None and not isinstance(archive, str):
+        return await run_cpu(core.read_archive_uploads, io.BytesIO(await archive.read()))
+
+    files = [f for f in (form.getlist('images') or form.getlist('image')) if not isinstance(f, str)]
+    return [(f.filename, await f.read()) for f in files if f.filename != '']
+
+
+async def predict_batch(request):
+    try:
+        started = time.perf_counter()
+        warming_up = await model_warming_up()
+        if warming_up is not None:
+            return warming_up
+        if upload_too_large(request):
+            return error_response('File too large', 413)
+
+        try:
+            parse_started = time.perf_counter()
+            uploads = await collect_batch_uploads(request)
+            core.BATCH_STAGES['parse'].observe(time.perf_counter() - parse_started)
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            return error_response(f'Invalid archive: {str(e)}', 400)
+        except core.ArchiveTooLarge as e:
+            return error_response(str(e), 413)
+
+        if not uploads:
+            return error_response('No image files provided', 400)
+        if len(uploads) > core.PREDICT_BATCH_MAX_FILES:
+            return error_response(f'Too many files (max {core.PREDICT_BATCH_MAX_FILES})', 413)
+
+        limited = rate_limited(request, len(uploads))
+        if limited is not None:
+            return limited
+
+        async with prediction_slot(request, started):
+            results = await run_cpu(core.predict_disease_batch, uploads)
+        failed = sum(1 for r in results if 'error' in r)
+
+        with core.BATCH_STAGES['serialize'].time():
+            return JSONResponse({
+                'results': results,
+                'count': len(results),
+                'succeeded': len(results) - failed,
+                'failed': failed
+            })
+    except Rejected as rejected:
+        return rejection_response(rejected)
+    except UploadTooLarge:
+        return error_response('File too large', 413)
+    except Exception as e:
+        print(f"Batch prediction error: {e}")
+        return error_response(str(e), 500)
+
+
+async def health(request):
+    if not core.model_loader.done:
+        model_status = "loading"
+    else:
+        model_status = "loaded" if core.model is not None else "not loaded"
+    return JSONResponse({
+        'status': 'healthy',
+        'model': model_status,
+        'prediction_cache': core.prediction_cache.stats() if core.PREDICTION_CACHE_ENABLED else None,
+        'admission': core.admission.stats() if core.admission else None,
+        'cascade': core.model.stats() if isinstance(core.model, CascadePredictor) else None,
+        'model_versions': core.model_manager.stats()
+    })
+
+
+async def ready(request):
+    status = core.model_loader.status()
+    status['model'] = "loaded" if core.model is not None else "not loaded"
+    if not core.model_loader.done:
+        return JSONResponse(dict(status, ready=False), status_code=503,
+                            headers={'Retry-After': str(core.MODEL_RETRY_AFTER)})
+    return JSONResponse(dict(status, ready=True))
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.REGISTRY.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+class RequestMetricsMiddleware:
+    """Request latency, status counts and in-flight gauge (the Flask app's before/after_request hooks)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        metrics.IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.IN_FLIGHT.dec()
+            route = scope.get('route')
+            route = route.path if route is not None else 'unmatched'
+            metrics.REQUEST_SECONDS.labels(route, scope['method']).observe(time.perf_counter() - started)
+            metrics.REQUESTS.labels(route, scope['method'], status['code']).inc()
+
+
+class UploadLimitMiddleware:
+    """
+    Counts request body bytes as they arrive and raises UploadTooLarge past `max_bytes`,
+    so a chunked body (no Content-Length) cannot stream more than MAX_CONTENT_LENGTH either
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    raise UploadTooLarge(f'Request body exceeds {self.max_bytes} bytes')
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await agmarknet_fetcher.close()
+    cpu_pool.shutdown(wait=False)
+    admission_pool.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/api/commodity-prices', get_commodity_prices, methods=['GET']),
+        Route('/api/commodity-prices/{commodity}/history', get_commodity_history, methods=['GET']),
+        Route('/predict', predict, methods=['POST']),
+        Route('/predict/batch', predict_batch, methods=['POST']),
+        Route('/health', health, methods=['GET']),
+        Route('/ready', ready, methods=['GET']),
+        Route('/metrics', metrics_endpoint, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(RequestMetricsMiddleware),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(UploadLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES),
+    ],
+    lifespan=lifespan,
+)
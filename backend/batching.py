@@ -0,0 +1,145 @@
+"""
+Dynamic micro-batching for model inference
+Coalesces concurrent single-image requests into one batched forward pass
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Request-coalescing scheduler in front of a batch predict function.
+
+    Callers submit one preprocessed image (H, W, C) at a time and get back a
+    Future for its row of the model output. A single worker thread collects
+    queued requests for up to `max_wait_ms` (or until `max_batch_size` rows
+    are gathered), runs one forward pass and fans the rows back out.
+
+    When traffic is light (the previous batch held a single request and
+    nothing else is queued) the request is dispatched immediately, so
+    single-request latency is not increased by the batching window.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0, name='predict-batcher'):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be >= 0")
+
+        self.predict_fn = predict_fn
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = float(max_wait_ms) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._last_batch_size = 1
+
+        # Simple counters, useful when tuning the knobs
+        self.batches_run = 0
+        self.items_run = 0
+
+    def start(self):
+        """Start the worker thread (idempotent)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop the worker thread after the queued requests are served"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def submit(self, image):
+        """Queue a single image for inference and return a Future for its output row"""
+        image = np.asarray(image)
+        if image.ndim == 4:
+            if image.shape[0] != 1:
+                raise ValueError(f"Expected a single image, got batch of {image.shape[0]}")
+            image = image[0]
+
+        future = Future()
+        self.start()
+        self._queue.put((image, future))
+        return future
+
+    def predict(self, image, timeout=None):
+        """Blocking helper: submit an image and wait for its output row"""
+        return self.submit(image).result(timeout)
+
+    @property
+    def mean_batch_size(self):
+        return self.items_run / self.batches_run if self.batches_run else 0.0
+
+    def _collect(self, first):
+        batch = [first]
+
+        # Take everything that is already waiting without blocking
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                return batch
+            batch.append(item)
+
+        # Only hold the batch open when we are seeing concurrent traffic
+        concurrent = len(batch) > 1 or self._last_batch_size > 1
+        if concurrent and self.max_wait > 0:
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch = self._collect(first)
+            self._last_batch_size = len(batch)
+
+            # Drop requests whose callers already gave up
+            batch = [(image, future) for image, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                inputs = np.stack([image for image, _ in batch]).astype(np.float32, copy=False)
+                outputs = np.asarray(self.predict_fn(inputs))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.items_run += len(batch)
+            for row, (_, future) in zip(outputs, batch):
+                future.set_result(row)
@@ -0,0 +1,127 @@
+"""
+Inference latency benchmark
+Compares per-request model.predict() against the compiled, bucketed inference path
+
+Usage:
+    python benchmark_inference.py                      # uses the first model file found
+    python benchmark_inference.py --model AgriShield.keras --xla
+    python benchmark_inference.py --random --output bench.json
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from inference import CompiledPredictor, build_reference_model, parse_buckets
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODEL_PATHS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trained_model_tf215.keras'),
+    os.path.join(BASE_DIR, 'trained_model_tf215.keras'),
+    os.path.join(BASE_DIR, 'AgriShield.keras'),
+]
+
+
+def load_benchmark_model(model_path=None, random_weights=False):
+    """Load the model under test, or build the train.py architecture with random weights"""
+    if random_weights:
+        print("Using train.py architecture with random weights")
+        return build_reference_model()
+
+    paths = [model_path] if model_path else DEFAULT_MODEL_PATHS
+    for path in paths:
+        if path and os.path.exists(path):
+            print(f"Loading model from {path}")
+            return tf.keras.models.load_model(path, compile=False)
+
+    print("⚠ No model file found, using train.py architecture with random weights")
+    return build_reference_model()
+
+
+def measure(fn, batch, runs, warmup):
+    """Return per-call latencies in milliseconds"""
+    for _ in range(warmup):
+        fn(batch)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(batch)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies, batch_size):
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {
+        'p50_ms': round(float(p50), 3),
+        'p99_ms': round(float(p99), 3),
+        'mean_ms': round(float(np.mean(latencies)), 3),
+        'images_per_sec': round(batch_size * 1000 / float(np.mean(latencies)), 1)
+    }
+
+
+def run_benchmark(model, batch_sizes, runs=50, warmup=5, jit_compile=False):
+    results = {}
+
+    # Time to first prediction, including tracing, before any warm-up
+    first = np.random.rand(1, *model.input_shape[1:]).astype(np.float32)
+    start = time.perf_counter()
+    model.predict(first, verbose=0)
+    results['first_call_ms'] = {'model.predict': round((time.perf_counter() - start) * 1000, 3)}
+
+    start = time.perf_counter()
+    compiled = CompiledPredictor(model, buckets=batch_sizes, jit_compile=jit_compile)
+    compiled.warmup()
+    results['compiled_warmup_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+    modes = {
+        'model.predict': lambda batch: model.predict(batch, verbose=0),
+        'compiled': compiled.predict,
+    }
+
+    results['batch_sizes'] = {}
+    for batch_size in batch_sizes:
+        batch = np.random.rand(batch_size, *model.input_shape[1:]).astype(np.float32)
+        results['batch_sizes'][batch_size] = {
+            name: summarize(measure(fn, batch, runs, warmup), batch_size)
+            for name, fn in modes.items()
+        }
+    return results
+
+
+def print_report(results):
+    print(f"\nFirst model.predict call: {results['first_call_ms']['model.predict']:.1f} ms")
+    print(f"Compiled build + warm-up: {results['compiled_warmup_ms']:.1f} ms\n")
+    print(f"{'batch':>6} {'mode':>14} {'p50 ms':>10} {'p99 ms':>10} {'img/s':>10}")
+    for batch_size, modes in results['batch_sizes'].items():
+        for name, stats in modes.items():
+            print(f"{batch_size:>6} {name:>14} {stats['p50_ms']:>10.2f} {stats['p99_ms']:>10.2f} "
+                  f"{stats['images_per_sec']:>10.1f}")
+        speedup = modes['model.predict']['p50_ms'] / modes['compiled']['p50_ms']
+        print(f"{'':>6} {'speedup (p50)':>14} {speedup:>10.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark model.predict vs compiled inference')
+    parser.add_argument('--model', help='Path to a .keras model file')
+    parser.add_argument('--random', action='store_true', help='Benchmark the train.py architecture with random weights')
+    parser.add_argument('--batch-sizes', default='1,8,32', help='Comma separated batch sizes')
+    parser.add_argument('--runs', type=int, default=50, help='Timed runs per batch size')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed runs per batch size')
+    parser.add_argument('--xla', action='store_true', help='Enable XLA JIT for the compiled path')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    print(f"TensorFlow version: {tf.__version__}")
+    model = load_benchmark_model(args.model, args.random)
+    results = run_benchmark(model, parse_buckets(args.batch_sizes), args.runs, args.warmup, args.xla)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
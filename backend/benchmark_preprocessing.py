@@ -0,0 +1,169 @@
+"""
+Preprocessing micro-benchmark
+Compares the original full-resolution decode path with reduce-on-decode into a reusable buffer
+
+Usage:
+    python benchmark_preprocessing.py                       # synthetic 4000x3000 JPEG and PNG
+    python benchmark_preprocessing.py --images photo1.jpg photo2.png --runs 20
+"""
+
+import argparse
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import IMAGE_SIZE, decode_image_into
+
+
+def legacy_preprocess(image_bytes):
+    """The original app.py preprocess_image(): full decode, resize, float64 divide, expand_dims"""
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image = image.resize((128, 128))
+    img_array = np.array(image)
+    img_array = img_array / 255.0
+    img_array = np.expand_dims(img_array, axis=0)
+    return img_array
+
+
+_buffer = np.empty((1,) + IMAGE_SIZE + (3,), dtype=np.float32)
+
+
+def fast_preprocess(image_bytes):
+    """Reduce-on-decode straight into a reusable float32 buffer"""
+    decode_image_into(image_bytes, _buffer[0])
+    return _buffer
+
+
+MODES = {'legacy': legacy_preprocess, 'fast': fast_preprocess}
+
+
+def synthetic_photo(fmt, size=(4000, 3000), seed=0):
+    """A phone-photo sized image with smooth gradients plus sensor-like noise"""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    pixels = np.stack([np.broadcast_to(x, (height, width)),
+                       np.broadcast_to(y, (height, width)),
+                       (x + y) / 2], axis=-1)
+    pixels += rng.normal(0, 8, pixels.shape).astype(np.float32)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(
+        buffer, fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+    return buffer.getvalue()
+
+
+def time_mode(fn, image_bytes, runs):
+    fn(image_bytes)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(image_bytes)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def traced_peak(fn, image_bytes):
+    """Peak Python/numpy heap allocation for one call (PIL's C buffers are not traced)"""
+    tracemalloc.start()
+    fn(image_bytes)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def child_peak_rss(mode, path, runs):
+    """Peak RSS growth in a fresh process, which does include PIL's decode buffers"""
+    output = subprocess.check_output(
+        [sys.executable, __file__, '--child', mode, path, '--runs', str(runs)], text=True)
+    return int(output.strip().splitlines()[-1])
+
+
+def peak_rss_bytes():
+    """Peak RSS of this process (ru_maxrss survives exec on Linux, so prefer VmHWM)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_child(mode, path, runs):
+    with open(path, 'rb') as f:
+        image_bytes = f.read()
+    before = peak_rss_bytes()
+    for _ in range(runs):
+        MODES[mode](image_bytes)
+    print(peak_rss_bytes() - before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark image preprocessing')
+    parser.add_argument('--images', nargs='*', help='Image files to benchmark (default: synthetic 4000x3000 JPEG and PNG)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.runs)
+        return
+
+    inputs = []
+    if args.images:
+        inputs = [(path, path) for path in args.images]
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='preprocess-bench-')
+        for fmt, ext in (('JPEG', 'jpg'), ('PNG', 'png')):
+            path = f"{tmpdir}/synthetic_4000x3000.{ext}"
+            with open(path, 'wb') as f:
+                f.write(synthetic_photo(fmt))
+            inputs.append((f"4000x3000 {fmt}", path))
+
+    results = {}
+    for label, path in inputs:
+        with open(path, 'rb') as f:
+            image_bytes = f.read()
+        results[label] = {'file_mb': round(len(image_bytes) / (1024 * 1024), 2)}
+        for mode, fn in MODES.items():
+            latencies = time_mode(fn, image_bytes, args.runs)
+            results[label][mode] = {
+                'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+                'mean_ms': round(float(np.mean(latencies)), 2),
+                'traced_peak_kb': round(traced_peak(fn, image_bytes) / 1024, 1),
+                'peak_rss_growth_mb': round(child_peak_rss(mode, path, args.runs) / (1024 * 1024), 1),
+            }
+
+        legacy, fast = legacy_preprocess(image_bytes), fast_preprocess(image_bytes)
+        results[label]['max_abs_pixel_diff'] = round(float(np.max(np.abs(legacy - fast))), 4)
+
+    print(f"{'input':>16} {'mode':>7} {'p50 ms':>8} {'py peak KB':>11} {'RSS MB':>8}")
+    for label, result in results.items():
+        for mode in MODES:
+            stats = result[mode]
+            print(f"{label:>16} {mode:>7} {stats['p50_ms']:>8.2f} {stats['traced_peak_kb']:>11.1f} "
+                  f"{stats['peak_rss_growth_mb']:>8.1f}")
+        print(f"{'':>16} speedup {result['legacy']['p50_ms'] / result['fast']['p50_ms']:>7.1f}x, "
+              f"max pixel diff {result['max_abs_pixel_diff']:.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,475 @@
+"""
+End-to-end benchmark for the Flask backend
+Starts app.py (Flask dev server or gunicorn) against a local Agmarknet stub and a small fixed
+model, drives each endpoint at a configurable concurrency and reports JSON you can diff
+between commits.
+
+Usage:
+    python benchmark_server.py                                  # dev server and gunicorn
+    python benchmark_server.py --servers gunicorn --workers 4 --concurrency 16 --duration 30
+    python benchmark_server.py --corpus ~/leaf_photos --output bench_$(git rev-parse --short HEAD).json
+    python benchmark_server.py --compare bench_old.json bench_new.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from agmarknet_stub import AgmarknetStub
+from benchmark_preprocessing import synthetic_photo
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ENDPOINTS = ('health', 'commodity-prices', 'predict', 'predict-batch')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def build_fixed_model(path, seed=1234):
+    """A small deterministic CNN with the serving input/output shapes (128x128x3 -> 23 classes)"""
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(128, 128, 3)),
+        tf.keras.layers.Conv2D(16, 3, strides=2, activation='relu'),
+        tf.keras.layers.Conv2D(32, 3, strides=2, activation='relu'),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(23, activation='softmax'),
+    ])
+    model.save(path)
+    return path
+
+
+def load_corpus(corpus_dir, workdir, size):
+    """Upload corpus: real photos from a directory, or synthetic phone-sized JPEG/PNG files"""
+    if corpus_dir:
+        paths = sorted(p for ext in ('jpg', 'jpeg', 'png', 'JPG', 'JPEG', 'PNG')
+                       for p in glob.glob(os.path.join(corpus_dir, f'*.{ext}')))
+        if not paths:
+            raise SystemExit(f"No images found in {corpus_dir}")
+    else:
+        paths = []
+        for i, (fmt, ext) in enumerate((('JPEG', 'jpg'), ('JPEG', 'jpg'), ('JPEG', 'jpg'), ('PNG', 'png'))):
+            path = os.path.join(workdir, f'upload_{i}.{ext}')
+            with open(path, 'wb') as f:
+                f.write(synthetic_photo(fmt, size=size, seed=i))
+            paths.append(path)
+
+    corpus = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            corpus.append((os.path.basename(path), f.read()))
+    return corpus
+
+
+def process_tree(pid):
+    """A process and all its descendants, from /proc"""
+    children = {}
+    for stat_path in glob.glob('/proc/[0-9]*/stat'):
+        try:
+            with open(stat_path) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(stat_path.split('/')[2]))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        stack.extend(children.get(current, []))
+    return pids
+
+
+def process_tree_rss(pid):
+    """Resident memory (bytes) of a process and all its descendants"""
+    total = 0
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            continue
+    return total
+
+
+def process_memory(pid):
+    """
+    RSS and PSS (MB) of every process in the tree. PSS splits shared pages between
+    the processes mapping them, so its sum is the real footprint of the server.
+    """
+    processes = []
+    for current in process_tree(pid):
+        try:
+            with open(f'/proc/{current}/cmdline', 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode(errors='replace')
+            with open(f'/proc/{current}/smaps_rollup') as f:
+                fields = {line.split(':')[0]: int(line.split()[1]) for line in f if line.split()[-1:] == ['kB']}
+        except (OSError, ValueError, IndexError):
+            continue
+        if 'inference_server.py' in cmdline:
+            role = 'inference-server'
+        elif 'resource_tracker' in cmdline:
+            role = 'helper'
+        elif current == pid:
+            role = 'master' if 'gunicorn' in cmdline else 'server'
+        else:
+            role = 'worker'
+        processes.append({
+            'pid': current,
+            'role': role,
+            'rss_mb': round(fields.get('Rss', 0) / 1024, 1),
+            'pss_mb': round(fields.get('Pss', 0) / 1024, 1),
+        })
+    return processes
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.25):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append(process_tree_rss(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+class BackendServer:
+    """The backend in a subprocess: app.py under the Flask dev server or gunicorn, or asgi_app.py under uvicorn"""
+
+    def __init__(self, kind, env, workers=2, threads=4, log_path=None):
+        self.kind = kind
+        self.port = free_port()
+        self.env = dict(os.environ, **env, PORT=str(self.port))
+        self.workers = workers
+        self.threads = threads
+        self.log_path = log_path
+        self.process = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=180):
+        if self.kind == 'gunicorn':
+            command = [shutil.which('gunicorn') or 'gunicorn', 'app:app',
+                       '-b', f'127.0.0.1:{self.port}', '-w', str(self.workers),
+                       '--threads', str(self.threads), '--timeout', '120']
+        elif self.kind == 'asgi':
+            command = [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--host', '127.0.0.1',
+                       '--port', str(self.port), '--no-access-log']
+        else:
+            command = [sys.executable, 'app.py']
+
+        log = open(self.log_path, 'w') if self.log_path else subprocess.DEVNULL
+        self.process = subprocess.Popen(command, cwd=BACKEND_DIR, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.kind} server exited with code {self.process.returncode} (see {self.log_path})")
+            try:
+                if requests.get(f"{self.url}/ready", timeout=5).status_code == 200:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        self.stop()
+        raise RuntimeError(f"{self.kind} server did not become ready within {timeout}s")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=20)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def make_request_fn(endpoint, base_url, corpus, batch_files):
+    """Return a function(session, i) -> status code for one request to the endpoint"""
+    if endpoint == 'health':
+        return lambda session, i: session.get(f"{base_url}/health", timeout=60).status_code
+    if endpoint == 'commodity-prices':
+        return lambda session, i: session.get(f"{base_url}/api/commodity-prices", timeout=60).status_code
+    if endpoint == 'predict':
+        def predict(session, i):
+            name, data = corpus[i % len(corpus)]
+            return session.post(f"{base_url}/predict", files={'image': (name, data)}, timeout=120).status_code
+        return predict
+    if endpoint == 'predict-batch':
+        def predict_batch(session, i):
+            files = [('images', corpus[(i + j) % len(corpus)]) for j in range(batch_files)]
+            return session.post(f"{base_url}/predict/batch", files=files, timeout=300).status_code
+        return predict_batch
+    raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def drive(request_fn, concurrency, duration, max_requests):
+    """Closed-loop load: `concurrency` clients issue requests back to back"""
+    latencies, statuses = [], []
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+    deadline = time.perf_counter() + duration
+
+    def client():
+        with requests.Session() as session:
+            while time.perf_counter() < deadline:
+                with lock:
+                    i = next(counter)
+                    if max_requests and i >= max_requests:
+                        return
+                start = time.perf_counter()
+                try:
+                    status = request_fn(session, i)
+                except requests.RequestException:
+                    status = 0
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    statuses.append(status)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    wall = time.perf_counter() - started
+    return latencies, statuses, wall
+
+
+def summarize(latencies, statuses, wall, rss_samples, items_per_request=1):
+    errors = sum(1 for status in statuses if status != 200)
+    codes = {}
+    for status in statuses:
+        codes[str(status)] = codes.get(str(status), 0) + 1
+    result = {
+        'requests': len(statuses),
+        'errors': errors,
+        'status_codes': codes,
+        'error_rate': round(errors / len(statuses), 4) if statuses else 0.0,
+        'throughput_rps': round(len(statuses) / wall, 2) if wall else 0.0,
+        'throughput_images_per_sec': round(len(statuses) * items_per_request / wall, 2) if wall else 0.0,
+        'rss_mb_max': round(max(rss_samples) / (1024 * 1024), 1) if rss_samples else None,
+        'rss_mb_mean': round(float(np.mean(rss_samples)) / (1024 * 1024), 1) if rss_samples else None,
+    }
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        result.update({
+            'latency_ms_p50': round(float(p50), 2),
+            'latency_ms_p95': round(float(p95), 2),
+            'latency_ms_p99': round(float(p99), 2),
+            'latency_ms_mean': round(float(np.mean(latencies)), 2),
+        })
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def server_env(stub, model_path, workdir, prediction_cache=False):
+    """Backend environment pointing at the stub, the fixed model and a scratch price store"""
+    return {
+        'AGMARKNET_BASE_URL': stub.url,
+        'AGMARKNET_API_KEY': 'benchmark',
+        'MODEL_PATH': model_path,
+        'MODEL_DOWNLOAD_URL': '',
+        'PRICE_DB_PATH': os.path.join(workdir, 'prices.sqlite3'),
+        'PRICE_SYNC_INTERVAL': '0',
+        'PREDICTION_CACHE': 'true' if prediction_cache else 'false',
+        'MAX_UPLOAD_MB': '256',  # batch requests carry several full-size photos
+        'RATE_LIMIT_PER_SECOND': '0',  # every benchmark client shares one address
+        'TF_CPP_MIN_LOG_LEVEL': '3',
+    }
+
+
+def run_suite(args):
+    workdir = tempfile.mkdtemp(prefix='agrishield-bench-')
+    stub = AgmarknetStub(latency_ms=args.stub_latency_ms, days=args.stub_days).start()
+    model_path = args.model or build_fixed_model(os.path.join(workdir, 'bench_model.keras'))
+    corpus = load_corpus(args.corpus, workdir, tuple(args.image_size))
+
+    env = server_env(stub, model_path, workdir, args.prediction_cache)
+    env.update(dict(item.split('=', 1) for item in args.env))
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'workers': args.workers,
+            'threads': args.threads,
+            'corpus': [{'name': name, 'bytes': len(data)} for name, data in corpus],
+            'batch_files': args.batch_files,
+            'stub_latency_ms': args.stub_latency_ms,
+            'env': {k: v for k, v in env.items() if k not in ('AGMARKNET_API_KEY',)},
+        },
+        'servers': {},
+    }
+
+    # (label, server kind, gunicorn workers, inference mode)
+    runs = []
+    for mode in args.inference_modes:
+        for kind in args.servers:
+            worker_counts = args.worker_counts if kind == 'gunicorn' and args.worker_counts else [args.workers]
+            for workers in worker_counts:
+                label = kind
+                if args.worker_counts and kind == 'gunicorn':
+                    label += f'-{workers}w'
+                if len(args.inference_modes) > 1 or mode != 'in-worker':
+                    label += f'-{mode}'
+                runs.append((label, kind, workers, mode))
+
+    try:
+        for label, kind, workers, mode in runs:
+            print(f"\n▶ Starting {label} server...")
+            run_env = dict(env)
+            if kind == 'gunicorn':
+                run_env.setdefault('INFERENCE_WORKERS', str(workers))
+            if mode == 'shared':
+                run_env['INFERENCE_SERVER'] = 'true'
+                run_env['INFERENCE_SERVER_SOCKET'] = os.path.join(workdir, f'{label}.sock')
+            server = BackendServer(kind, run_env, workers, args.threads,
+                                   log_path=os.path.join(workdir, f'{label}.log')).start()
+            results = {
+                'workers': workers if kind == 'gunicorn' else 1,
+                'inference_mode': mode,
+                'rss_mb_idle': round(process_tree_rss(server.process.pid) / (1024 * 1024), 1),
+            }
+            try:
+                for endpoint in args.endpoints:
+                    request_fn = make_request_fn(endpoint, server.url, corpus, args.batch_files)
+                    drive(request_fn, 1, 0, args.warmup)  # warm-up, not recorded
+
+                    sampler = RssSampler(server.process.pid)
+                    sampler.start()
+                    latencies, statuses, wall = drive(request_fn, args.concurrency, args.duration, args.max_requests)
+                    items = args.batch_files if endpoint == 'predict-batch' else 1
+                    results[endpoint] = summarize(latencies, statuses, wall, sampler.stop(), items)
+
+                    r = results[endpoint]
+                    print(f"  {endpoint:>17}: {r['throughput_rps']:>8.1f} req/s  "
+                          f"p50 {r.get('latency_ms_p50', 0):>8.1f} ms  p95 {r.get('latency_ms_p95', 0):>8.1f} ms  "
+                          f"p99 {r.get('latency_ms_p99', 0):>8.1f} ms  errors {r['error_rate']:.1%}  "
+                          f"RSS {r['rss_mb_max']} MB")
+
+                processes = process_memory(server.process.pid)
+                worker_rss = [p['rss_mb'] for p in processes if p['role'] in ('worker', 'server')]
+                results['processes'] = processes
+                results['rss_mb_per_worker'] = round(float(np.mean(worker_rss)), 1) if worker_rss else None
+                results['pss_mb_total'] = round(sum(p['pss_mb'] for p in processes), 1)
+                print(f"  {'memory':>17}: {results['rss_mb_per_worker']} MB RSS per worker, "
+                      f"{results['pss_mb_total']} MB PSS total across {len(processes)} processes")
+            finally:
+                server.stop()
+            report['servers'][label] = results
+    finally:
+        stub.stop()
+        if args.keep_workdir:
+            print(f"Server logs and fixtures kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+
+def compare(old_path, new_path):
+    """Print per-endpoint deltas between two benchmark reports"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print(f"{old['meta'].get('revision')} -> {new['meta'].get('revision')}")
+    metrics = ('throughput_rps', 'latency_ms_p50', 'latency_ms_p95', 'latency_ms_p99', 'error_rate', 'rss_mb_max')
+    for kind in sorted(set(old['servers']) & set(new['servers'])):
+        for endpoint in ENDPOINTS:
+            before, after = old['servers'][kind].get(endpoint), new['servers'][kind].get(endpoint)
+            if not before or not after:
+                continue
+            cells = []
+            for metric in metrics:
+                a, b = before.get(metric), after.get(metric)
+                if a is None or b is None:
+                    continue
+                change = f"{(b - a) / a:+.0%}" if a else "n/a"
+                cells.append(f"{metric} {a}→{b} ({change})")
+            print(f"{kind:>9} {endpoint:>17}: " + ", ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end backend benchmark')
+    parser.add_argument('--servers', nargs='+', default=['dev', 'gunicorn'], choices=['dev', 'gunicorn', 'asgi'])
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS), choices=ENDPOINTS)
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients per endpoint')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per endpoint')
+    parser.add_argument('--max-requests', type=int, default=0, help='Stop an endpoint after this many requests (0 = no limit)')
+    parser.add_argument('--warmup', type=int, default=3, help='Unrecorded requests per endpoint')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--worker-counts', type=int, nargs='+', help='Run gunicorn once per worker count, e.g. 1 2 4 8')
+    parser.add_argument('--inference-modes', nargs='+', default=['in-worker'], choices=['in-worker', 'shared'],
+                        help='in-worker: each worker loads the model; shared: one inference server (INFERENCE_SERVER=true)')
+    parser.add_argument('--corpus', help='Directory of JPEG/PNG uploads (default: synthetic photos)')
+    parser.add_argument('--image-size', type=int, nargs=2, default=[4000, 3000], metavar=('W', 'H'))
+    parser.add_argument('--batch-files', type=int, default=10, help='Files per /predict/batch request')
+    parser.add_argument('--model', help='Model to serve (default: a small fixed CNN)')
+    parser.add_argument('--prediction-cache', action='store_true', help='Leave the prediction cache enabled')
+    parser.add_argument('--stub-latency-ms', type=float, default=150, help='Agmarknet stub latency')
+    parser.add_argument('--stub-days', type=int, default=30)
+    parser.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE', help='Extra server environment')
+    parser.add_argument('--keep-workdir', action='store_true', help='Keep server logs, model and corpus')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two JSON reports')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run_suite(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"\n✓ Report written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,23 @@
 """
 Model Converter for TensorFlow 2.15
 Converts older Keras models to TensorFlow 2.15 compatible format
+and exports TFLite / ONNX artifacts for the lightweight inference backends
+
+Usage:
+    python convert_model_to_tf215.py                 # convert only
+    python convert_model_to_tf215.py --export        # convert, then export .tflite and .onnx
+    python convert_model_to_tf215.py --export-only   # export from an existing trained_model_tf215.keras
+    python convert_model_to_tf215.py --quantize      # dynamic-range / float16 / int8 TFLite variants + report
 """
 
 import tensorflow as tf
 import numpy as np
+import argparse
 import os
 import json
+import time
+
+from dataset_shards import ShardedImageSet, is_shard_dir
 
 print(f"TensorFlow version: {tf.__version__}")
 
@@ -97,6 +108,232 @@ def convert_old_model(old_model_path, new_model_path):
         print(f"✗ Conversion failed: {e}")
         return False
 
+def serving_function(model):
+    """Fixed-signature serving function with a dynamic batch dimension"""
+    input_shape = tuple(model.input_shape[1:])
+
+    @tf.function(input_signature=[tf.TensorSpec((None,) + input_shape, tf.float32, name='image')])
+    def serve(image):
+        return model(image, training=False)
+
+    return serve
+
+def export_tflite(model, tflite_path):
+    """Export a float32 TFLite flatbuffer"""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(tflite_path, 'wb') as f:
+        f.write(converter.convert())
+    print(f"✓ TFLite model saved to: {tflite_path} ({os.path.getsize(tflite_path) / (1024 * 1024):.2f} MB)")
+    return tflite_path
+
+def export_onnx(model, onnx_path, opset=13):
+    """Export an ONNX model (requires tf2onnx)"""
+    import tf2onnx
+
+    serve = serving_function(model)
+    tf2onnx.convert.from_function(
+        serve,
+        input_signature=serve.input_signature,
+        opset=opset,
+        output_path=onnx_path
+    )
+    print(f"✓ ONNX model saved to: {onnx_path} ({os.path.getsize(onnx_path) / (1024 * 1024):.2f} MB)")
+    return onnx_path
+
+def verify_export(model, backend, artifact_path, atol=1e-4, samples=8):
+    """Check that an exported artifact matches the Keras model within tolerance"""
+    from inference import load_predictor
+
+    inputs = np.random.rand(samples, *model.input_shape[1:]).astype(np.float32)
+    expected = model(inputs, training=False).numpy()
+    actual = load_predictor(backend, artifact_path, buckets=(1, samples)).predict(inputs)
+
+    max_diff = float(np.max(np.abs(expected - actual)))
+    same_top1 = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+    ok = max_diff <= atol and same_top1 == 1.0
+    status = "✓" if ok else "✗"
+    print(f"{status} {backend}: max abs diff {max_diff:.2e} (tolerance {atol:.0e}), top-1 agreement {same_top1:.0%}")
+    return ok
+
+def export_inference_artifacts(keras_model_path, formats=('tflite', 'onnx'), atol=1e-4):
+    """Export .tflite / .onnx next to the .keras model and verify them against it"""
+    print(f"\nExporting inference artifacts from: {keras_model_path}")
+    model = tf.keras.models.load_model(keras_model_path, compile=False)
+    stem = os.path.splitext(keras_model_path)[0]
+    exporters = {'tflite': export_tflite, 'onnx': export_onnx}
+
+    all_ok = True
+    for fmt in formats:
+        artifact_path = f"{stem}.{fmt}"
+        try:
+            exporters[fmt](model, artifact_path)
+            all_ok = verify_export(model, fmt, artifact_path, atol=atol) and all_ok
+        except Exception as e:
+            print(f"✗ {fmt} export failed: {e}")
+            all_ok = False
+    return all_ok
+
+QUANTIZATION_MODES = ('dynamic', 'float16', 'int8')
+
+def load_validation_sample(valid_dir, samples, image_size=(128, 128), seed=123):
+    """Load up to `samples` normalized images and integer labels from the valid directory (or its shards)"""
+    if is_shard_dir(valid_dir):
+        return ShardedImageSet(valid_dir).sample(samples, seed)
+    dataset = tf.keras.utils.image_dataset_from_directory(
+        valid_dir,
+        labels="inferred",
+        label_mode="int",
+        color_mode="rgb",
+        batch_size=64,
+        image_size=image_size,
+        shuffle=True,
+        seed=seed
+    )
+    images, labels, count = [], [], 0
+    for batch_images, batch_labels in dataset:
+        images.append(batch_images.numpy() / 255.0)
+        labels.append(batch_labels.numpy())
+        count += len(batch_labels)
+        if count >= samples:
+            break
+    return (np.concatenate(images)[:samples].astype(np.float32),
+            np.concatenate(labels)[:samples])
+
+def quantize_tflite(model, mode, tflite_path, calibration_images=None):
+    """
+    Post-training quantization to a TFLite flatbuffer.
+    dynamic: int8 weights, float activations
+    float16: float16 weights
+    int8:    int8 weights and activations, calibrated on `calibration_images`
+             (float32 input/output is kept so the serving code is unchanged)
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if mode == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'int8':
+        if calibration_images is None or len(calibration_images) == 0:
+            raise ValueError("int8 quantization needs calibration images")
+
+        def representative_dataset():
+            for image in calibration_images:
+                yield [image[np.newaxis]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif mode != 'dynamic':
+        raise ValueError(f"Unknown quantization mode '{mode}'. Choose one of: {', '.join(QUANTIZATION_MODES)}")
+
+    with open(tflite_path, 'wb') as f:
+        f.write(converter.convert())
+    print(f"✓ {mode} model saved to: {tflite_path} ({os.path.getsize(tflite_path) / (1024 * 1024):.2f} MB)")
+    return tflite_path
+
+def benchmark_variant(predictor, images, labels, reference_top1, runs=50, batch_size=32):
+    """Single-image latency, batched throughput and top-1 accuracy for one model variant"""
+    single = images[:1]
+    for _ in range(5):
+        predictor.predict(single)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predictor.predict(single)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    batch = images[:batch_size]
+    if len(batch) < batch_size:
+        batch = np.resize(images, (batch_size,) + images.shape[1:])
+    predictor.predict(batch)
+    start = time.perf_counter()
+    repeats = max(1, runs // 10)
+    for _ in range(repeats):
+        predictor.predict(batch)
+    throughput = batch_size * repeats / (time.perf_counter() - start)
+
+    top1 = np.argmax(predictor.predict(images), axis=1)
+    result = {
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'latency_p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'throughput_images_per_sec': round(float(throughput), 1),
+        'top1_agreement_with_keras': round(float(np.mean(top1 == reference_top1)), 4),
+    }
+    if labels is not None:
+        result['top1_accuracy'] = round(float(np.mean(top1 == labels)), 4)
+    return result
+
+def quantize_and_report(keras_model_path, valid_dir='valid', modes=QUANTIZATION_MODES,
+                        calibration_samples=200, eval_samples=1000, report_path=None, min_agreement=0.95):
+    """
+    Produce quantized TFLite variants and a size / latency / throughput / accuracy report.
+    Variants are written as <stem>_<variant>.tflite, never over the <stem>.tflite that the
+    tflite backend serves. A variant passes verification when it was built and agrees with
+    the Keras model on the top-1 class of at least `min_agreement` of the images.
+    """
+    from inference import CompiledPredictor, TFLitePredictor
+
+    print(f"\nQuantizing model: {keras_model_path}")
+    model = tf.keras.models.load_model(keras_model_path, compile=False)
+    stem = os.path.splitext(keras_model_path)[0]
+    input_shape = tuple(model.input_shape[1:])
+
+    if os.path.isdir(valid_dir):
+        images, labels = load_validation_sample(valid_dir, calibration_samples + eval_samples,
+                                                image_size=input_shape[:2])
+        calibration_images, eval_images, eval_labels = (
+            images[:calibration_samples], images[calibration_samples:], labels[calibration_samples:])
+        if len(eval_images) == 0:
+            eval_images, eval_labels = images, labels
+    else:
+        print(f"⚠ Validation directory '{valid_dir}' not found. "
+              "Calibrating on random data; accuracy is reported as agreement with the Keras model only.")
+        calibration_images = np.random.rand(calibration_samples, *input_shape).astype(np.float32)
+        eval_images = np.random.rand(min(eval_samples, 256), *input_shape).astype(np.float32)
+        eval_labels = None
+
+    keras_predictor = CompiledPredictor(model, buckets=(1, 32))
+    reference_top1 = np.argmax(keras_predictor.predict(eval_images), axis=1)
+
+    report = {'keras': {'size_mb': round(os.path.getsize(keras_model_path) / (1024 * 1024), 3)}}
+    report['keras'].update(benchmark_variant(keras_predictor, eval_images, eval_labels, reference_top1))
+
+    variants = [('float32', export_tflite(model, f"{stem}_float32.tflite"))]
+    for mode in modes:
+        try:
+            variants.append((mode, quantize_tflite(model, mode, f"{stem}_{mode}.tflite", calibration_images)))
+        except Exception as e:
+            print(f"✗ {mode} quantization failed: {e}")
+            report[mode] = {'error': str(e)}
+
+    for name, path in variants:
+        result = {'path': path, 'size_mb': round(os.path.getsize(path) / (1024 * 1024), 3)}
+        result.update(benchmark_variant(TFLitePredictor(path, buckets=(1, 32)),
+                                        eval_images, eval_labels, reference_top1))
+        if eval_labels is not None:
+            result['accuracy_delta'] = round(result['top1_accuracy'] - report['keras']['top1_accuracy'], 4)
+        result['verified'] = result['top1_agreement_with_keras'] >= min_agreement
+        report[name] = result
+
+    print(f"\n{'variant':>10} {'size MB':>9} {'p50 ms':>8} {'img/s':>8} {'agree':>7} {'acc':>7} {'delta':>7}")
+    for name, result in report.items():
+        if 'error' in result:
+            print(f"{name:>10} failed: {result['error']}")
+            continue
+        print(f"{name:>10} {result['size_mb']:>9.2f} {result['latency_p50_ms']:>8.2f} "
+              f"{result['throughput_images_per_sec']:>8.1f} {result['top1_agreement_with_keras']:>7.2%} "
+              f"{result.get('top1_accuracy', float('nan')):>7.2%} {result.get('accuracy_delta', 0.0):>+7.2%}"
+              f"{'' if result.get('verified', True) else f'  ✗ below {min_agreement:.0%} agreement'}")
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Quantization report saved to: {report_path}")
+    return report
+
+def quantization_verified(report):
+    """True if every variant in a quantize_and_report() report was built and passed verification"""
+    return all('error' not in result and result.get('verified', True) for result in report.values())
+
 def create_new_model_from_scratch():
     """
     Create a brand new model if conversion fails
@@ -145,6 +382,38 @@ def create_new_model_from_scratch():
     return model
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the model to TF 2.15 and export inference artifacts')
+    parser.add_argument('--export', action='store_true', help='Export .tflite and .onnx after converting')
+    parser.add_argument('--export-only', action='store_true', help='Only export from an existing trained_model_tf215.keras')
+    parser.add_argument('--formats', default='tflite,onnx', help='Comma separated export formats')
+    parser.add_argument('--atol', type=float, default=1e-4, help='Max abs difference allowed vs the Keras model')
+    parser.add_argument('--quantize', action='store_true', help='Build quantized TFLite variants and a comparison report')
+    parser.add_argument('--modes', default=','.join(QUANTIZATION_MODES), help='Comma separated quantization modes')
+    parser.add_argument('--valid-dir', default='valid', help='Validation image directory (one folder per class) or its shards')
+    parser.add_argument('--calibration-samples', type=int, default=200, help='Images used to calibrate int8')
+    parser.add_argument('--eval-samples', type=int, default=1000, help='Images used to measure accuracy')
+    parser.add_argument('--report', default='quantization_report.json', help='Where to write the quantization report')
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help='Top-1 agreement with the Keras model a quantized variant needs to pass')
+    args = parser.parse_args()
+    export_formats = tuple(f.strip() for f in args.formats.split(',') if f.strip())
+
+    if args.quantize:
+        report = quantize_and_report(
+            'trained_model_tf215.keras',
+            valid_dir=args.valid_dir,
+            modes=tuple(m.strip() for m in args.modes.split(',') if m.strip()),
+            calibration_samples=args.calibration_samples,
+            eval_samples=args.eval_samples,
+            report_path=args.report,
+            min_agreement=args.min_agreement
+        )
+        raise SystemExit(0 if quantization_verified(report) else 1)
+
+    if args.export_only:
+        ok = export_inference_artifacts('trained_model_tf215.keras', export_formats, args.atol)
+        raise SystemExit(0 if ok else 1)
+
     print("=" * 60)
     print("TensorFlow 2.15 Model Converter")
     print("=" * 60)
@@ -182,6 +451,9 @@ if __name__ == '__main__':
         print("2. Update the train.py script")
         print("3. Run: python train.py")
     
+    if args.export and conversion_success:
+        export_inference_artifacts(new_model_path, export_formats, args.atol)
+
     print("\n" + "=" * 60)
     print("Conversion process complete!")
     print("=" * 60)
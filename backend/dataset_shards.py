@@ -0,0 +1,296 @@
+"""
+Sharded, pre-resized image datasets
+Compiles a class-per-folder image directory (train/, valid/) once into memory-mappable uint8 .npy
+shards plus an index of labels and offsets, so training and evaluation never decode a JPEG twice.
+Rerunning the compiler only decodes images that are new or changed since the last run.
+
+Usage:
+    python dataset_shards.py ../train ../shards/train [--shard-size 2048] [--workers 4]
+    python dataset_shards.py ../valid ../shards/valid
+    python dataset_shards.py ../train ../shards/train --rebuild      # recompact from scratch
+
+Layout:
+    <out>/index.json          {"image_size": [128, 128], "class_names": [...], "shards": [...],
+                               "files": {"<class>/<file>": [shard, offset, label, size, mtime_ns]}}
+    <out>/shard-00000.npy     (N, 128, 128, 3) uint8
+
+Shards are never modified once written and shard ids are never reused: every run (--rebuild too)
+writes new shards next to the old ones, rewrites the index atomically and only then deletes shards
+the new index no longer references, so readers always see a consistent dataset. Images that were
+deleted or changed leave unreferenced rows behind until the next --rebuild. This module only needs numpy and Pillow
+(TensorFlow is imported by to_tf_dataset() alone) and has no imports from the rest of the backend,
+so the training scripts at the repository root can use it as backend.dataset_shards.
+"""
+
+import argparse
+import json
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = (128, 128)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+INDEX_FILE = 'index.json'
+
+# Same resize settings as preprocessing.decode_image_into, so training sees the pixels serving sees
+RESIZE_REDUCING_GAP = 3.0
+
+
+class ShardError(Exception):
+    pass
+
+
+def is_shard_dir(path):
+    return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+
+def _shard_files(directory):
+    """{shard id: file name} of the shard files on disk, referenced by the index or not"""
+    shards = {}
+    for name in os.listdir(directory):
+        if name.startswith('shard-') and name.endswith('.npy'):
+            try:
+                shards[int(name[len('shard-'):-len('.npy')])] = name
+            except ValueError:
+                pass
+    return shards
+
+
+def read_index(directory):
+    with open(os.path.join(directory, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+def _write_index(directory, index):
+    path = os.path.join(directory, INDEX_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_image(path, image_size=IMAGE_SIZE):
+    """Decode an image file to a (H, W, 3) uint8 array at `image_size` (JPEGs in draft mode, like serving)"""
+    size = (image_size[1], image_size[0])  # PIL sizes are (width, height)
+    with Image.open(path) as image:
+        if image.format == 'JPEG':
+            image.draft('RGB', size)
+        image = image.convert('RGB')
+        if image.size != size:
+            image = image.resize(size, reducing_gap=RESIZE_REDUCING_GAP)
+        return np.asarray(image, dtype=np.uint8)
+
+
+def _load_task(task):
+    path, image_size = task
+    try:
+        return load_image(path, image_size)
+    except Exception as e:
+        print(f"⚠ Skipping {path}: {e}")
+        return None
+
+
+def scan_source(source_dir):
+    """(class_names, {relative path: (label, size, mtime_ns)}) for a class-per-folder directory"""
+    class_names = sorted(entry.name for entry in os.scandir(source_dir) if entry.is_dir())
+    if not class_names:
+        raise ShardError(f"No class folders found in '{source_dir}'")
+    files = {}
+    for label, class_name in enumerate(class_names):
+        for root, _, names in os.walk(os.path.join(source_dir, class_name)):
+            for name in names:
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    files[os.path.relpath(path, source_dir)] = (label, stat.st_size, stat.st_mtime_ns)
+    return class_names, files
+
+
+def compile_shards(source_dir, out_dir, image_size=IMAGE_SIZE, shard_size=2048, workers=None, rebuild=False):
+    """
+    Bring the shards in `out_dir` up to date with `source_dir`: decode every
+    image that is not in the index yet (or whose size / mtime changed) into
+    new shards of up to `shard_size` images and drop index entries of deleted
+    images. Returns a summary dict.
+    """
+    class_names, files = scan_source(source_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    index = None if rebuild or not is_shard_dir(out_dir) else read_index(out_dir)
+    if index is not None:
+        if index['class_names'] != class_names:
+            raise ShardError("Class folders changed since the shards were compiled (labels would shift); "
+                             "rerun with --rebuild")
+        if tuple(index['image_size']) != tuple(image_size):
+            raise ShardError(f"Shards were compiled at {index['image_size']}; rerun with --rebuild")
+    else:
+        # The old shards stay in place (and in the old index) until the new index replaces it
+        index = {'image_size': list(image_size), 'class_names': class_names, 'shards': [], 'files': {}}
+
+    kept = {rel: entry for rel, entry in index['files'].items()
+            if rel in files and tuple(entry[3:]) == files[rel][1:]}
+    removed = len(index['files']) - len(kept)
+    pending = sorted(rel for rel in files if rel not in kept)
+    on_disk = _shard_files(out_dir)
+    next_shard = max(list(on_disk) + [shard['id'] for shard in index['shards']], default=-1) + 1
+
+    started = time.perf_counter()
+    added = skipped = 0
+    with Pool(workers) as pool:
+        for start in range(0, len(pending), shard_size):
+            chunk = pending[start:start + shard_size]
+            name = f"shard-{next_shard:05d}.npy"
+            part_path = os.path.join(out_dir, name + '.part')
+            shard = np.lib.format.open_memmap(part_path, mode='w+', dtype=np.uint8,
+                                              shape=(len(chunk),) + tuple(image_size) + (3,))
+            tasks = [(os.path.join(source_dir, rel), tuple(image_size)) for rel in chunk]
+            for offset, (rel, image) in enumerate(zip(chunk, pool.imap(_load_task, tasks, chunksize=16))):
+                if image is None:
+                    skipped += 1
+                    continue
+                shard[offset] = image
+                label, size, mtime_ns = files[rel]
+                kept[rel] = [next_shard, offset, label, size, mtime_ns]
+                added += 1
+            shard.flush()
+            del shard
+            os.replace(part_path, os.path.join(out_dir, name))
+            index['shards'].append({'id': next_shard, 'file': name, 'count': len(chunk)})
+            next_shard += 1
+            print(f"  {name}: {len(chunk)} images ({start + len(chunk)}/{len(pending)})")
+
+    # Shards with no referenced rows left (and the old shards after a rebuild) are deleted
+    # once the new index is in place
+    referenced = {entry[0] for entry in kept.values()}
+    index['shards'] = [shard for shard in index['shards'] if shard['id'] in referenced]
+    index['files'] = kept
+    index['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    _write_index(out_dir, index)
+    for shard_id, name in _shard_files(out_dir).items():
+        if shard_id not in referenced:
+            os.remove(os.path.join(out_dir, name))
+
+    rows = sum(shard['count'] for shard in index['shards'])
+    return {'images': len(kept), 'added': added, 'removed': removed, 'skipped': skipped,
+            'shards': len(index['shards']), 'stale_rows': rows - len(kept),
+            'seconds': round(time.perf_counter() - started, 1)}
+
+
+class ShardedImageSet:
+    """
+    Read side of a compiled shard directory. Every shard is memory-mapped, so
+    reading a row only touches its pages in the OS page cache; the one copy
+    made is into the batch being assembled (in-order batches that lie within
+    one shard are returned as views without any copy).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        index = read_index(directory)
+        self.class_names = index['class_names']
+        self.image_size = tuple(index['image_size'])
+        self._shards = {shard['id']: np.load(os.path.join(directory, shard['file']), mmap_mode='r')
+                        for shard in index['shards']}
+        rows = np.array(sorted(entry[:3] for entry in index['files'].values()), dtype=np.int64).reshape(-1, 3)
+        self.shard_ids, self.offsets = rows[:, 0], rows[:, 1]
+        self.labels = rows[:, 2].astype(np.int32)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def gather(self, rows):
+        """uint8 images for row numbers `rows` (sorted rows read the mapped pages in order)"""
+        rows = np.asarray(rows)
+        shard_ids, offsets = self.shard_ids[rows], self.offsets[rows]
+        first, last = shard_ids[0], shard_ids[-1]
+        if first == last and np.all(np.diff(offsets) == 1):
+            return self._shards[first][offsets[0]:offsets[-1] + 1]
+        images = np.empty((len(rows),) + self.image_size + (3,), dtype=np.uint8)
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            images[mask] = self._shards[shard_id][offsets[mask]]
+        return images
+
+    def order(self, shuffle=True, seed=None, epoch=0, num_shards=1, shard_index=0):
+        """
+        Row numbers for one epoch: a permutation across all shards (seeded by
+        `seed` and `epoch`), then every `num_shards`-th row from `shard_index`,
+        so several training workers each read a disjoint part. The parts are
+        equal (up to num_shards - 1 rows are left out), so every worker runs
+        the same number of steps.
+        """
+        if shuffle:
+            rng = np.random.default_rng(None if seed is None else (seed, epoch))
+            rows = rng.permutation(len(self))
+        else:
+            rows = np.arange(len(self))
+        return rows[shard_index:len(rows) // num_shards * num_shards:num_shards]
+
+    def batches(self, batch_size, shuffle=True, seed=None, epoch=0, num_shards=1, shard_index=0):
+        """Yield (uint8 images, int32 labels) batches for one epoch"""
+        rows = self.order(shuffle, seed, epoch, num_shards, shard_index)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            if shuffle:
+                batch = np.sort(batch)  # a batch's order doesn't matter; sorted rows read pages in order
+            yield self.gather(batch), self.labels[batch]
+
+    def sample(self, count, seed=123):
+        """Up to `count` random images normalized to float32 [0, 1], with their integer labels"""
+        rows = self.order(True, seed)[:count]
+        by_row = np.argsort(rows)  # read in row order, return in random order
+        images = np.empty((len(rows),) + self.image_size + (3,), dtype=np.float32)
+        images[by_row] = self.gather(rows[by_row])
+        images /= 255.0
+        return images, self.labels[rows]
+
+    def to_tf_dataset(self, batch_size=32, shuffle=True, seed=None, num_shards=1, shard_index=0):
+        """
+        tf.data pipeline of (float32 images in [0, 1], one-hot labels) batches.
+        The rows are reshuffled every epoch (every time the dataset is iterated).
+        """
+        import itertools
+
+        import tensorflow as tf
+
+        epochs = itertools.count()
+        num_classes = len(self.class_names)
+
+        def generator():
+            yield from self.batches(batch_size, shuffle, seed, next(epochs), num_shards, shard_index)
+
+        dataset = tf.data.Dataset.from_generator(generator, output_signature=(
+            tf.TensorSpec((None,) + self.image_size + (3,), tf.uint8),
+            tf.TensorSpec((None,), tf.int32),
+        ))
+        dataset = dataset.map(lambda images, labels: (tf.cast(images, tf.float32) / 255.0,
+                                                      tf.one_hot(labels, num_classes)),
+                              num_parallel_calls=tf.data.AUTOTUNE)
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile an image directory into memory-mappable shards')
+    parser.add_argument('source', help='Image directory, one folder per class')
+    parser.add_argument('output', help='Shard directory to create or update')
+    parser.add_argument('--image-size', type=int, nargs=2, default=list(IMAGE_SIZE), metavar=('H', 'W'))
+    parser.add_argument('--shard-size', type=int, default=2048, help='Images per shard (~100 MB at 128x128)')
+    parser.add_argument('--workers', type=int, help='Decoding processes (default: one per CPU)')
+    parser.add_argument('--rebuild', action='store_true', help='Discard the existing shards and start over')
+    args = parser.parse_args()
+
+    try:
+        summary = compile_shards(args.source, args.output, tuple(args.image_size), args.shard_size,
+                                 args.workers, args.rebuild)
+    except ShardError as e:
+        raise SystemExit(f"❌ {e}")
+    print(f"✅ {summary['images']} images in {summary['shards']} shards "
+          f"(+{summary['added']} new, -{summary['removed']} removed, {summary['skipped']} unreadable) "
+          f"in {summary['seconds']}s")
+    if summary['stale_rows']:
+        print(f"⚠ {summary['stale_rows']} rows of deleted or changed images remain in the shards; "
+              "--rebuild compacts them")
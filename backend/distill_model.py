@@ -0,0 +1,216 @@
+"""
+Knowledge distillation for cascade inference
+Trains a small student CNN on the serving model's soft labels and reports how a student-first
+cascade (CASCADE_MODEL_PATH / CASCADE_THRESHOLD in app.py) trades escalations, accuracy and CPU time
+
+Usage:
+    python distill_model.py --train-dir ../train --valid-dir ../valid [--epochs 15] [--export tflite,onnx]
+    python distill_model.py --report-only --valid-dir ../valid [--thresholds 0.5,0.8,0.9,0.95]
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from convert_model_to_tf215 import export_inference_artifacts, load_validation_sample
+from dataset_shards import ShardedImageSet, is_shard_dir
+from inference import CascadePredictor, CompiledPredictor
+
+DEFAULT_THRESHOLDS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+
+def build_student_model(input_shape=(128, 128, 3), num_classes=23, width=16):
+    """
+    Depthwise-separable CNN, a few percent of the train.py model's compute.
+    The 'logits' layer is trained against the teacher; the model outputs softmax
+    probabilities like the full model, so both serve through the same code.
+    """
+    inputs = tf.keras.Input(shape=input_shape)
+    x = tf.keras.layers.Conv2D(width, 3, strides=2, padding='same', use_bias=False)(inputs)
+    x = tf.keras.layers.BatchNormalization()(x)
+    x = tf.keras.layers.ReLU()(x)
+    for filters in (width * 2, width * 4, width * 8, width * 16):
+        x = tf.keras.layers.DepthwiseConv2D(3, strides=2, padding='same', use_bias=False)(x)
+        x = tf.keras.layers.BatchNormalization()(x)
+        x = tf.keras.layers.ReLU()(x)
+        x = tf.keras.layers.Conv2D(filters, 1, use_bias=False)(x)
+        x = tf.keras.layers.BatchNormalization()(x)
+        x = tf.keras.layers.ReLU()(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    x = tf.keras.layers.Dropout(0.2)(x)
+    logits = tf.keras.layers.Dense(num_classes, name='logits')(x)
+    outputs = tf.keras.layers.Softmax(name='probabilities')(logits)
+    return tf.keras.Model(inputs, outputs, name='student')
+
+
+def image_dataset(directory, image_size, batch_size, shuffle):
+    """Normalized (images, one-hot labels) batches, preprocessed like train.py (or streamed from shards)"""
+    if is_shard_dir(directory):
+        return ShardedImageSet(directory).to_tf_dataset(batch_size, shuffle, seed=123)
+    dataset = tf.keras.utils.image_dataset_from_directory(
+        directory,
+        labels="inferred",
+        label_mode="categorical",
+        color_mode="rgb",
+        batch_size=batch_size,
+        image_size=image_size,
+        shuffle=shuffle,
+        seed=123
+    )
+    return dataset.map(lambda images, labels: (images / 255.0, labels),
+                       num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def distill(teacher, train_dir, valid_dir=None, epochs=15, batch_size=32, temperature=4.0,
+            alpha=0.1, learning_rate=1e-3, width=16):
+    """
+    Train a student on the teacher's temperature-softened outputs (KL divergence,
+    scaled by T^2), mixed with `alpha` of the usual cross-entropy on the labels.
+    The student weights with the best validation agreement with the teacher are kept.
+    """
+    input_shape = tuple(teacher.input_shape[1:])
+    num_classes = int(teacher.output_shape[-1])
+    student = build_student_model(input_shape, num_classes, width)
+    student_logits = tf.keras.Model(student.inputs, student.get_layer('logits').output)
+    optimizer = tf.keras.optimizers.Adam(learning_rate)
+    print(f"Student: {student.count_params():,} parameters (teacher {teacher.count_params():,})")
+
+    train_set = image_dataset(train_dir, input_shape[:2], batch_size, shuffle=True)
+    valid_set = image_dataset(valid_dir, input_shape[:2], batch_size, shuffle=False) if valid_dir else None
+
+    @tf.function
+    def train_step(images, labels):
+        # The teacher ends in a softmax; soften its distribution from the log-probabilities
+        teacher_log_probs = tf.math.log(teacher(images, training=False) + 1e-8)
+        soft_targets = tf.nn.softmax(teacher_log_probs / temperature)
+        with tf.GradientTape() as tape:
+            logits = student_logits(images, training=True)
+            log_student = tf.nn.log_softmax(logits / temperature)
+            kd_loss = tf.reduce_mean(tf.reduce_sum(
+                soft_targets * (tf.math.log(soft_targets + 1e-8) - log_student), axis=1)) * temperature ** 2
+            hard_loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(labels, logits))
+            loss = (1 - alpha) * kd_loss + alpha * hard_loss
+        gradients = tape.gradient(loss, student_logits.trainable_variables)
+        optimizer.apply_gradients(zip(gradients, student_logits.trainable_variables))
+        return loss
+
+    @tf.function
+    def eval_step(images, labels):
+        teacher_top1 = tf.argmax(teacher(images, training=False), axis=1)
+        student_top1 = tf.argmax(student(images, training=False), axis=1)
+        return (tf.reduce_sum(tf.cast(student_top1 == teacher_top1, tf.float32)),
+                tf.reduce_sum(tf.cast(student_top1 == tf.argmax(labels, axis=1), tf.float32)))
+
+    best_agreement, best_weights = -1.0, None
+    for epoch in range(epochs):
+        started = time.perf_counter()
+        losses = [float(train_step(images, labels)) for images, labels in train_set]
+        line = f"Epoch {epoch + 1}/{epochs}: loss {np.mean(losses):.4f} ({time.perf_counter() - started:.0f}s)"
+
+        if valid_set is not None:
+            agree = correct = seen = 0
+            for images, labels in valid_set:
+                a, c = eval_step(images, labels)
+                agree, correct, seen = agree + float(a), correct + float(c), seen + len(labels)
+            agreement = agree / seen
+            line += f", valid agreement with teacher {agreement:.2%}, accuracy {correct / seen:.2%}"
+            if agreement > best_agreement:
+                best_agreement, best_weights = agreement, student.get_weights()
+        print(line)
+
+    if best_weights is not None:
+        student.set_weights(best_weights)
+    return student
+
+
+def cpu_ms_per_image(predictor, images, batch_size=32):
+    """Process CPU time (all threads) per image over the whole set, after a warm-up pass"""
+    predictor(images[:batch_size])
+    started = time.process_time()
+    for start in range(0, len(images), batch_size):
+        predictor(images[start:start + batch_size])
+    return (time.process_time() - started) * 1000 / len(images)
+
+
+def cascade_report(student_path, teacher_path, images, labels=None, thresholds=DEFAULT_THRESHOLDS,
+                   batch_size=32, report_path=None):
+    """Escalated fraction, accuracy vs. the full model and CPU time per image at each threshold"""
+    buckets = (1, 8, batch_size)
+    full = CompiledPredictor(tf.keras.models.load_model(teacher_path, compile=False), buckets=buckets)
+    student = CompiledPredictor(tf.keras.models.load_model(student_path, compile=False), buckets=buckets)
+    full_top1 = np.argmax(full.predict(images), axis=1)
+
+    def evaluate(predictor, escalated_fraction):
+        top1 = np.argmax(predictor.predict(images), axis=1)
+        result = {
+            'escalated_fraction': round(escalated_fraction, 4),
+            'top1_agreement_with_full': round(float(np.mean(top1 == full_top1)), 4),
+            'cpu_ms_per_image': round(cpu_ms_per_image(predictor, images, batch_size), 3),
+        }
+        if labels is not None:
+            result['top1_accuracy'] = round(float(np.mean(top1 == labels)), 4)
+        return result
+
+    report = {'images': len(images), 'full': evaluate(full, 1.0), 'student': evaluate(student, 0.0), 'cascade': {}}
+    for threshold in thresholds:
+        cascade = CascadePredictor(student, full, threshold)
+        confidence = np.max(student.predict(images), axis=1)
+        report['cascade'][str(threshold)] = evaluate(cascade, float(np.mean(confidence < threshold)))
+
+    print(f"\n{'model':>16} {'escalated':>10} {'agree':>7} {'acc':>7} {'CPU ms/img':>11}")
+    rows = [('full', report['full']), ('student', report['student'])]
+    rows += [(f"cascade@{t}", r) for t, r in report['cascade'].items()]
+    for name, result in rows:
+        print(f"{name:>16} {result['escalated_fraction']:>10.1%} {result['top1_agreement_with_full']:>7.2%} "
+              f"{result.get('top1_accuracy', float('nan')):>7.2%} {result['cpu_ms_per_image']:>11.2f}")
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Cascade report saved to: {report_path}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Distill a student model and report cascade trade-offs')
+    parser.add_argument('--teacher', default='trained_model_tf215.keras', help='Full serving model')
+    parser.add_argument('--student', default='trained_model_tf215_student.keras', help='Student model to write / evaluate')
+    parser.add_argument('--train-dir', default='train', help='Training image directory (one folder per class) or its shards')
+    parser.add_argument('--valid-dir', default='valid', help='Validation image directory (one folder per class) or its shards')
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--temperature', type=float, default=4.0, help='Softmax temperature for the soft labels')
+    parser.add_argument('--alpha', type=float, default=0.1, help='Weight of the hard-label loss')
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--width', type=int, default=16, help='Filters in the student stem (doubles per stage)')
+    parser.add_argument('--export', default='', help='Comma separated formats to export the student to (tflite,onnx)')
+    parser.add_argument('--report-only', action='store_true', help='Skip training and evaluate an existing student')
+    parser.add_argument('--thresholds', default=','.join(str(t) for t in DEFAULT_THRESHOLDS))
+    parser.add_argument('--eval-samples', type=int, default=1000, help='Validation images used for the report')
+    parser.add_argument('--report', default='cascade_report.json', help='Where to write the cascade report')
+    args = parser.parse_args()
+
+    if not args.report_only:
+        teacher = tf.keras.models.load_model(args.teacher, compile=False)
+        student = distill(teacher, args.train_dir, args.valid_dir if os.path.isdir(args.valid_dir) else None,
+                          epochs=args.epochs, batch_size=args.batch_size, temperature=args.temperature,
+                          alpha=args.alpha, learning_rate=args.learning_rate, width=args.width)
+        student.save(args.student)
+        print(f"✅ Student model saved to: {args.student}")
+        formats = tuple(f.strip() for f in args.export.split(',') if f.strip())
+        if formats:
+            export_inference_artifacts(args.student, formats)
+
+    if os.path.isdir(args.valid_dir):
+        images, labels = load_validation_sample(args.valid_dir, args.eval_samples)
+    else:
+        print(f"⚠ Validation directory '{args.valid_dir}' not found. "
+              "Reporting on random data; accuracy is agreement with the full model only.")
+        images, labels = np.random.rand(min(args.eval_samples, 256), 128, 128, 3).astype(np.float32), None
+    cascade_report(args.student, args.teacher, images, labels,
+                   thresholds=tuple(float(t) for t in args.thresholds.split(',') if t.strip()),
+                   batch_size=args.batch_size, report_path=args.report)
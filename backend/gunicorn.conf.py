@@ -0,0 +1,10 @@
+"""
+gunicorn settings, read automatically when gunicorn is started from backend/ (gunicorn app:app)
+"""
+
+
+def post_worker_init(worker):
+    # Each worker loads its own model and runs its own price sync thread after the fork,
+    # never the master (even with --preload)
+    import app
+    app.start_background_work()
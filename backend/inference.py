@@ -0,0 +1,309 @@
+"""
+Inference backends for the disease model
+Keras (compiled tf.function), TFLite interpreter and ONNX Runtime behind one interface
+
+TensorFlow is only imported by the backends that need it, so TFLite (via
+tflite-runtime) and ONNX Runtime workers never pay for the full TF import.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+
+def parse_buckets(value, default=(1, 8, 32)):
+    """Parse a comma separated list of batch sizes, e.g. "1,8,32" """
+    if not value:
+        return tuple(default)
+    buckets = sorted({int(v) for v in str(value).split(',') if v.strip()})
+    if not buckets or buckets[0] < 1:
+        raise ValueError(f"Invalid batch size buckets: {value}")
+    return tuple(buckets)
+
+
+class BucketedPredictor:
+    """
+    Base class for inference backends.
+
+    Incoming batches are zero-padded up to the nearest bucketed batch size and
+    batches larger than the biggest bucket are split into chunks, so each
+    backend only ever sees a small fixed set of input shapes. Subclasses
+    implement _run_bucket() for one padded (bucket, H, W, C) float32 batch.
+    """
+
+    name = 'base'
+
+    def __init__(self, input_shape, buckets=(1, 8, 32)):
+        self.input_shape = tuple(int(d) for d in input_shape)
+        self.buckets = tuple(sorted(buckets))
+
+    def _run_bucket(self, batch):
+        raise NotImplementedError
+
+    def _bucket_for(self, n):
+        for bucket in self.buckets:
+            if n <= bucket:
+                return bucket
+        return self.buckets[-1]
+
+    def _run_chunk(self, chunk):
+        n = chunk.shape[0]
+        bucket = self._bucket_for(n)
+        if n < bucket:
+            padded = np.zeros((bucket,) + self.input_shape, dtype=np.float32)
+            padded[:n] = chunk
+            chunk = padded
+        return np.asarray(self._run_bucket(chunk))[:n]
+
+    def predict(self, batch):
+        """Run the model on a (N, H, W, C) float32 batch and return the (N, classes) outputs"""
+        batch = np.asarray(batch, dtype=np.float32)
+        largest = self.buckets[-1]
+        if batch.shape[0] <= largest:
+            return self._run_chunk(batch)
+        return np.concatenate([
+            self._run_chunk(batch[start:start + largest])
+            for start in range(0, batch.shape[0], largest)
+        ])
+
+    def __call__(self, batch):
+        return self.predict(batch)
+
+    def warmup(self, runs=2):
+        """Run every bucket ahead of the first request (tracing, allocation, compilation)"""
+        for bucket in self.buckets:
+            dummy = np.zeros((bucket,) + self.input_shape, dtype=np.float32)
+            for _ in range(runs):
+                self._run_bucket(dummy)
+
+
+class CompiledPredictor(BucketedPredictor):
+    """
+    Fixed-signature inference function for an in-memory Keras model.
+
+    One concrete function is traced per bucketed batch size (optionally with
+    XLA JIT) instead of going through model.predict(), which builds a data
+    adapter and execution loop on every call.
+    """
+
+    name = 'keras'
+
+    def __init__(self, model, buckets=(1, 8, 32), jit_compile=False):
+        import tensorflow as tf
+
+        super().__init__(model.input_shape[1:], buckets)
+        self.model = model
+        self.jit_compile = jit_compile
+
+        @tf.function(jit_compile=jit_compile, reduce_retracing=False)
+        def forward(x):
+            return model(x, training=False)
+
+        self._functions = {
+            bucket: forward.get_concrete_function(
+                tf.TensorSpec((bucket,) + self.input_shape, tf.float32)
+            )
+            for bucket in self.buckets
+        }
+        self._constant = tf.constant
+
+    def _run_bucket(self, batch):
+        return self._functions[batch.shape[0]](self._constant(batch)).numpy()
+
+
+def load_keras_predictor(model_path, buckets=(1, 8, 32), jit_compile=False, **_):
+    """Load a .keras model file and wrap it in a CompiledPredictor"""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path, compile=False)
+    return CompiledPredictor(model, buckets=buckets, jit_compile=jit_compile)
+
+
+def _tflite_interpreter_class():
+    """Prefer the standalone LiteRT / tflite-runtime packages, fall back to full TensorFlow"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLitePredictor(BucketedPredictor):
+    """
+    TFLite interpreter backend.
+
+    Interpreters are not thread-safe and resizing the input tensor reallocates
+    every buffer, so one interpreter is kept per bucketed batch size, each
+    guarded by its own lock.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, model_path, buckets=(1, 8, 32), num_threads=None, **_):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self._interpreter_class = _tflite_interpreter_class()
+
+        probe = self._interpreter_class(model_path=model_path)
+        super().__init__(probe.get_input_details()[0]['shape'][1:], buckets)
+
+        self._interpreters = {bucket: self._create_interpreter(bucket) for bucket in self.buckets}
+        self._locks = {bucket: threading.Lock() for bucket in self.buckets}
+
+    def _create_interpreter(self, batch_size):
+        interpreter = self._interpreter_class(model_path=self.model_path, num_threads=self.num_threads)
+        input_index = interpreter.get_input_details()[0]['index']
+        interpreter.resize_tensor_input(input_index, (batch_size,) + self.input_shape, strict=False)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    @staticmethod
+    def _quantize(batch, details):
+        scale, zero_point = details['quantization']
+        if details['dtype'] == np.float32 or not scale:
+            return batch.astype(details['dtype'], copy=False)
+        info = np.iinfo(details['dtype'])
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(details['dtype'])
+
+    @staticmethod
+    def _dequantize(outputs, details):
+        scale, zero_point = details['quantization']
+        if details['dtype'] == np.float32 or not scale:
+            return outputs.astype(np.float32)
+        return (outputs.astype(np.float32) - zero_point) * scale
+
+    def _run_bucket(self, batch):
+        bucket = batch.shape[0]
+        interpreter = self._interpreters[bucket]
+        with self._locks[bucket]:
+            input_details = interpreter.get_input_details()[0]
+            output_details = interpreter.get_output_details()[0]
+            # Integer-only models (int8/uint8 I/O) need their inputs quantized
+            interpreter.set_tensor(input_details['index'], self._quantize(batch, input_details))
+            interpreter.invoke()
+            return self._dequantize(interpreter.get_tensor(output_details['index']), output_details)
+
+
+class OnnxPredictor(BucketedPredictor):
+    """ONNX Runtime backend (InferenceSession.run is thread-safe)"""
+
+    name = 'onnx'
+
+    def __init__(self, model_path, buckets=(1, 8, 32), num_threads=None, **_):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        super().__init__(model_input.shape[1:], buckets)
+
+    def _run_bucket(self, batch):
+        return self.session.run(None, {self._input_name: batch})[0]
+
+
+class CascadePredictor:
+    """
+    Two-stage predictor with the BucketedPredictor interface.
+
+    A small distilled student model runs on the whole batch; images whose
+    top-1 student confidence reaches `threshold` are answered by it, and the
+    rest are escalated to the full model as one batch. Both stages are
+    themselves bucketed predictors, so the micro-batcher feeds them batches.
+    """
+
+    name = 'cascade'
+
+    def __init__(self, student, full, threshold=0.9):
+        if tuple(student.input_shape) != tuple(full.input_shape):
+            raise ValueError(f"Student input {student.input_shape} does not match full model input {full.input_shape}")
+        self.student = student
+        self.full = full
+        self.threshold = float(threshold)
+        self.input_shape = full.input_shape
+        self.images = 0
+        self.escalated = 0
+        self._lock = threading.Lock()
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        outputs = np.array(self.student(batch), dtype=np.float32)
+        uncertain = np.flatnonzero(outputs.max(axis=1) < self.threshold)
+        if len(uncertain):
+            outputs[uncertain] = self.full(batch[uncertain])
+        with self._lock:
+            self.images += len(batch)
+            self.escalated += len(uncertain)
+        return outputs
+
+    def __call__(self, batch):
+        return self.predict(batch)
+
+    def warmup(self, runs=2):
+        self.student.warmup(runs)
+        self.full.warmup(runs)
+
+    def stats(self):
+        return {
+            'threshold': self.threshold,
+            'images': self.images,
+            'escalated': self.escalated,
+            'escalated_fraction': round(self.escalated / self.images, 4) if self.images else None,
+        }
+
+
+# Backend name -> (model file extension, loader)
+INFERENCE_BACKENDS = {
+    'keras': ('.keras', load_keras_predictor),
+    'tflite': ('.tflite', TFLitePredictor),
+    'onnx': ('.onnx', OnnxPredictor),
+}
+
+
+def backend_model_paths(backend, model_paths):
+    """Map the .keras model search paths to the artifact paths for a backend"""
+    extension = INFERENCE_BACKENDS[backend][0]
+    return [os.path.splitext(path)[0] + extension for path in model_paths]
+
+
+def load_predictor(backend, model_path, buckets=(1, 8, 32), jit_compile=False, num_threads=None):
+    """Load a model artifact with the given backend and return a BucketedPredictor"""
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. "
+                         f"Choose one of: {', '.join(INFERENCE_BACKENDS)}")
+    loader = INFERENCE_BACKENDS[backend][1]
+    return loader(model_path, buckets=buckets, jit_compile=jit_compile, num_threads=num_threads)
+
+
+def build_reference_model(input_shape=(128, 128, 3), num_classes=23):
+    """
+    The train.py CNN architecture with random weights.
+    Useful for benchmarking when no trained model file is available.
+    """
+    import tensorflow as tf
+
+    layers = [tf.keras.Input(shape=input_shape)]
+    for filters in (32, 64, 128, 256, 512):
+        layers += [
+            tf.keras.layers.Conv2D(filters, 3, padding='same', activation='relu'),
+            tf.keras.layers.Conv2D(filters, 3, activation='relu'),
+            tf.keras.layers.MaxPool2D(pool_size=2, strides=2),
+        ]
+    layers += [
+        tf.keras.layers.Dropout(0.25),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(1500, activation='relu'),
+        tf.keras.layers.Dropout(0.4),
+        tf.keras.layers.Dense(num_classes, activation='softmax'),
+    ]
+    return tf.keras.Sequential(layers)
@@ -0,0 +1,305 @@
+"""
+Shared inference server for multi-worker deployments
+One process owns the model; gunicorn workers send it preprocessed tensors through shared memory
+
+Workers talk to the server over a Unix socket that only carries small control messages.
+Each client thread owns a shared-memory slot holding its input batch and the output rows,
+so tensors are never pickled or copied through the socket. Single-image requests from all
+workers are coalesced by one MicroBatcher, so batching works across processes too.
+
+Usage (normally started by app.py when INFERENCE_SERVER=true):
+    python inference_server.py --socket /tmp/agrishield-inference.sock --model trained_model_tf215.keras
+"""
+
+import argparse
+import os
+import socket
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from batching import MicroBatcher
+
+_HEADER = struct.Struct('!4I')   # server -> client on connect: height, width, channels, classes
+_COUNT = struct.Struct('!I')     # rows in a request (0 closes the connection)
+_STATUS = struct.Struct('!iI')   # status (0 ok, 1 error), length of the error message that follows
+
+
+def _recv_exact(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def _slot_arrays(buffer, capacity, input_shape, classes):
+    """Views of a slot: (capacity, H, W, C) inputs followed by (capacity, classes) outputs"""
+    input_size = capacity * int(np.prod(input_shape))
+    inputs = np.ndarray((capacity,) + tuple(input_shape), dtype=np.float32, buffer=buffer)
+    outputs = np.ndarray((capacity, classes), dtype=np.float32, buffer=buffer, offset=input_size * 4)
+    return inputs, outputs
+
+
+class InferenceServer:
+    """Serves a predictor (any callable batch -> outputs) to other processes on this host"""
+
+    def __init__(self, predictor, socket_path, input_shape=(128, 128, 3), max_batch_size=32, max_wait_ms=5.0):
+        self.predictor = predictor
+        self.socket_path = socket_path
+        self.input_shape = tuple(input_shape)
+        self.classes = int(np.asarray(predictor(np.zeros((1,) + self.input_shape, dtype=np.float32))).shape[-1])
+        self.batcher = MicroBatcher(predictor, max_batch_size, max_wait_ms, name='inference-server-batcher')
+        self.clients = 0
+        self._lock = threading.Lock()
+        self._sock = None
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        # Bind to a temporary name and rename, so clients never connect before we listen
+        tmp_path = f"{self.socket_path}.{os.getpid()}"
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(tmp_path)
+        os.chmod(tmp_path, 0o600)
+        self._sock.listen(128)
+        os.replace(tmp_path, self.socket_path)
+        self.batcher.start()
+        print(f"✓ Inference server listening on {self.socket_path} (pid {os.getpid()})")
+
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(conn,), name='inference-client', daemon=True).start()
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _handle(self, conn):
+        shm = None
+        with self._lock:
+            self.clients += 1
+        try:
+            conn.sendall(_HEADER.pack(*self.input_shape, self.classes))
+            name_length, capacity = struct.unpack('!II', _recv_exact(conn, 8))
+            name = _recv_exact(conn, name_length).decode()
+            shm = shared_memory.SharedMemory(name=name)
+            # The client owns (and unlinks) the segment; keep our tracker from unlinking it too
+            resource_tracker.unregister(shm._name, 'shared_memory')
+            inputs, outputs = _slot_arrays(shm.buf, capacity, self.input_shape, self.classes)
+            conn.sendall(_STATUS.pack(0, 0))
+
+            while True:
+                count, = _COUNT.unpack(_recv_exact(conn, _COUNT.size))
+                if count == 0:
+                    break
+                try:
+                    if count == 1:
+                        # Coalesced with single-image requests from every other worker
+                        outputs[0] = self.batcher.predict(inputs[0])
+                    else:
+                        outputs[:count] = self.predictor(inputs[:count])
+                    conn.sendall(_STATUS.pack(0, 0))
+                except Exception as e:
+                    message = str(e).encode()
+                    conn.sendall(_STATUS.pack(1, len(message)) + message)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            # Views into the segment must be released before it can be closed
+            inputs = outputs = None
+            if shm is not None:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+            conn.close()
+            with self._lock:
+                self.clients -= 1
+
+
+class _Connection:
+    """One client thread's socket and shared-memory slot"""
+
+    def __init__(self, socket_path, capacity):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        height, width, channels, self.classes = _HEADER.unpack(_recv_exact(self.sock, _HEADER.size))
+        self.input_shape = (height, width, channels)
+        self.capacity = capacity
+
+        size = capacity * (height * width * channels + self.classes) * 4
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        name = self.shm.name.encode()
+        self.sock.sendall(struct.pack('!II', len(name), capacity) + name)
+        self._check_status()
+        # Both sides have it mapped now; unlinking the name means it cannot leak if either side dies
+        self.shm.unlink()
+        self.inputs, self.outputs = _slot_arrays(self.shm.buf, capacity, self.input_shape, self.classes)
+
+    def _check_status(self):
+        status, length = _STATUS.unpack(_recv_exact(self.sock, _STATUS.size))
+        if status != 0:
+            raise RuntimeError(f"Inference server error: {_recv_exact(self.sock, length).decode()}")
+
+    def run(self, batch):
+        count = len(batch)
+        self.inputs[:count] = batch
+        self.sock.sendall(_COUNT.pack(count))
+        self._check_status()
+        return self.outputs[:count].copy()
+
+    def close(self):
+        try:
+            self.sock.sendall(_COUNT.pack(0))
+        except OSError:
+            pass
+        self.sock.close()
+        self.inputs = self.outputs = None
+        self.shm.close()
+
+
+class RemotePredictor:
+    """
+    Predictor interface (callable batch -> outputs, warmup()) backed by an
+    InferenceServer. Each calling thread gets its own connection and slot.
+    `restart` is called when the server has gone away, to bring it back up.
+    """
+
+    def __init__(self, socket_path, capacity=32, restart=None):
+        self.socket_path = socket_path
+        self.capacity = capacity
+        self.restart = restart
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = _Connection(self.socket_path, self.capacity)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def wait_until_ready(self, timeout=300, interval=0.5):
+        """Block until the server accepts connections; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._connection()
+                return True
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() + interval > deadline:
+                    return False
+                time.sleep(interval)
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            with self._lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    def _run(self, batch):
+        connection = self._connection()
+        if len(batch) <= self.capacity:
+            return connection.run(batch)
+        return np.concatenate([connection.run(batch[i:i + self.capacity])
+                               for i in range(0, len(batch), self.capacity)])
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        try:
+            return self._run(batch)
+        except (ConnectionError, OSError):
+            # The server crashed or was restarted: bring it back if needed, then reconnect once
+            self._drop_connection()
+            if self.restart:
+                self.restart()
+            return self._run(batch)
+
+    def warmup(self, runs=1):
+        connection = self._connection()
+        for _ in range(runs):
+            self(np.zeros((1,) + connection.input_shape, dtype=np.float32))
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+
+def _exit_with(owner_pid, server, interval=2.0):
+    """Shut the server down once the process that started it (e.g. the gunicorn master) is gone"""
+    while True:
+        time.sleep(interval)
+        try:
+            os.kill(owner_pid, 0)
+        except ProcessLookupError:
+            print("Inference server owner exited, shutting down")
+            server.close()
+            os._exit(0)
+        except PermissionError:
+            pass
+
+
+if __name__ == '__main__':
+    from inference import CascadePredictor, load_predictor, parse_buckets
+    from runtime_config import configure_threading
+
+    parser = argparse.ArgumentParser(description='Shared-memory inference server')
+    parser.add_argument('--socket', required=True, help='Unix socket path')
+    parser.add_argument('--model', required=True, help='Model artifact to serve')
+    parser.add_argument('--backend', default='keras', help='keras, tflite or onnx')
+    parser.add_argument('--buckets', default='1,8,32')
+    parser.add_argument('--xla', action='store_true')
+    parser.add_argument('--threads', type=int, default=0, help='Intra-op threads (0 = all available cores)')
+    parser.add_argument('--inter-op-threads', type=int, default=0, help='Inter-op threads (0 = automatic)')
+    parser.add_argument('--warmup-runs', type=int, default=2)
+    parser.add_argument('--cascade-model', default='', help='Student model answering confident images first')
+    parser.add_argument('--cascade-threshold', type=float, default=0.9)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--owner-pid', type=int, help='Exit when this process exits')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    # The only process on the host running inference, so it gets every core
+    threading_config = configure_threading(args.backend, workers=1, intra_op=args.threads or None,
+                                           inter_op=args.inter_op_threads or None)
+    predictor = load_predictor(args.backend, args.model, buckets=parse_buckets(args.buckets),
+                               jit_compile=args.xla, num_threads=threading_config['intra_op'])
+    if args.cascade_model:
+        student = load_predictor(args.backend, args.cascade_model, buckets=parse_buckets(args.buckets),
+                                 jit_compile=args.xla, num_threads=threading_config['intra_op'])
+        predictor = CascadePredictor(student, predictor, args.cascade_threshold)
+    predictor.warmup(args.warmup_runs)
+    server = InferenceServer(predictor, args.socket, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+    print(f"✓ Loaded {args.backend} model from {args.model} in {time.perf_counter() - started:.1f}s")
+
+    if args.owner_pid:
+        threading.Thread(target=_exit_with, args=(args.owner_pid, server), daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,262 @@
+"""
+In-process metrics for the serving path, exposed in the Prometheus text format at /metrics
+Counters, gauges and fixed-bucket histograms cheap enough to update on every request
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds: 0.5 ms .. 30 s, covers both a cached hit and a cold Agmarknet call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric family; label values select a child series"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Child series for these label values (created on first use)"""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        return self._children[()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ('value', 'function', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+    def set_function(self, function):
+        """Read the value from `function()` at scrape time instead"""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float('nan')
+        return self.value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._default().inc(amount)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}']
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1.0):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class _HistogramValue:
+    __slots__ = ('upper_bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, upper_bounds):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Serving metrics (one process; under gunicorn each worker reports its own)
+REQUEST_SECONDS = histogram(
+    'agrishield_request_duration_seconds', 'HTTP request latency by route', ('route', 'method'))
+REQUESTS = counter(
+    'agrishield_requests_total', 'HTTP requests by route and status code', ('route', 'method', 'status'))
+IN_FLIGHT = gauge(
+    'agrishield_requests_in_flight', 'HTTP requests currently being handled')
+STAGE_SECONDS = histogram(
+    'agrishield_stage_duration_seconds',
+    'Time spent in each stage of a prediction request (parse, read, cache, decode, resize, normalize, inference, serialize)',
+    ('endpoint', 'stage'))
+PREDICTION_CACHE_EVENTS = counter(
+    'agrishield_prediction_cache_events_total', 'Prediction cache hits, misses and evictions', ('event',))
+MICROBATCH_BATCHES = counter(
+    'agrishield_microbatch_batches_total', 'Forward passes run by the /predict micro-batcher')
+MICROBATCH_ITEMS = counter(
+    'agrishield_microbatch_items_total', 'Images predicted by the /predict micro-batcher')
+FALLBACKS = counter(
+    'agrishield_fallback_total', 'Responses served from mock/random data instead of the model or Agmarknet', ('kind',))
+AGMARKNET_SECONDS = histogram(
+    'agrishield_agmarknet_request_duration_seconds', 'Latency of individual Agmarknet API calls', ('caller',))
+AGMARKNET_REQUESTS = counter(
+    'agrishield_agmarknet_requests_total',
+    'Agmarknet API calls by outcome (ok, http_<status>, timeout, connection_error)', ('caller', 'outcome'))
+MODEL_LOAD_SECONDS = gauge(
+    'agrishield_model_load_duration_seconds', 'Time taken to load and warm up the serving model')
+MODEL_LOADED = gauge(
+    'agrishield_model_loaded', '1 when a model is loaded, 0 when predictions fall back to random results')
+CASCADE_IMAGES = counter(
+    'agrishield_cascade_images_total', 'Images answered by each cascade stage (student, full)', ('stage',))
+ADMISSION_REJECTIONS = counter(
+    'agrishield_admission_rejections_total',
+    'Prediction requests turned away (rate_limited, queue_full, deadline)', ('reason',))
+ADMISSION_QUEUE_SECONDS = histogram(
+    'agrishield_admission_queue_seconds', 'Time admitted prediction requests waited for a slot')
+ADMISSION_QUEUED = gauge(
+    'agrishield_admission_queued', 'Prediction requests waiting for a slot')
+ADMISSION_IN_FLIGHT = gauge(
+    'agrishield_admission_in_flight', 'Prediction requests holding a slot')
@@ -0,0 +1,182 @@
+"""
+Model artifact download
+Streams to a .part file with HTTP Range resume, verifies size and SHA-256, installs with an
+atomic rename and keeps a content-addressed cache so a host never downloads the same model twice
+
+Usage:
+    python model_download.py URL [--sha256 HEX] [--size BYTES] [--cache-dir data/models]
+"""
+
+import argparse
+import hashlib
+import os
+import time
+
+import requests
+
+from model_loader import file_lock
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+def sha256_file(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _total_size(response, offset):
+    """Full size of the remote file from Content-Range (206) or Content-Length (200)"""
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range and not content_range.endswith('/*'):
+        return int(content_range.rsplit('/', 1)[1])
+    length = response.headers.get('Content-Length')
+    return offset + int(length) if length is not None else None
+
+
+def download_file(url, dest, sha256=None, size=None, retries=3, timeout=30, backoff=1.0,
+                  chunk_size=CHUNK_SIZE, session=None, progress=None):
+    """
+    Download `url` to `dest`, never leaving a partial file at `dest`.
+
+    Data is streamed to `dest + '.part'`. If that file exists (an earlier
+    attempt was interrupted) the download resumes from its end with an HTTP
+    Range request; a server that ignores Range restarts it from zero. Failed
+    attempts are retried with backoff, each resuming where the last stopped.
+    The finished file is checked against `size` and `sha256` (when given) and
+    the server-reported size, fsynced and renamed into place. Returns the
+    SHA-256 hex digest.
+    """
+    part_path = dest + '.part'
+    http = session or requests.Session()
+    error = None
+
+    for attempt in range(retries + 1):
+        try:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if size is not None and offset > size:
+                os.remove(part_path)
+                offset = 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+            with http.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416 and offset:
+                    # Nothing left to fetch: the .part file may already be complete
+                    total = offset
+                elif response.status_code in (200, 206):
+                    if response.status_code == 200:
+                        offset = 0  # Range not honoured, start over
+                    total = _total_size(response, offset)
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size):
+                            f.write(chunk)
+                            offset += len(chunk)
+                            if progress:
+                                progress(offset, total)
+                        f.flush()
+                        os.fsync(f.fileno())
+                else:
+                    raise DownloadError(f"HTTP {response.status_code} for {url}")
+
+            received = os.path.getsize(part_path)
+            if total is not None and received < total:
+                raise DownloadError(f"Connection closed after {received} of {total} bytes")
+            if size is not None and received != size:
+                os.remove(part_path)
+                raise DownloadError(f"Size mismatch: expected {size} bytes, got {received}")
+
+            digest = sha256_file(part_path, chunk_size)
+            if sha256 and digest != sha256.lower():
+                os.remove(part_path)
+                raise DownloadError(f"SHA-256 mismatch: expected {sha256}, got {digest}")
+
+            os.replace(part_path, dest)
+            return digest
+        except (requests.RequestException, DownloadError) as e:
+            error = e
+            if attempt < retries:
+                print(f"⚠ Download attempt {attempt + 1} failed ({e}), retrying")
+                time.sleep(backoff * (2 ** attempt))
+    raise DownloadError(f"Download of {url} failed after {retries + 1} attempts: {error}")
+
+
+class ModelCache:
+    """
+    Content-addressed model store: artifacts live at `<cache_dir>/<sha256><suffix>`.
+
+    `refs/` maps a URL to the digest it last resolved to, so a model configured
+    without a checksum is still downloaded only once. Downloads hold a
+    host-wide file lock, so concurrent workers wait for the first one instead
+    of fetching the same file in parallel.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.refs_dir = os.path.join(cache_dir, 'refs')
+        os.makedirs(self.refs_dir, exist_ok=True)
+
+    def path_for(self, sha256, suffix=''):
+        return os.path.join(self.cache_dir, sha256.lower() + suffix)
+
+    def _ref_path(self, url):
+        return os.path.join(self.refs_dir, hashlib.sha256(url.encode()).hexdigest())
+
+    def _lookup(self, url, sha256, size, suffix):
+        if not sha256:
+            try:
+                with open(self._ref_path(url)) as f:
+                    sha256 = f.read().strip()
+            except OSError:
+                return None
+        path = self.path_for(sha256, suffix)
+        if os.path.exists(path) and (size is None or os.path.getsize(path) == size):
+            return path
+        return None
+
+    def fetch(self, url, sha256=None, size=None, suffix='', **download_kwargs):
+        """Path of the cached artifact for `url`, downloading it first if needed"""
+        cached = self._lookup(url, sha256, size, suffix)
+        if cached:
+            return cached
+
+        key = sha256.lower() if sha256 else hashlib.sha256(url.encode()).hexdigest()
+        with file_lock(os.path.join(self.cache_dir, key + '.lock')):
+            # Another worker may have finished the download while we waited for the lock
+            cached = self._lookup(url, sha256, size, suffix)
+            if cached:
+                return cached
+
+            staging = os.path.join(self.cache_dir, 'download-' + key + suffix)
+            digest = download_file(url, staging, sha256=sha256, size=size, **download_kwargs)
+            path = self.path_for(digest, suffix)
+            os.replace(staging, path)
+
+            ref_tmp = self._ref_path(url) + '.tmp'
+            with open(ref_tmp, 'w') as f:
+                f.write(digest)
+            os.replace(ref_tmp, self._ref_path(url))
+            return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download a model into the local content-addressed cache')
+    parser.add_argument('url')
+    parser.add_argument('--sha256', help='Expected SHA-256 of the file')
+    parser.add_argument('--size', type=int, help='Expected size in bytes')
+    parser.add_argument('--suffix', default='.keras', help='File extension of the cached artifact')
+    parser.add_argument('--cache-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'models'))
+    args = parser.parse_args()
+
+    def report(done, total):
+        if total:
+            print(f"\r   {done / (1024 * 1024):.1f} / {total / (1024 * 1024):.1f} MB", end='', flush=True)
+
+    started = time.perf_counter()
+    path = ModelCache(args.cache_dir).fetch(args.url, args.sha256, args.size, args.suffix, progress=report)
+    print(f"\n✅ {path} ({os.path.getsize(path) / (1024 * 1024):.2f} MB, {time.perf_counter() - started:.1f}s)")
@@ -0,0 +1,119 @@
+"""
+Load-once latch for slow startup work (model download and load)
+Runs the loader in a background thread so the server can answer liveness checks while it warms up
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, each process checks on its own
+    fcntl = None
+
+
+class BackgroundLoader:
+    """
+    Runs `loader()` at most once, in a daemon thread.
+
+    start() is idempotent; wait(timeout) blocks until the load has finished
+    (successfully or not) or the timeout expires. The loader's return value
+    is kept in `value`; an exception is kept in `error` and the load is not
+    retried.
+    """
+
+    IDLE, LOADING, READY, FAILED = 'idle', 'loading', 'ready', 'failed'
+
+    def __init__(self, loader, name='model-loader'):
+        self.loader = loader
+        self.name = name
+        self.value = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        with self._lock:
+            if self._thread is None:
+                self.started_at = time.time()
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self.value = self.loader()
+        except Exception as e:
+            print(f"❌ {self.name} failed: {e}")
+            self.error = e
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """Start the load if needed and wait for it; returns True once it has finished"""
+        self.start()
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def state(self):
+        if self._thread is None:
+            return self.IDLE
+        if not self._done.is_set():
+            return self.LOADING
+        return self.FAILED if self.error is not None else self.READY
+
+    def status(self):
+        elapsed_end = self.finished_at or time.time()
+        return {
+            'state': self.state,
+            'seconds': round(elapsed_end - self.started_at, 2) if self.started_at else None,
+            'error': str(self.error) if self.error is not None else None,
+        }
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive lock on `path` shared by every process on the host (e.g. all
+    gunicorn workers), so only one of them downloads the model while the
+    others wait and then find the finished file.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def try_file_lock(path):
+    """
+    Non-blocking file_lock(): the open file holding the exclusive lock, or None if another
+    process has it. The lock is held until the file is closed or the process exits.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    handle = open(path, 'a')
+    if fcntl is None:
+        return handle
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
@@ -0,0 +1,287 @@
+"""
+Versioned model registry and zero-downtime hot-swap
+A directory of immutable model versions plus a manifest naming the active one; serving
+workers watch the manifest and swap a newly activated version in without a restart
+
+Usage:
+    python model_registry.py add trained_model_tf215.keras trained_model_tf215.tflite [--version v2] [--activate]
+    python model_registry.py activate v2
+    python model_registry.py rollback
+    python model_registry.py list
+
+Layout:
+    <registry>/manifest.json          {"active": "v2", "previous": "v1", "versions": {...}}
+    <registry>/<version>/model.keras  (and model.tflite / model.onnx, one per backend)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+
+from inference import INFERENCE_BACKENDS
+from model_download import sha256_file
+from model_loader import file_lock
+
+
+class RegistryError(Exception):
+    pass
+
+
+class ModelRegistry:
+    """
+    Versions are written once and never modified; changing what is served only
+    rewrites the manifest (atomically, under a host-wide lock), so a reader
+    always sees either the old or the new manifest.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+
+    def read(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'active': None, 'previous': None, 'versions': {}}
+
+    def _write(self, manifest):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    def _lock(self):
+        return file_lock(os.path.join(self.root, 'manifest.lock'))
+
+    def active(self):
+        return self.read().get('active')
+
+    def path_for(self, version, backend):
+        """Artifact of `version` for an inference backend"""
+        entry = self.read()['versions'].get(version)
+        if entry is None:
+            raise RegistryError(f"Unknown model version '{version}'")
+        if backend not in entry['artifacts']:
+            raise RegistryError(f"Version '{version}' has no {backend} artifact")
+        return os.path.join(self.root, entry['artifacts'][backend])
+
+    def add(self, artifact_paths, version=None, notes='', activate=False):
+        """Copy artifacts (one per backend, recognised by extension) into a new version"""
+        extensions = {ext: backend for backend, (ext, _) in INFERENCE_BACKENDS.items()}
+        artifacts = {}
+        for path in artifact_paths:
+            backend = extensions.get(os.path.splitext(path)[1])
+            if backend is None:
+                raise RegistryError(f"Not a model artifact: {path}")
+            artifacts[backend] = path
+        if not artifacts:
+            raise RegistryError("No artifacts given")
+
+        digests = {backend: sha256_file(path) for backend, path in artifacts.items()}
+        version = version or time.strftime('%Y%m%d-%H%M%S-') + next(iter(digests.values()))[:8]
+
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock():
+            manifest = self.read()
+            if version in manifest['versions']:
+                raise RegistryError(f"Version '{version}' already exists")
+            version_dir = os.path.join(self.root, version)
+            os.makedirs(version_dir, exist_ok=True)
+            entry = {'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'notes': notes,
+                     'artifacts': {}, 'sha256': digests}
+            for backend, path in artifacts.items():
+                name = 'model' + INFERENCE_BACKENDS[backend][0]
+                tmp_path = os.path.join(version_dir, name + '.part')
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, os.path.join(version_dir, name))
+                entry['artifacts'][backend] = os.path.join(version, name)
+            manifest['versions'][version] = entry
+            if activate:
+                manifest['previous'], manifest['active'] = manifest['active'], version
+            self._write(manifest)
+        return version
+
+    def activate(self, version):
+        with self._lock():
+            manifest = self.read()
+            if version not in manifest['versions']:
+                raise RegistryError(f"Unknown model version '{version}'")
+            if manifest['active'] != version:
+                manifest['previous'], manifest['active'] = manifest['active'], version
+                self._write(manifest)
+
+    def rollback(self):
+        """Make the previous version active again (and the current one the previous)"""
+        with self._lock():
+            manifest = self.read()
+            if not manifest.get('previous'):
+                raise RegistryError("No previous version to roll back to")
+            manifest['active'], manifest['previous'] = manifest['previous'], manifest['active']
+            self._write(manifest)
+            return manifest['active']
+
+
+class ServingModel:
+    """
+    One loaded, warmed-up model version: its predictor and (optionally) its own micro-batcher.
+    `fingerprint` identifies exactly what was loaded, e.g. to tell cached predictions apart.
+    """
+
+    def __init__(self, version, predictor, batcher=None, source=None, fingerprint=None):
+        self.version = version
+        self.predictor = predictor
+        self.batcher = batcher
+        self.source = source
+        self.fingerprint = fingerprint or version
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {'version': self.version, 'source': self.source,
+                'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.loaded_at))}
+
+
+class ModelManager:
+    """
+    Holds the serving version and the previous one, which stays loaded for an
+    instant rollback.
+
+    activate() loads and warms up a new version through `load_fn(version, path)`
+    (returning a ServingModel) while the current one keeps serving, then swaps it
+    in with a single reference assignment: requests that already took the old
+    version finish on it, new requests get the new one. The version it replaces
+    as previous is retired after `retire_after` seconds. `on_swap(serving)` runs
+    after every swap.
+    """
+
+    def __init__(self, load_fn, on_swap=None, retire_after=60):
+        self.load_fn = load_fn
+        self.on_swap = on_swap
+        self.retire_after = retire_after
+        self.current = None
+        self.previous = None
+        self.swaps = 0
+        self.last_error = None
+        self._lock = threading.Lock()  # one load at a time
+
+    def _swap(self, serving):
+        retired, self.previous, self.current = self.previous, self.current, serving
+        self.swaps += 1
+        if self.on_swap:
+            self.on_swap(serving)
+        if retired is not None and retired is not serving and retired.batcher is not None:
+            # Requests that picked the retired version before the swap are given time to finish
+            timer = threading.Timer(self.retire_after, retired.batcher.stop)
+            timer.daemon = True
+            timer.start()
+
+    def activate(self, version, path):
+        """Load `version` from `path` and swap it in; on failure the current version keeps serving"""
+        with self._lock:
+            if self.current is not None and self.current.version == version:
+                return self.current
+            if self.previous is not None and self.previous.version == version:
+                return self.rollback()
+            started = time.perf_counter()
+            try:
+                serving = self.load_fn(version, path)
+            except Exception as e:
+                self.last_error = f"{version}: {e}"
+                raise
+            self.last_error = None
+            self._swap(serving)
+            print(f"✓ Now serving model version {version} (loaded in {time.perf_counter() - started:.1f}s)")
+            return serving
+
+    def rollback(self):
+        """Swap the previous version back in (already loaded, so immediate)"""
+        if self.previous is None:
+            raise RegistryError("No previous version loaded")
+        self.current, self.previous = self.previous, self.current
+        self.swaps += 1
+        if self.on_swap:
+            self.on_swap(self.current)
+        print(f"✓ Rolled back to model version {self.current.version}")
+        return self.current
+
+    def stats(self):
+        return {
+            'current': self.current.describe() if self.current else None,
+            'previous': self.previous.describe() if self.previous else None,
+            'swaps': self.swaps,
+            'last_error': self.last_error,
+        }
+
+
+class RegistryWatcher(threading.Thread):
+    """Polls the registry manifest and makes the manager serve whichever version is active"""
+
+    def __init__(self, registry, manager, backend, interval=5.0):
+        super().__init__(name='model-registry-watcher', daemon=True)
+        self.registry = registry
+        self.manager = manager
+        self.backend = backend
+        self.interval = interval
+        self._failed = None  # don't retry a broken version on every poll
+        self._stopped = threading.Event()
+
+    def check(self):
+        version = self.registry.active()
+        current = self.manager.current
+        if not version or version == self._failed or (current is not None and current.version == version):
+            return
+        try:
+            self.manager.activate(version, self.registry.path_for(version, self.backend))
+        except Exception as e:
+            self._failed = version
+            print(f"❌ Could not switch to model version {version}: {e}")
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠ Model registry check failed: {e}")
+
+    def stop(self):
+        self._stopped.set()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the versioned model registry')
+    parser.add_argument('--registry', default=os.getenv('MODEL_REGISTRY_DIR', os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'data', 'registry')))
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='Add a new version from model artifacts')
+    add.add_argument('artifacts', nargs='+', help='.keras / .tflite / .onnx files of one model')
+    add.add_argument('--version', help='Version name (default: timestamp and checksum)')
+    add.add_argument('--notes', default='')
+    add.add_argument('--activate', action='store_true', help='Serve it right away')
+    activate = commands.add_parser('activate', help='Serve a version')
+    activate.add_argument('version')
+    commands.add_parser('rollback', help='Serve the previous version again')
+    commands.add_parser('list', help='Show all versions')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    try:
+        if args.command == 'add':
+            version = registry.add(args.artifacts, args.version, args.notes, args.activate)
+            print(f"✅ Added version {version}{' (active)' if args.activate else ''}")
+        elif args.command == 'activate':
+            registry.activate(args.version)
+            print(f"✅ Version {args.version} is now active")
+        elif args.command == 'rollback':
+            print(f"✅ Rolled back to version {registry.rollback()}")
+        else:
+            manifest = registry.read()
+            for version, entry in sorted(manifest['versions'].items(), key=lambda item: item[1]['created_at']):
+                marker = '*' if version == manifest['active'] else ('-' if version == manifest.get('previous') else ' ')
+                print(f"{marker} {version:<28} {entry['created_at']}  {', '.join(sorted(entry['artifacts']))}  {entry['notes']}")
+    except RegistryError as e:
+        raise SystemExit(f"❌ {e}")
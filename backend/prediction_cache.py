@@ -0,0 +1,126 @@
+"""
+Content-addressed prediction cache
+Maps a hash of the uploaded bytes (or of the decoded input tensor) to a prediction
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_key(data, prefix='raw'):
+    """Hash raw upload bytes or a decoded numpy tensor into a cache key"""
+    if hasattr(data, 'tobytes'):
+        data = data.tobytes()
+    return f"{prefix}:{hashlib.blake2b(data, digest_size=16).hexdigest()}"
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU + TTL cache for prediction results.
+
+    Bounded both by number of entries and by (estimated) memory. Entries are
+    tied to the model version that produced them: when a different model is
+    loaded, set_model_version() drops everything.
+    """
+
+    # Rough per-entry overhead of the OrderedDict node, key string and tuple
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_entries=10000, max_bytes=32 * 1024 * 1024, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.model_version = None
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _entry_size(self, key, value):
+        return len(key) + len(json.dumps(value, default=str)) + self.ENTRY_OVERHEAD
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, count_miss=True):
+        """
+        Return a copy of the cached result, or None on miss/expiry.
+        A request that tries a second key after this one passes count_miss=False
+        here, so it is counted as one miss at most.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += count_miss
+                return None
+            value, expires_at, _ = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += count_miss
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(value)
+
+    def put(self, key, value, version=None):
+        """
+        Store a result. With `version`, it is stored only if that is still the
+        cache's model version, checked under the lock so a concurrent
+        set_model_version() cannot be overtaken by a result of the old model.
+        """
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version is not None and version != self.model_version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (dict(value), time.monotonic() + self.ttl_seconds, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def set_model_version(self, version):
+        """Invalidate every entry when the serving model changes"""
+        with self._lock:
+            if version == self.model_version:
+                return
+            self.model_version = version
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'model_version': self.model_version,
+            }
@@ -0,0 +1,57 @@
+"""
+Image preprocessing for the disease model
+Decodes uploads near the target size and writes normalized pixels into reusable float32 buffers
+"""
+
+import io
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = (128, 128)
+
+# resize() first shrinks by an integer factor with a cheap box reduce while the
+# image is still at least this many times larger than the target
+RESIZE_REDUCING_GAP = 3.0
+
+_SCALE = np.float32(255.0)
+
+
+def decode_image_into(image_bytes, out, image_size=IMAGE_SIZE, draft=True, timings=None):
+    """
+    Decode raw image bytes, resize and write the normalized pixels into `out`.
+
+    `out` is a preallocated (H, W, 3) float32 array, e.g. a row of a batch.
+    With `draft`, JPEGs are decoded by libjpeg at 1/2, 1/4 or 1/8 scale (never
+    below the target size) instead of at full phone-camera resolution. The
+    /255 scaling happens in a single ufunc call that writes straight into `out`.
+
+    If `timings` is a dict, the seconds spent in the 'decode', 'resize' and
+    'normalize' steps are stored in it.
+    """
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    if draft and image.format == 'JPEG':
+        image.draft('RGB', image_size)
+    image.load()
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    decoded = time.perf_counter()
+    if image.size != image_size:
+        image = image.resize(image_size, reducing_gap=RESIZE_REDUCING_GAP if draft else None)
+    resized = time.perf_counter()
+    np.divide(np.asarray(image), _SCALE, out=out)
+    if timings is not None:
+        timings['decode'] = decoded - start
+        timings['resize'] = resized - decoded
+        timings['normalize'] = time.perf_counter() - resized
+    return out
+
+
+class PreprocessBuffers(threading.local):
+    """Per-thread reusable (1, H, W, 3) float32 input buffer for single-image requests"""
+
+    def __init__(self, image_size=IMAGE_SIZE):
+        self.image = np.empty((1,) + tuple(image_size) + (3,), dtype=np.float32)
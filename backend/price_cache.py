@@ -0,0 +1,223 @@
+"""
+Stale-while-revalidate cache for the commodity price payload
+Serves the last good Agmarknet response while a single background thread refreshes it
+"""
+
+import asyncio
+import threading
+import time
+
+
+class _RevalidatingValue:
+    """
+    The cache state machine shared by the sync and async caches. It holds no
+    locks and does no I/O: subclasses call these steps under their own lock and
+    run the loader themselves.
+    """
+
+    def __init__(self, loader, ttl_seconds=900, max_stale_seconds=86400, error_ttl_seconds=60, name='price-cache'):
+        self.loader = loader
+        self.ttl = ttl_seconds
+        self.max_stale = max_stale_seconds
+        self.error_ttl = error_ttl_seconds
+        self.name = name
+
+        self._value = None
+        self._loaded_at = None      # monotonic time of the last successful load
+        self._loaded_wall = None    # wall clock time of the last successful load
+        self._failed_at = None
+
+        self.refreshes = 0
+        self.failures = 0
+
+    def _age(self):
+        return time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+
+    def _recently_failed(self, now):
+        return self._failed_at is not None and now - self._failed_at < self.error_ttl
+
+    def _lookup(self, refreshing):
+        """
+        Answer get() from what is cached: (result, refresh). result is None when
+        nothing usable is cached and the caller has to load; refresh asks the
+        caller to start a background refresh while serving a stale result.
+        """
+        now = time.monotonic()
+        age = self._age()
+        if age is not None and age <= self.ttl:
+            return (self._value, self._info('HIT', age)), False
+
+        if age is not None and age <= self.max_stale:
+            refresh = not refreshing and not self._recently_failed(now)
+            return (self._value, self._info('STALE', age)), refresh
+
+        if self._recently_failed(now):
+            return (None, self._info('MISS', None)), False
+        return None, False
+
+    def _needs_load(self, seen_failure):
+        """Once the caller holds the load lock: False if someone else loaded (or failed) while it waited"""
+        age = self._age()
+        loaded = age is not None and age <= self.ttl
+        failed = self._failed_at != seen_failure and self._recently_failed(time.monotonic())
+        return not loaded and not failed
+
+    def _loader_failed(self, error):
+        print(f"⚠ {self.name} refresh failed: {error}")
+        return None
+
+    def _store(self, value):
+        """Record one loader result; None counts as a failure and keeps the previous value"""
+        self.refreshes += 1
+        if value is None:
+            self.failures += 1
+            self._failed_at = time.monotonic()
+        else:
+            self._value = value
+            self._loaded_at = time.monotonic()
+            self._loaded_wall = time.time()
+            self._failed_at = None
+
+    def _after_load(self):
+        age = self._age()
+        if age is None or age > self.max_stale:
+            return None, self._info('MISS', None)
+        return self._value, self._info('MISS', age)
+
+    def _info(self, state, age):
+        return {
+            'state': state,
+            'age': int(age) if age is not None else None,
+            'loaded_at': self._loaded_wall,
+        }
+
+    def _stats(self, refreshing):
+        age = self._age()
+        return {
+            'cached': self._value is not None,
+            'age': int(age) if age is not None else None,
+            'refreshing': refreshing,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+        }
+
+
+class StaleWhileRevalidateCache(_RevalidatingValue):
+    """
+    Single-value cache around a slow loader (e.g. fetch_agmarknet_data).
+
+    - fresh (age <= ttl): served as is
+    - stale (ttl < age <= max_stale): served immediately, and exactly one
+      background thread is started to refresh it
+    - missing or older than max_stale: loaded synchronously; concurrent callers
+      wait for that one load instead of each calling the loader
+
+    A loader result of None counts as a failure: the previous value is kept and
+    the loader is not retried for `error_ttl` seconds.
+    """
+
+    def __init__(self, loader, ttl_seconds=900, max_stale_seconds=86400, error_ttl_seconds=60, name='price-cache'):
+        super().__init__(loader, ttl_seconds, max_stale_seconds, error_ttl_seconds, name)
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        """Call the loader (caller must hold _load_lock)"""
+        try:
+            value = self.loader()
+        except Exception as e:
+            value = self._loader_failed(e)
+        with self._lock:
+            self._store(value)
+
+    def _background_refresh(self):
+        try:
+            with self._load_lock:
+                self._load()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self):
+        """
+        Return (value, info) where info has 'state' (HIT, STALE or MISS),
+        'age' in seconds and 'loaded_at' (epoch seconds). value is None when
+        nothing could be loaded.
+        """
+        with self._lock:
+            result, refresh = self._lookup(self._refreshing)
+            if refresh:
+                self._refreshing = True
+                threading.Thread(target=self._background_refresh, name=f'{self.name}-refresh', daemon=True).start()
+            if result is not None:
+                return result
+            seen_failure = self._failed_at
+
+        # Nothing usable: load synchronously, one caller at a time
+        with self._load_lock:
+            with self._lock:
+                needed = self._needs_load(seen_failure)
+            if needed:
+                self._load()
+
+        with self._lock:
+            return self._after_load()
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._loaded_at = None
+            self._loaded_wall = None
+            self._failed_at = None
+
+    def stats(self):
+        with self._lock:
+            return self._stats(self._refreshing)
+
+
+class AsyncStaleWhileRevalidateCache(_RevalidatingValue):
+    """
+    asyncio counterpart of StaleWhileRevalidateCache for the ASGI app: same
+    HIT/STALE/MISS semantics, with an async `loader` coroutine function, a
+    background task for stale refreshes and an asyncio.Lock for single-flight loads.
+    """
+
+    def __init__(self, loader, ttl_seconds=900, max_stale_seconds=86400, error_ttl_seconds=60, name='price-cache'):
+        super().__init__(loader, ttl_seconds, max_stale_seconds, error_ttl_seconds, name)
+        self._refresh_task = None
+        self._load_lock = None      # created lazily, inside the running event loop
+
+    async def _load(self):
+        try:
+            value = await self.loader()
+        except Exception as e:
+            value = self._loader_failed(e)
+        self._store(value)
+
+    async def _background_refresh(self):
+        async with self._load_lock:
+            await self._load()
+
+    def _refreshing(self):
+        return self._refresh_task is not None and not self._refresh_task.done()
+
+    async def get(self):
+        """Return (value, info) like StaleWhileRevalidateCache.get()"""
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+
+        result, refresh = self._lookup(self._refreshing())
+        if refresh:
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+        if result is not None:
+            return result
+        seen_failure = self._failed_at
+
+        async with self._load_lock:
+            if self._needs_load(seen_failure):
+                await self._load()
+        return self._after_load()
+
+    def stats(self):
+        return self._stats(self._refreshing())
@@ -0,0 +1,347 @@
+"""
+Local historical price store for Agmarknet mandi prices
+SQLite table keyed by commodity/market/arrival_date with incremental, watermark-based sync
+
+Usage:
+    python price_store.py sync [--backfill-days 30]    # fetch everything newer than the watermark
+    python price_store.py history wheat --days 30       # query the local store
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import requests
+
+import metrics
+from agmarknet_fetcher import AGMARKNET_COMMODITY_FILTERS
+from model_loader import try_file_lock
+
+# Exact Agmarknet commodity name (lowercased) -> name used by the frontend. The same names the
+# fetcher filters on, so rows from the sync and from live queries land under the same key
+COMMODITY_KEYS = {name.lower(): key for key, names in AGMARKNET_COMMODITY_FILTERS.items() for name in names}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    commodity_key TEXT NOT NULL,
+    commodity     TEXT NOT NULL,
+    state         TEXT NOT NULL DEFAULT '',
+    district      TEXT NOT NULL DEFAULT '',
+    market        TEXT NOT NULL,
+    variety       TEXT NOT NULL DEFAULT '',
+    grade         TEXT NOT NULL DEFAULT '',
+    arrival_date  TEXT NOT NULL,
+    min_price     REAL,
+    max_price     REAL,
+    modal_price   REAL NOT NULL,
+    PRIMARY KEY (commodity, market, arrival_date, variety, grade)
+);
+CREATE INDEX IF NOT EXISTS idx_prices_key_date ON prices (commodity_key, arrival_date);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def normalize_commodity(name):
+    """Map an Agmarknet commodity name to our commodity key (None if we don't track it)"""
+    return COMMODITY_KEYS.get((name or '').strip().lower())
+
+
+def parse_arrival_date(value):
+    """Agmarknet dates are dd/mm/yyyy; store them as ISO yyyy-mm-dd so they sort and range-scan"""
+    for fmt in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value.strip(), fmt).date().isoformat()
+        except (AttributeError, ValueError):
+            continue
+    return None
+
+
+def _to_float(value, default=None):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class PriceStore:
+    """SQLite-backed price history (one connection per thread, WAL mode)"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        self._rekey()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _rekey(self):
+        """Re-derive commodity_key of stored rows when the commodity name mapping has changed"""
+        mapping = repr(sorted(COMMODITY_KEYS.items()))
+        if self.get_state('commodity_keys') == mapping:
+            return
+        with self._connect() as conn:
+            names = [row[0] for row in conn.execute('SELECT DISTINCT commodity FROM prices')]
+            for name in names:
+                key = normalize_commodity(name)
+                if key is None:
+                    conn.execute('DELETE FROM prices WHERE commodity = ?', (name,))
+                else:
+                    conn.execute('UPDATE prices SET commodity_key = ? WHERE commodity = ?', (key, name))
+            conn.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', ('commodity_keys', mapping))
+
+    def upsert_records(self, records):
+        """Insert or update raw Agmarknet records; returns how many were stored"""
+        rows = []
+        for record in records:
+            key = normalize_commodity(record.get('commodity'))
+            arrival_date = parse_arrival_date(record.get('arrival_date'))
+            modal_price = _to_float(record.get('modal_price'))
+            if not key or not arrival_date or modal_price is None:
+                continue
+            rows.append((
+                key,
+                record.get('commodity', '').strip(),
+                record.get('state', '').strip(),
+                record.get('district', '').strip(),
+                record.get('market', '').strip(),
+                record.get('variety', '').strip(),
+                record.get('grade', '').strip(),
+                arrival_date,
+                _to_float(record.get('min_price'), modal_price),
+                _to_float(record.get('max_price'), modal_price),
+                modal_price,
+            ))
+        if rows:
+            with self._connect() as conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def get_state(self, key, default=None):
+        row = self._connect().execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)', (key, str(value)))
+
+    @property
+    def watermark(self):
+        """Latest arrival_date fully synced (ISO date string) or None"""
+        return self.get_state('watermark')
+
+    def is_empty(self):
+        return self._connect().execute('SELECT 1 FROM prices LIMIT 1').fetchone() is None
+
+    def history(self, commodity_key, start=None, end=None):
+        """Daily average modal/min/max price for a commodity between two ISO dates (inclusive)"""
+        end = end or date.today().isoformat()
+        start = start or (date.fromisoformat(end) - timedelta(days=30)).isoformat()
+        rows = self._connect().execute(
+            'SELECT arrival_date, AVG(modal_price), MIN(min_price), MAX(max_price), COUNT(*) '
+            'FROM prices WHERE commodity_key = ? AND arrival_date BETWEEN ? AND ? '
+            'GROUP BY arrival_date ORDER BY arrival_date',
+            (commodity_key, start, end)
+        ).fetchall()
+        return [
+            {'date': d, 'price': round(avg, 2), 'min': round(lo, 2), 'max': round(hi, 2), 'markets': n}
+            for d, avg, lo, hi, n in rows
+        ]
+
+    def commodities(self):
+        return [row[0] for row in self._connect().execute(
+            'SELECT DISTINCT commodity_key FROM prices ORDER BY commodity_key')]
+
+    def summary(self, days=30):
+        """Commodity price payload in the /api/commodity-prices format, built from stored history"""
+        end = self.latest_date()
+        if end is None:
+            return []
+        start = (date.fromisoformat(end) - timedelta(days=days - 1)).isoformat()
+
+        formatted = []
+        for key in self.commodities():
+            points = self.history(key, start, end)
+            if not points:
+                continue
+            first, last = points[0]['price'], points[-1]['price']
+            formatted.append({
+                'name': key,
+                'currentPrice': round(last, 2),
+                'change': round((last - first) / first * 100, 2) if first else 0,
+                'history': [{'date': p['date'], 'price': p['price']} for p in points],
+            })
+        return formatted
+
+    def latest_date(self):
+        row = self._connect().execute('SELECT MAX(arrival_date) FROM prices').fetchone()
+        return row[0] if row else None
+
+
+def fetch_day(base_url, api_key, day, page_size=500, timeout=10, session=None):
+    """
+    All Agmarknet records for one arrival date, following offset pagination until the
+    response's `total` is reached (or an empty page). Pages can be shorter than `page_size`:
+    the sample API key returns at most 10 records per request.
+    """
+    http = session or requests
+    records, offset = [], 0
+    while True:
+        started = time.perf_counter()
+        try:
+            response = http.get(base_url, params={
+                'api-key': api_key,
+                'format': 'json',
+                'limit': page_size,
+                'offset': offset,
+                'filters[arrival_date]': day.strftime('%d/%m/%Y'),
+            }, timeout=timeout)
+        except requests.Timeout:
+            metrics.AGMARKNET_REQUESTS.labels('sync', 'timeout').inc()
+            raise
+        except requests.ConnectionError:
+            metrics.AGMARKNET_REQUESTS.labels('sync', 'connection_error').inc()
+            raise
+        finally:
+            metrics.AGMARKNET_SECONDS.labels('sync').observe(time.perf_counter() - started)
+        metrics.AGMARKNET_REQUESTS.labels(
+            'sync', 'ok' if response.status_code == 200 else f'http_{response.status_code}').inc()
+        response.raise_for_status()
+        payload = response.json()
+        page = payload.get('records', [])
+        records.extend(page)
+        offset += len(page)
+        total = _to_float(payload.get('total'))
+        if not page or (total is not None and offset >= total):
+            return records
+
+
+def sync_prices(store, base_url, api_key, backfill_days=30, page_size=500, today=None, timeout=10):
+    """
+    Incremental sync: fetch each arrival date from the watermark up to today.
+    The watermark day itself is re-fetched since late arrivals for it may
+    still be published. Returns a summary dict.
+    """
+    today = today or date.today()
+    watermark = store.watermark
+    start = date.fromisoformat(watermark) if watermark else today - timedelta(days=backfill_days - 1)
+
+    started = time.perf_counter()
+    fetched = stored = 0
+    day = start
+    with requests.Session() as session:
+        while day <= today:
+            records = fetch_day(base_url, api_key, day, page_size, timeout, session)
+            fetched += len(records)
+            stored += store.upsert_records(records)
+            store.set_state('watermark', day.isoformat())
+            day += timedelta(days=1)
+
+    store.set_state('last_sync', datetime.now().isoformat(timespec='seconds'))
+    return {
+        'from': start.isoformat(),
+        'to': today.isoformat(),
+        'fetched': fetched,
+        'stored': stored,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+
+class PriceSyncThread(threading.Thread):
+    """
+    Runs sync_prices() every `interval` seconds in the background.
+
+    With `lock_path`, only the process holding that host-wide lock syncs (every gunicorn
+    worker runs this thread, one of them does the work). The others keep trying the
+    lock each interval, so one of them takes over if the syncing process exits.
+    """
+
+    def __init__(self, store, base_url, api_key, interval=3600, backfill_days=30, lock_path=None):
+        super().__init__(name='price-sync', daemon=True)
+        self.store = store
+        self.base_url = base_url
+        self.api_key = api_key
+        self.interval = interval
+        self.backfill_days = backfill_days
+        self.lock_path = lock_path
+        self._lock_handle = None
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the thread unless it already runs (safe to call on every request)"""
+        if self.ident is not None:
+            return self
+        with self._start_lock:
+            if self.ident is None:
+                super().start()
+        return self
+
+    def run(self):
+        while not self._stop_event.is_set():
+            if self.lock_path and self._lock_handle is None:
+                self._lock_handle = try_file_lock(self.lock_path)
+                if self._lock_handle is None:
+                    self._stop_event.wait(self.interval)
+                    continue
+            try:
+                result = sync_prices(self.store, self.base_url, self.api_key, self.backfill_days)
+                print(f"✓ Price sync {result['from']}..{result['to']}: "
+                      f"{result['stored']} records stored in {result['seconds']}s")
+            except Exception as e:
+                print(f"⚠ Price sync failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        if self._lock_handle is not None:
+            self._lock_handle.close()
+            self._lock_handle = None
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Agmarknet local price store')
+    parser.add_argument('--db', default=os.getenv('PRICE_DB_PATH', os.path.join(os.path.dirname(__file__), 'data', 'prices.sqlite3')))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    sync_parser = subparsers.add_parser('sync', help='Fetch records newer than the watermark')
+    sync_parser.add_argument('--backfill-days', type=int, default=30, help='Days to fetch on the first sync')
+    sync_parser.add_argument('--base-url', default=os.getenv('AGMARKNET_BASE_URL', 'https://api.data.gov.in/resource/9ef84268-d588-465a-a308-a864a43d0070'))
+    sync_parser.add_argument('--api-key', default=os.getenv('AGMARKNET_API_KEY', ''))
+
+    history_parser = subparsers.add_parser('history', help='Print stored daily prices for a commodity')
+    history_parser.add_argument('commodity')
+    history_parser.add_argument('--days', type=int, default=30)
+
+    args = parser.parse_args()
+    price_store = PriceStore(args.db)
+
+    if args.command == 'sync':
+        print(f"Syncing into {args.db} (watermark: {price_store.watermark or 'none'})")
+        print(sync_prices(price_store, args.base_url, args.api_key, args.backfill_days))
+    else:
+        start = time.perf_counter()
+        end = price_store.latest_date()
+        points = price_store.history(args.commodity, (date.fromisoformat(end) - timedelta(days=args.days - 1)).isoformat(), end) if end else []
+        for point in points:
+            print(f"{point['date']}  {point['price']:>10.2f}  ({point['markets']} markets)")
+        print(f"{len(points)} days in {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,131 @@
+"""
+Core-aware threading for the inference runtime
+Splits the host's CPUs between serving workers so their TensorFlow / TFLite / ONNX Runtime pools don't oversubscribe cores
+"""
+
+import glob
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Held for the life of the process once a CPU slot is claimed
+_slot_handle = None
+
+
+def available_cpus():
+    """CPUs this process may use: the affinity mask, capped by a cgroup CPU quota (containers)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def plan_threading(cpus, workers=1, intra_op=None, inter_op=None):
+    """
+    Thread counts for one of `workers` processes sharing `cpus` cores.
+    Each worker gets an equal share for its intra-op pool; the inter-op pool
+    stays small, since a single small CNN has little op-level parallelism.
+    """
+    workers = max(1, int(workers))
+    share = max(1, cpus // workers)
+    intra_op = intra_op or share
+    inter_op = inter_op or (1 if intra_op <= 2 else 2)
+    return {'cpus': cpus, 'workers': workers, 'intra_op': intra_op, 'inter_op': inter_op}
+
+
+def claim_cpu_slot(workers, lock_dir):
+    """
+    Claim a free worker slot 0..workers-1 on this host (held until the process exits).
+    Returns the slot index, or None if every slot is taken or locking is unavailable.
+    """
+    global _slot_handle
+    if fcntl is None:
+        return None
+    os.makedirs(lock_dir, exist_ok=True)
+    for slot in range(workers):
+        handle = open(os.path.join(lock_dir, f'cpu-slot-{slot}.lock'), 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        _slot_handle = handle
+        return slot
+    return None
+
+
+def pin_process(cores):
+    """Restrict every thread of this process (and the threads it starts later) to `cores`"""
+    cores = set(cores)
+    for task in glob.glob('/proc/self/task/*'):
+        try:
+            os.sched_setaffinity(int(os.path.basename(task)), cores)
+        except OSError:
+            continue
+    os.sched_setaffinity(0, cores)
+
+
+def load_tuned_config(path):
+    """Settings written by tune_threading.py for this host, or {}"""
+    try:
+        with open(path) as f:
+            return json.load(f).get('config', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def configure_threading(backend, workers=1, intra_op=None, inter_op=None, affinity=False,
+                        tuned_config_path=None, lock_dir=None):
+    """
+    Decide and apply the inference threading for this process.
+
+    Explicit arguments win over the tuned config file, which wins over the
+    automatic plan. For TensorFlow the pool sizes are set on tf.config before
+    the runtime starts (call this before the model is loaded); TFLite and ONNX
+    Runtime take the returned `intra_op` as their thread count. With
+    `affinity`, the worker claims a slot and is pinned to its own cores.
+    Returns the applied settings.
+    """
+    tuned = load_tuned_config(tuned_config_path) if tuned_config_path else {}
+    workers = workers or tuned.get('workers') or 1
+    plan = plan_threading(available_cpus(), workers,
+                          intra_op or tuned.get('intra_op'), inter_op or tuned.get('inter_op'))
+    plan['source'] = 'env' if intra_op or inter_op else ('tuned' if tuned else 'auto')
+    plan['cores'] = None
+
+    if affinity or tuned.get('affinity'):
+        slot = claim_cpu_slot(plan['workers'], lock_dir or os.path.join(tempfile.gettempdir(), 'agrishield-cpu-slots'))
+        if slot is not None:
+            cpus = sorted(os.sched_getaffinity(0))
+            share = max(1, len(cpus) // plan['workers'])
+            cores = [cpus[(slot * share + i) % len(cpus)] for i in range(share)]
+            pin_process(cores)
+            plan['cores'] = cores
+
+    # Native runtimes that read these at import time (OpenMP / MKL builds)
+    os.environ.setdefault('OMP_NUM_THREADS', str(plan['intra_op']))
+
+    if backend == 'keras':
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(plan['intra_op'])
+            tf.config.threading.set_inter_op_parallelism_threads(plan['inter_op'])
+        except RuntimeError as e:
+            # The TF runtime was already initialized in this process
+            print(f"⚠ Could not apply TensorFlow threading: {e}")
+            plan['source'] += ' (not applied)'
+    return plan
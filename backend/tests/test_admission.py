@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, Rejected, TokenBucketLimiter, upstream_queue_seconds
+
+
+def test_token_bucket_allows_burst_then_reports_wait():
+    limiter = TokenBucketLimiter(rate=10, burst=5)
+    assert all(limiter.acquire('a') == 0 for _ in range(5))
+    wait = limiter.acquire('a')
+    assert 0 < wait <= 0.1
+    # Other clients have their own bucket
+    assert limiter.acquire('b', cost=5) == 0
+
+
+def test_token_bucket_refills_over_time():
+    limiter = TokenBucketLimiter(rate=100, burst=2)
+    limiter.acquire('a', cost=2)
+    assert limiter.acquire('a') > 0
+    time.sleep(0.05)
+    assert limiter.acquire('a') == 0
+
+
+def test_token_bucket_caps_cost_at_burst_and_forgets_old_clients():
+    limiter = TokenBucketLimiter(rate=1, burst=3, max_clients=2)
+    assert limiter.acquire('a', cost=50) == 0  # a batch bigger than the burst needs a full bucket
+    assert limiter.acquire('a') > 0
+    limiter.acquire('b')
+    limiter.acquire('c')
+    assert limiter.acquire('a') == 0  # 'a' was evicted and starts over with a full bucket
+
+
+def test_admission_rejects_when_queue_is_full():
+    controller = AdmissionController(max_in_flight=1, max_queue=0)
+    assert controller.acquire() == 0
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire()
+    assert rejected.value.reason == 'queue_full' and rejected.value.status == 503
+    controller.release()
+    assert controller.acquire() == 0
+
+
+def test_admission_hands_slots_to_waiters_in_order():
+    controller = AdmissionController(max_in_flight=1, max_queue=3)
+    controller.acquire()
+    order = []
+
+    def wait(name):
+        controller.acquire()
+        order.append(name)
+        controller.release()
+
+    threads = []
+    for name in 'xyz':
+        threads.append(threading.Thread(target=wait, args=(name,)))
+        threads[-1].start()
+        while controller.queued < len(threads):
+            time.sleep(0.001)
+    controller.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['x', 'y', 'z']
+    assert controller.stats()['in_flight'] == 0
+
+
+def test_admission_drops_requests_past_their_deadline():
+    controller = AdmissionController(max_in_flight=1, max_queue=1)
+    controller.acquire()
+    with pytest.raises(Rejected) as rejected:
+        controller.acquire(deadline=time.monotonic() + 0.05)
+    assert rejected.value.reason == 'deadline'
+    assert controller.queued == 0
+    with pytest.raises(Rejected):
+        controller.acquire(deadline=time.monotonic() - 1)
+    assert controller.stats()['rejections'] == {'queue_full': 0, 'deadline': 2}
+
+
+def test_admit_records_service_time():
+    controller = AdmissionController(max_in_flight=2, max_queue=0)
+    with controller.admit() as queued:
+        assert queued == 0
+        time.sleep(0.01)
+    assert controller.in_flight == 0
+    assert controller.service_seconds >= 0.01
+
+
+def test_upstream_queue_seconds_units():
+    now = 1_700_000_010.0
+    assert upstream_queue_seconds('t=1700000000', now) == pytest.approx(10)
+    assert upstream_queue_seconds('t=1700000000000', now) == pytest.approx(10)
+    assert upstream_queue_seconds('t=1700000000000000', now) == pytest.approx(10)
+    assert upstream_queue_seconds('garbage', now) == 0
+    assert upstream_queue_seconds(None, now) == 0
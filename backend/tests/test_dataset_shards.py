@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from dataset_shards import ShardedImageSet, ShardError, compile_shards, read_index
+
+
+def make_images(source, counts):
+    """`counts` maps class name -> number of solid-colour PNGs to write"""
+    for label, (class_name, count) in enumerate(sorted(counts.items())):
+        os.makedirs(source / class_name, exist_ok=True)
+        for i in range(count):
+            Image.new('RGB', (20, 16), (label * 60, i * 10, 0)).save(source / class_name / f'{i}.png')
+
+
+def compile_into(source, out, **kwargs):
+    return compile_shards(str(source), str(out), image_size=(8, 8), shard_size=4, workers=1, **kwargs)
+
+
+def shard_names(out):
+    return sorted(name for name in os.listdir(out) if name.startswith('shard-'))
+
+
+def test_compile_and_read_back(tmp_path):
+    make_images(tmp_path / 'src', {'healthy': 3, 'rust': 6})
+    summary = compile_into(tmp_path / 'src', tmp_path / 'out')
+    assert (summary['images'], summary['shards'], summary['added']) == (9, 3, 9)
+
+    dataset = ShardedImageSet(str(tmp_path / 'out'))
+    assert len(dataset) == 9 and dataset.class_names == ['healthy', 'rust']
+    assert np.bincount(dataset.labels).tolist() == [3, 6]
+    images = dataset.gather(np.arange(9))
+    assert images.shape == (9, 8, 8, 3) and images.dtype == np.uint8
+
+
+def test_incremental_run_only_adds_new_images(tmp_path):
+    make_images(tmp_path / 'src', {'healthy': 3, 'rust': 3})
+    compile_into(tmp_path / 'src', tmp_path / 'out')
+    before = shard_names(tmp_path / 'out')
+    Image.new('RGB', (20, 16)).save(tmp_path / 'src' / 'rust' / 'new.png')
+    summary = compile_into(tmp_path / 'src', tmp_path / 'out')
+    assert (summary['added'], summary['images']) == (1, 7)
+    assert set(before) < set(shard_names(tmp_path / 'out'))
+
+
+def test_rebuild_never_reuses_shard_ids(tmp_path):
+    make_images(tmp_path / 'src', {'healthy': 4, 'rust': 4})
+    out = tmp_path / 'out'
+    compile_into(tmp_path / 'src', out)
+    old_index = read_index(str(out))
+    os.remove(tmp_path / 'src' / 'rust' / '0.png')
+
+    summary = compile_into(tmp_path / 'src', out, rebuild=True)
+    index = read_index(str(out))
+    old_ids = {shard['id'] for shard in old_index['shards']}
+    assert min(shard['id'] for shard in index['shards']) > max(old_ids)
+    # Only the shards of the new index are left, and they hold every image
+    assert shard_names(out) == sorted(shard['file'] for shard in index['shards'])
+    assert summary['stale_rows'] == 0 and len(ShardedImageSet(str(out))) == 7
+
+
+def test_changed_classes_need_rebuild(tmp_path):
+    make_images(tmp_path / 'src', {'healthy': 2})
+    compile_into(tmp_path / 'src', tmp_path / 'out')
+    make_images(tmp_path / 'src', {'blight': 1, 'healthy': 2})
+    with pytest.raises(ShardError):
+        compile_into(tmp_path / 'src', tmp_path / 'out')
+
+
+def test_order_splits_epochs_evenly_across_workers(tmp_path):
+    make_images(tmp_path / 'src', {'healthy': 5, 'rust': 6})
+    compile_into(tmp_path / 'src', tmp_path / 'out')
+    dataset = ShardedImageSet(str(tmp_path / 'out'))
+
+    parts = [dataset.order(seed=1, epoch=0, num_shards=3, shard_index=i) for i in range(3)]
+    assert [len(part) for part in parts] == [3, 3, 3]
+    rows = np.concatenate(parts)
+    assert len(set(rows.tolist())) == 9 and rows.max() < 11
+
+    assert np.array_equal(dataset.order(seed=1, epoch=0), dataset.order(seed=1, epoch=0))
+    assert not np.array_equal(dataset.order(seed=1, epoch=0), dataset.order(seed=1, epoch=1))
+    assert dataset.order(shuffle=False).tolist() == list(range(11))
+
+
+def test_batches_cover_one_epoch(tmp_path):
+    make_images(tmp_path / 'src', {'healthy': 5, 'rust': 5})
+    compile_into(tmp_path / 'src', tmp_path / 'out')
+    dataset = ShardedImageSet(str(tmp_path / 'out'))
+    batches = list(dataset.batches(4, seed=0))
+    assert [len(labels) for _, labels in batches] == [4, 4, 2]
+    assert sorted(np.concatenate([labels for _, labels in batches]).tolist()) == sorted(dataset.labels.tolist())
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from model_download import DownloadError, ModelCache, download_file
+
+PAYLOAD = os.urandom(300 * 1024)
+SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class FileServer:
+    """Serves PAYLOAD at /model with optional Range support; can cut the first response short"""
+
+    def __init__(self, ranges=True, truncate_first=False):
+        self.ranges = ranges
+        self.truncate_first = truncate_first
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/model"
+
+    def _handle(self, handler):
+        range_header = handler.headers.get('Range')
+        self.requests.append(range_header)
+        start = int(range_header[len('bytes='):].split('-')[0]) if range_header and self.ranges else 0
+        body = PAYLOAD[start:]
+        if start:
+            handler.send_response(206)
+            handler.send_header('Content-Range', f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            handler.send_response(200)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        if self.truncate_first and len(self.requests) == 1:
+            handler.wfile.write(body[:len(body) // 3])
+            handler.wfile.flush()
+            handler.close_connection = True
+            return
+        handler.wfile.write(body)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def make(**kwargs):
+        servers.append(FileServer(**kwargs))
+        return servers[-1]
+    yield make
+    for server in servers:
+        server.close()
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_download_verifies_and_installs(tmp_path, server_factory):
+    server = server_factory()
+    dest = str(tmp_path / 'model.keras')
+    assert download_file(server.url, dest, sha256=SHA256, size=len(PAYLOAD)) == SHA256
+    assert read(dest) == PAYLOAD
+    assert not os.path.exists(dest + '.part')
+
+
+def test_resumes_partial_file_with_range(tmp_path, server_factory):
+    server = server_factory()
+    dest = str(tmp_path / 'model.keras')
+    with open(dest + '.part', 'wb') as f:
+        f.write(PAYLOAD[:1000])
+    download_file(server.url, dest, sha256=SHA256)
+    assert server.requests == ['bytes=1000-']
+    assert read(dest) == PAYLOAD
+
+
+def test_restarts_when_server_ignores_range(tmp_path, server_factory):
+    server = server_factory(ranges=False)
+    dest = str(tmp_path / 'model.keras')
+    with open(dest + '.part', 'wb') as f:
+        f.write(b'x' * 1000)
+    download_file(server.url, dest, sha256=SHA256)
+    assert read(dest) == PAYLOAD
+
+
+def test_interrupted_download_resumes_on_retry(tmp_path, server_factory):
+    server = server_factory(truncate_first=True)
+    dest = str(tmp_path / 'model.keras')
+    download_file(server.url, dest, sha256=SHA256, retries=2, backoff=0, chunk_size=8192)
+    assert len(server.requests) == 2
+    assert server.requests[0] is None and server.requests[1].startswith('bytes=')
+    assert read(dest) == PAYLOAD
+
+
+def test_checksum_mismatch_leaves_nothing_behind(tmp_path, server_factory):
+    server = server_factory()
+    dest = str(tmp_path / 'model.keras')
+    with pytest.raises(DownloadError, match='SHA-256 mismatch'):
+        download_file(server.url, dest, sha256='0' * 64, retries=1, backoff=0)
+    assert not os.path.exists(dest)
+    assert not os.path.exists(dest + '.part')
+
+
+def test_size_mismatch_is_rejected(tmp_path, server_factory):
+    server = server_factory()
+    dest = str(tmp_path / 'model.keras')
+    with pytest.raises(DownloadError, match='Size mismatch'):
+        download_file(server.url, dest, size=len(PAYLOAD) + 1, retries=0)
+    assert not os.path.exists(dest)
+
+
+def test_model_cache_downloads_once(tmp_path, server_factory):
+    server = server_factory()
+    cache = ModelCache(str(tmp_path / 'models'))
+    path = cache.fetch(server.url, suffix='.keras')
+    assert os.path.basename(path) == SHA256 + '.keras'
+    # Without a checksum, the URL ref finds the cached artifact
+    assert cache.fetch(server.url, suffix='.keras') == path
+    assert cache.fetch(server.url, sha256=SHA256, suffix='.keras') == path
+    assert len(server.requests) == 1
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+
+import pytest
+
+from model_registry import ModelManager, ModelRegistry, RegistryError, RegistryWatcher, ServingModel
+
+
+def write_artifact(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+
+class Batcher:
+    def __init__(self):
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def make_manager(swaps, retire_after=0.01):
+    def load(version, path):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                if f.read() == b'broken':
+                    raise RuntimeError('cannot load')
+        return ServingModel(version, predictor=lambda batch: batch, batcher=Batcher(), source=path)
+    return ModelManager(load, on_swap=swaps.append, retire_after=retire_after)
+
+
+def test_registry_add_activate_and_rollback(tmp_path):
+    registry = ModelRegistry(str(tmp_path / 'registry'))
+    v1 = registry.add([write_artifact(tmp_path, 'a.keras', b'one')], version='v1', activate=True)
+    registry.add([write_artifact(tmp_path, 'b.keras', b'two'), write_artifact(tmp_path, 'b.tflite', b'lite')],
+                 version='v2')
+    assert registry.active() == v1
+
+    registry.activate('v2')
+    manifest = registry.read()
+    assert (manifest['active'], manifest['previous']) == ('v2', 'v1')
+    with open(registry.path_for('v2', 'tflite'), 'rb') as f:
+        assert f.read() == b'lite'
+
+    assert registry.rollback() == 'v1'
+    assert registry.read()['previous'] == 'v2'
+
+
+def test_registry_rejects_bad_input(tmp_path):
+    registry = ModelRegistry(str(tmp_path / 'registry'))
+    with pytest.raises(RegistryError):
+        registry.add([write_artifact(tmp_path, 'notes.txt', b'x')])
+    registry.add([write_artifact(tmp_path, 'a.keras', b'one')], version='v1')
+    with pytest.raises(RegistryError):
+        registry.add([write_artifact(tmp_path, 'b.keras', b'two')], version='v1')
+    with pytest.raises(RegistryError):
+        registry.path_for('v1', 'onnx')
+    with pytest.raises(RegistryError):
+        registry.activate('v9')
+    with pytest.raises(RegistryError):
+        registry.rollback()
+    assert not [name for name in os.listdir(registry.root) if name.endswith('.tmp')]
+    with open(registry.manifest_path) as f:
+        assert list(json.load(f)['versions']) == ['v1']
+
+
+def test_manager_swaps_keep_previous_for_rollback():
+    swaps = []
+    manager = make_manager(swaps)
+    first = manager.activate('v1', 'one.keras')
+    second = manager.activate('v2', 'two.keras')
+    assert manager.current is second and manager.previous is first
+    assert manager.activate('v2', 'two.keras') is second  # already serving: no reload
+
+    assert manager.rollback() is first
+    assert (manager.current, manager.previous) == (first, second)
+    # Activating the loaded previous version is a rollback, not a reload
+    assert manager.activate('v2', 'two.keras') is second
+    assert [s.version for s in swaps] == ['v1', 'v2', 'v1', 'v2']
+    assert manager.stats()['swaps'] == 4
+
+
+def test_manager_retires_the_replaced_version():
+    manager = make_manager([])
+    first = manager.activate('v1', 'one.keras')
+    manager.activate('v2', 'two.keras')
+    manager.activate('v3', 'three.keras')
+    assert first.batcher.stopped.wait(5)
+    assert not manager.previous.batcher.stopped.is_set()
+
+
+def test_failed_load_keeps_serving_and_watcher_does_not_retry(tmp_path):
+    registry = ModelRegistry(str(tmp_path / 'registry'))
+    registry.add([write_artifact(tmp_path, 'good.keras', b'one')], version='v1', activate=True)
+    registry.add([write_artifact(tmp_path, 'broken.keras', b'broken')], version='v2')
+    swaps = []
+    manager = make_manager(swaps)
+    watcher = RegistryWatcher(registry, manager, 'keras')
+
+    watcher.check()
+    assert manager.current.version == 'v1'
+    registry.activate('v2')
+    watcher.check()
+    assert manager.current.version == 'v1'
+    assert manager.stats()['last_error'].startswith('v2')
+    watcher.check()
+    assert len(swaps) == 1
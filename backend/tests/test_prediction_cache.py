@@ -0,0 +1,52 @@
+import time
+
+from prediction_cache import PredictionCache, content_key
+
+
+def test_request_missing_both_keys_counts_one_miss():
+    cache = PredictionCache()
+    assert cache.get(content_key(b'photo'), count_miss=False) is None
+    assert cache.get(content_key(b'tensor', 'tensor')) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    cache.put(content_key(b'photo'), {'disease': 'Apple___healthy'})
+    assert cache.get(content_key(b'photo'), count_miss=False) == {'disease': 'Apple___healthy'}
+    assert cache.stats()['hit_rate'] == 0.5
+
+
+def test_lru_eviction_and_ttl():
+    cache = PredictionCache(max_entries=2, ttl_seconds=60)
+    for key in ('a', 'b'):
+        cache.put(key, {'key': key})
+    cache.get('a')
+    cache.put('c', {'key': 'c'})
+    assert cache.get('b') is None and cache.get('a') is not None
+    assert cache.evictions == 1
+
+    cache.ttl_seconds = 0
+    cache.put('d', {'key': 'd'})
+    time.sleep(0.01)
+    assert cache.get('d') is None
+    assert cache.expirations == 1
+
+
+def test_model_version_change_clears_entries():
+    cache = PredictionCache()
+    cache.set_model_version('v1')
+    cache.put('a', {'key': 'a'})
+    cache.set_model_version('v1')
+    assert cache.get('a') is not None
+    cache.set_model_version('v2')
+    assert cache.get('a') is None
+
+
+def test_put_for_a_replaced_version_is_dropped():
+    cache = PredictionCache()
+    cache.set_model_version('v1')
+    cache.put('raw:a', {'disease': 'x'}, version='v1')
+    cache.set_model_version('v2')
+    # A request that started on v1 finishes after the swap: its result must not land in v2's cache
+    cache.put('raw:b', {'disease': 'y'}, version='v1')
+    assert cache.get('raw:b') is None
+    cache.put('raw:b', {'disease': 'z'}, version='v2')
+    assert cache.get('raw:b') == {'disease': 'z'}
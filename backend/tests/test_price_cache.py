@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agmarknet_fetcher import AgmarknetFetcher
+from agmarknet_stub import AgmarknetStub
+from price_cache import AsyncStaleWhileRevalidateCache, StaleWhileRevalidateCache
+
+
+@pytest.fixture
+def stub():
+    stub = AgmarknetStub(days=5).start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def fetcher(stub):
+    fetcher = AgmarknetFetcher(stub.url, 'test-key', retries=0)
+    yield fetcher
+    fetcher.close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_miss_then_hit_from_stub(stub, fetcher):
+    cache = StaleWhileRevalidateCache(lambda: fetcher.fetch_all(commodities=['wheat'])[0], ttl_seconds=60)
+    value, info = cache.get()
+    assert info['state'] == 'MISS'
+    assert len(value['wheat']) == 5 * 4  # days x stub markets
+    requests_after_load = stub.requests
+
+    value_again, info = cache.get()
+    assert info['state'] == 'HIT'
+    assert value_again is value
+    assert stub.requests == requests_after_load
+
+
+def test_stale_value_served_while_one_refresh_runs(stub, fetcher):
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(time.monotonic())
+        if len(calls) > 1:
+            release.wait(5)
+        return fetcher.fetch_all(commodities=['rice'])[0]
+
+    cache = StaleWhileRevalidateCache(loader, ttl_seconds=0.05, max_stale_seconds=60)
+    first, _ = cache.get()
+    time.sleep(0.1)
+
+    for _ in range(5):
+        value, info = cache.get()
+        assert info['state'] == 'STALE'
+        assert value is first
+    assert cache.stats()['refreshing']
+    release.set()
+    wait_for(lambda: not cache.stats()['refreshing'])
+    assert len(calls) == 2
+    assert cache.stats()['refreshes'] == 2
+
+
+def test_concurrent_misses_share_one_load(stub, fetcher):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return fetcher.fetch_all(commodities=['maize'])[0]
+
+    cache = StaleWhileRevalidateCache(loader, ttl_seconds=60)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(value is results[0][0] for value, _ in results)
+
+
+def test_failed_load_is_not_retried_within_error_ttl():
+    stub = AgmarknetStub(days=1, fail_rate=1.0).start()
+    fetcher = AgmarknetFetcher(stub.url, 'test-key', retries=0)
+    try:
+        def loader():
+            records, errors = fetcher.fetch_all(commodities=['wheat'])
+            return None if errors else records
+        cache = StaleWhileRevalidateCache(loader, ttl_seconds=60, error_ttl_seconds=60)
+        assert cache.get() == (None, {'state': 'MISS', 'age': None, 'loaded_at': None})
+        requests_after_failure = stub.requests
+        assert cache.get()[0] is None
+        assert stub.requests == requests_after_failure
+        assert cache.stats()['failures'] == 1
+    finally:
+        fetcher.close()
+        stub.stop()
+
+
+def test_async_cache_serves_stale_and_refreshes_once():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {'version': len(calls)}
+
+    async def scenario():
+        cache = AsyncStaleWhileRevalidateCache(loader, ttl_seconds=0.05, max_stale_seconds=60)
+        misses = await asyncio.gather(*(cache.get() for _ in range(5)))
+        assert len(calls) == 1
+        assert {info['state'] for _, info in misses} == {'MISS'}
+
+        await asyncio.sleep(0.1)
+        stale = [await cache.get() for _ in range(5)]
+        assert all(value == {'version': 1} and info['state'] == 'STALE' for value, info in stale)
+        assert cache.stats()['refreshing']
+        await cache._refresh_task
+        return await cache.get()
+
+    value, info = asyncio.run(scenario())
+    assert value == {'version': 2} and info['state'] == 'HIT'
+    assert len(calls) == 2
+
+
+def test_async_fetcher_matches_sync_fetcher(stub, fetcher):
+    pytest.importorskip('httpx')
+    from agmarknet_fetcher import AsyncAgmarknetFetcher
+
+    async def fetch():
+        async_fetcher = AsyncAgmarknetFetcher(stub.url, 'test-key', retries=0)
+        try:
+            return await async_fetcher.fetch_all(commodities=['wheat', 'tur'])
+        finally:
+            await async_fetcher.close()
+
+    assert asyncio.run(fetch()) == fetcher.fetch_all(commodities=['wheat', 'tur'])
@@ -0,0 +1,116 @@
+from datetime import date
+
+import pytest
+import requests
+
+from agmarknet_stub import AgmarknetStub, generate_records
+from model_loader import try_file_lock
+from price_store import PriceStore, fetch_day, normalize_commodity, sync_prices
+
+TODAY = date(2024, 3, 10)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PriceStore(str(tmp_path / 'prices.sqlite3'))
+
+
+def test_normalize_commodity_matches_exact_names():
+    assert normalize_commodity('Arhar (Tur/Red Gram)(Whole)') == 'tur'
+    assert normalize_commodity('Bengal Gram(Gram)(Whole)') == 'gram'
+    assert normalize_commodity(' wheat ') == 'wheat'
+    assert normalize_commodity('Soyabean') == 'soybean'
+    assert normalize_commodity('Wheat Atta') is None
+    assert normalize_commodity('Onion') is None
+    assert normalize_commodity(None) is None
+
+
+def test_tur_and_gram_stored_separately(store):
+    records = [r for r in generate_records(days=3, end=TODAY) if 'Gram' in r['commodity']]
+    store.upsert_records(records)
+    assert store.commodities() == ['gram', 'tur']
+    names = {entry['name'] for entry in store.summary(days=3)}
+    assert names == {'gram', 'tur'}
+
+
+def test_fetch_day_follows_short_pages_to_total():
+    # Capped like the sample key: 10 records per request whatever the limit asks for
+    stub = AgmarknetStub(records=generate_records(days=2, end=TODAY), max_limit=10).start()
+    try:
+        records = fetch_day(stub.url, 'test-key', TODAY, page_size=500)
+    finally:
+        stub.stop()
+    expected = [r for r in generate_records(days=2, end=TODAY) if r['arrival_date'] == '10/03/2024']
+    assert len(records) == len(expected) == 40
+    assert stub.requests == 4
+
+
+def test_fetch_day_stops_on_empty_page_without_total(monkeypatch):
+    pages = [{'records': [{'n': i} for i in range(10)]}, {'records': [{'n': 10}]}, {'records': []}]
+    calls = []
+
+    class Response:
+        status_code = 200
+
+        def __init__(self, payload):
+            self.payload = payload
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return self.payload
+
+    class Session:
+        def get(self, url, params, timeout):
+            calls.append(params['offset'])
+            return Response(pages[len(calls) - 1])
+
+    records = fetch_day('http://stub', 'key', TODAY, page_size=500, session=Session())
+    assert len(records) == 11
+    assert calls == [0, 10, 11]
+
+
+def test_sync_prices_is_incremental(store):
+    stub = AgmarknetStub(records=generate_records(days=5, end=TODAY), max_limit=10).start()
+    try:
+        result = sync_prices(store, stub.url, 'test-key', backfill_days=5, today=TODAY)
+        assert result['stored'] == 5 * 8 * 4  # days x tracked commodities x markets
+        assert store.watermark == TODAY.isoformat()
+        requests_after_backfill = stub.requests
+        sync_prices(store, stub.url, 'test-key', backfill_days=5, today=TODAY)
+        assert stub.requests - requests_after_backfill < requests_after_backfill
+    finally:
+        stub.stop()
+
+
+def test_rows_are_rekeyed_when_the_mapping_changes(tmp_path):
+    path = str(tmp_path / 'prices.sqlite3')
+    store = PriceStore(path)
+    store.upsert_records([r for r in generate_records(days=1, end=TODAY) if r['commodity'].startswith('Arhar')])
+    with store._connect() as conn:
+        conn.execute("UPDATE prices SET commodity_key = 'gram'")
+        conn.execute("INSERT INTO prices VALUES ('onion', 'Onion', '', '', 'Khanna', '', '', '2024-03-10', 1, 1, 1)")
+        conn.execute("DELETE FROM sync_state WHERE key = 'commodity_keys'")
+
+    assert PriceStore(path).commodities() == ['tur']
+
+
+def test_only_one_process_holds_the_sync_lock(tmp_path):
+    path = str(tmp_path / 'prices.sqlite3.sync.lock')
+    first = try_file_lock(path)
+    assert first is not None
+    assert try_file_lock(path) is None
+    first.close()
+    second = try_file_lock(path)
+    assert second is not None
+    second.close()
+
+
+def test_fetch_day_raises_on_http_error():
+    stub = AgmarknetStub(days=1, fail_rate=1.0).start()
+    try:
+        with pytest.raises(requests.HTTPError):
+            fetch_day(stub.url, 'test-key', TODAY)
+    finally:
+        stub.stop()
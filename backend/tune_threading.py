@@ -0,0 +1,168 @@
+"""
+Threading auto-tuner
+Sweeps gunicorn worker counts, intra/inter-op thread pools and CPU pinning with the serving
+benchmark on this host, then writes the fastest setting to data/threading.json, which app.py
+picks up at startup (INFERENCE_TUNED_CONFIG)
+
+Usage:
+    python tune_threading.py                                    # full sweep, /predict for 20s each
+    python tune_threading.py --workers 2 4 --intra-op 1 2 --duration 30 --max-p99-ms 500
+    python tune_threading.py --model trained_model_tf215.keras --corpus ~/leaf_photos --dry-run
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from agmarknet_stub import AgmarknetStub
+from benchmark_server import (BACKEND_DIR, BackendServer, build_fixed_model, drive, git_revision,
+                              load_corpus, make_request_fn, server_env, summarize)
+from runtime_config import available_cpus
+
+DEFAULT_OUTPUT = os.path.join(BACKEND_DIR, 'data', 'threading.json')
+
+
+def candidate_configs(cpus, workers=None, intra_op=None, inter_op=None, affinity=None):
+    """
+    Settings worth trying on a host with `cpus` cores. By default: powers of two
+    up to the core count for workers, a full and a half share of the cores for
+    the intra-op pool, one or two inter-op threads, pinned and unpinned.
+    """
+    worker_counts = workers or sorted({w for w in (1, 2, 4, 8, 16) if w <= cpus} | {cpus})
+    candidates = []
+    for w in worker_counts:
+        share = max(1, cpus // w)
+        intra_counts = intra_op or sorted({share, max(1, share // 2)})
+        inter_counts = inter_op or [1, 2]
+        pinning = affinity if affinity is not None else ([False, True] if w > 1 else [False])
+        for intra, inter, pin in itertools.product(intra_counts, inter_counts, pinning):
+            candidates.append({'workers': w, 'intra_op': intra, 'inter_op': inter, 'affinity': pin})
+    return candidates
+
+
+def score(result, max_p99_ms=None):
+    """Images per second, or None if the run had errors or missed the latency target"""
+    if result['error_rate'] > 0 or not result.get('latency_ms_p99'):
+        return None
+    if max_p99_ms and result['latency_ms_p99'] > max_p99_ms:
+        return None
+    return result['throughput_images_per_sec']
+
+
+def run_candidate(config, env, args, corpus, workdir):
+    run_env = dict(env, **{
+        'INFERENCE_WORKERS': str(config['workers']),
+        'INFERENCE_THREADS': str(config['intra_op']),
+        'INFERENCE_INTER_OP_THREADS': str(config['inter_op']),
+        'INFERENCE_CPU_AFFINITY': 'true' if config['affinity'] else 'false',
+        'INFERENCE_TUNED_CONFIG': '',  # measure the candidate, not a previous result
+    })
+    label = 'w{workers}-intra{intra_op}-inter{inter_op}{pin}'.format(pin='-pinned' if config['affinity'] else '', **config)
+    server = BackendServer('gunicorn', run_env, config['workers'], args.threads,
+                           log_path=os.path.join(workdir, f'{label}.log')).start()
+    try:
+        result = {'config': config}
+        for endpoint in args.endpoints:
+            request_fn = make_request_fn(endpoint, server.url, corpus, args.batch_files)
+            drive(request_fn, 1, 0, args.warmup)
+            latencies, statuses, wall = drive(request_fn, args.concurrency, args.duration, 0)
+            items = args.batch_files if endpoint == 'predict-batch' else 1
+            result[endpoint] = summarize(latencies, statuses, wall, [], items)
+    finally:
+        server.stop()
+
+    scores = [score(result[endpoint], args.max_p99_ms) for endpoint in args.endpoints]
+    result['score'] = None if None in scores else round(sum(scores) / len(scores), 2)
+    return label, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the fastest inference threading setup for this host')
+    parser.add_argument('--workers', type=int, nargs='+', help='gunicorn worker counts to try')
+    parser.add_argument('--intra-op', type=int, nargs='+', help='Intra-op thread counts to try')
+    parser.add_argument('--inter-op', type=int, nargs='+', help='Inter-op thread counts to try')
+    parser.add_argument('--affinity', choices=['both', 'on', 'off'], default='both', help='CPU pinning to try')
+    parser.add_argument('--endpoints', nargs='+', default=['predict'], choices=['predict', 'predict-batch'])
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per endpoint and setting')
+    parser.add_argument('--warmup', type=int, default=5, help='Unrecorded requests per endpoint')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--max-p99-ms', type=float, help='Reject settings whose p99 latency exceeds this')
+    parser.add_argument('--model', help='Model to serve (default: a small fixed CNN)')
+    parser.add_argument('--corpus', help='Directory of JPEG/PNG uploads (default: synthetic photos)')
+    parser.add_argument('--image-size', type=int, nargs=2, default=[4000, 3000], metavar=('W', 'H'))
+    parser.add_argument('--batch-files', type=int, default=10, help='Files per /predict/batch request')
+    parser.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE', help='Extra server environment')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Where to write the best setting')
+    parser.add_argument('--dry-run', action='store_true', help='Print the result without writing it')
+    args = parser.parse_args()
+
+    cpus = available_cpus()
+    affinity = {'both': None, 'on': [True], 'off': [False]}[args.affinity]
+    candidates = candidate_configs(cpus, args.workers, args.intra_op, args.inter_op, affinity)
+    print(f"Tuning {len(candidates)} settings on {cpus} CPUs "
+          f"(~{len(candidates) * len(args.endpoints) * args.duration / 60:.0f} min of load)")
+
+    workdir = tempfile.mkdtemp(prefix='agrishield-tune-')
+    stub = AgmarknetStub(latency_ms=0).start()
+    results = {}
+    try:
+        model_path = args.model or build_fixed_model(os.path.join(workdir, 'bench_model.keras'))
+        corpus = load_corpus(args.corpus, workdir, tuple(args.image_size))
+        env = server_env(stub, model_path, workdir)
+        env.update(dict(item.split('=', 1) for item in args.env))
+
+        for config in candidates:
+            try:
+                label, result = run_candidate(config, env, args, corpus, workdir)
+            except RuntimeError as e:
+                print(f"  ⚠ {config}: {e}")
+                continue
+            results[label] = result
+            r = result[args.endpoints[0]]
+            print(f"  {label:>28}: {r['throughput_images_per_sec']:>8.1f} img/s  "
+                  f"p50 {r.get('latency_ms_p50', 0):>8.1f} ms  p99 {r.get('latency_ms_p99', 0):>8.1f} ms  "
+                  f"errors {r['error_rate']:.1%}  score {result['score']}")
+    finally:
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    scored = [(label, r) for label, r in results.items() if r['score'] is not None]
+    if not scored:
+        raise SystemExit("❌ No setting completed without errors (or within --max-p99-ms)")
+    best_label, best = max(scored, key=lambda item: item[1]['score'])
+
+    report = {
+        'config': best['config'],
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': platform.node(),
+            'cpus': cpus,
+            'endpoints': args.endpoints,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'max_p99_ms': args.max_p99_ms,
+        },
+        'results': results,
+    }
+    print(f"\n✅ Best: {best_label} ({best['score']} img/s) - start gunicorn with -w {best['config']['workers']}")
+    if args.dry_run:
+        print(json.dumps(report['config'], indent=2))
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    tmp_path = args.output + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, args.output)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
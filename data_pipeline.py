@@ -0,0 +1,163 @@
+"""
+tf.data input pipeline for training
+Lists a class-per-folder image directory (like image_dataset_from_directory) and decodes the
+images in parallel into uint8 128x128 tensors, optionally cached in memory or on disk, then
+batches, normalizes and prefetches them so the model never waits on JPEG decoding.
+Directories compiled with backend/dataset_shards.py are streamed from their shards instead.
+"""
+
+import glob
+import os
+
+import tensorflow as tf
+
+from backend.dataset_shards import ShardedImageSet, is_shard_dir
+
+IMAGE_SIZE = (128, 128)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def list_image_files(directory, class_names=None):
+    """
+    (paths, labels, class_names) for a directory with one sub-folder per class.
+    Classes are sorted alphabetically and files by name, so label indices and
+    file order are the same on every run and every machine.
+    """
+    if class_names is None:
+        class_names = sorted(entry.name for entry in os.scandir(directory) if entry.is_dir())
+    if not class_names:
+        raise ValueError(f"No class folders found in '{directory}'")
+    paths, labels = [], []
+    for label, class_name in enumerate(class_names):
+        class_dir = os.path.join(directory, class_name)
+        for root, _, files in sorted(os.walk(class_dir)):
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(root, name))
+                    labels.append(label)
+    if not paths:
+        raise ValueError(f"No images found in '{directory}'")
+    return paths, labels, list(class_names)
+
+
+def decode_image(path, image_size=IMAGE_SIZE):
+    """Read and decode one image file to a (H, W, 3) uint8 tensor, resizing only if needed"""
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    height, width = image_size
+
+    def resize():
+        resized = tf.image.resize(image, image_size, method='bilinear')
+        return tf.cast(tf.clip_by_value(tf.round(resized), 0, 255), tf.uint8)
+
+    image = tf.cond(tf.logical_and(tf.shape(image)[0] == height, tf.shape(image)[1] == width),
+                    lambda: image, resize)
+    image.set_shape((height, width, 3))
+    return image
+
+
+def normalize_batch(num_classes):
+    """uint8 images and integer labels -> float32 images in [0, 1] and one-hot labels"""
+    def normalize(images, labels):
+        return tf.cast(images, tf.float32) / 255.0, tf.one_hot(labels, num_classes)
+    return normalize
+
+
+def dataset_class_names(directory):
+    """Class names of an image directory or shard directory, in label order"""
+    if is_shard_dir(directory):
+        return ShardedImageSet(directory).class_names
+    return sorted(entry.name for entry in os.scandir(directory) if entry.is_dir())
+
+
+def make_dataset(directory, batch_size=32, image_size=IMAGE_SIZE, shuffle=True, seed=None,
+                 cache=None, class_names=None, shuffle_buffer=2048, deterministic=True,
+                 num_shards=1, shard_index=0):
+    """
+    Batched (images, one-hot labels) dataset for a class-per-folder directory.
+
+    Images are decoded with AUTOTUNE parallelism into uint8 tensors (a quarter
+    of the float32 size, which is what `cache` keeps: 'memory' or the path
+    prefix of an on-disk cache). Normalization runs once per batch. Without a
+    cache the file list is reshuffled every epoch before decoding; with one,
+    the file list is shuffled once (seeded) before caching and the decoded
+    images are reshuffled through a `shuffle_buffer` every epoch. Returns
+    (dataset, class_names).
+
+    A compiled shard directory is read from its memory-mapped shards
+    (already decoded, so `cache` does not apply), shuffled across all shards.
+    What an interrupted run left of an on-disk cache is deleted first
+    (see clear_partial_cache()), so a resumed run can write it again.
+
+    With `num_shards` > 1 (one per training worker) only every
+    `num_shards`-th image from `shard_index` is read (up to num_shards - 1
+    images are left out so the parts are equal), and tf.data's own
+    auto-sharding is turned off so nothing is decoded only to be dropped.
+    """
+    if is_shard_dir(directory):
+        return make_shard_dataset(directory, batch_size, image_size, shuffle, seed, class_names,
+                                  num_shards, shard_index)
+
+    paths, labels, class_names = list_image_files(directory, class_names)
+    if num_shards > 1:
+        # Equal parts, so every worker runs the same number of steps (collectives would wait forever otherwise)
+        usable = len(paths) // num_shards * num_shards
+        paths, labels = paths[shard_index:usable:num_shards], labels[shard_index:usable:num_shards]
+    dataset = tf.data.Dataset.from_tensor_slices((paths, tf.constant(labels, tf.int32)))
+
+    if shuffle:
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=cache is None)
+    dataset = dataset.map(lambda path, label: (decode_image(path, image_size), label),
+                          num_parallel_calls=tf.data.AUTOTUNE, deterministic=deterministic)
+    if cache is not None:
+        if cache != 'memory':
+            os.makedirs(os.path.dirname(os.path.abspath(cache)), exist_ok=True)
+            clear_partial_cache(cache)
+        dataset = dataset.cache('' if cache == 'memory' else cache)
+        if shuffle:
+            dataset = dataset.shuffle(min(shuffle_buffer, len(paths)), seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(normalize_batch(len(class_names)), num_parallel_calls=tf.data.AUTOTUNE,
+                          deterministic=deterministic)
+
+    options = tf.data.Options()
+    options.deterministic = deterministic
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+    dataset = dataset.with_options(options)
+    return dataset.prefetch(tf.data.AUTOTUNE), class_names
+
+
+def make_shard_dataset(directory, batch_size=32, image_size=IMAGE_SIZE, shuffle=True, seed=None,
+                       class_names=None, num_shards=1, shard_index=0):
+    """make_dataset() for a shard directory; `num_shards` / `shard_index` select one worker's part"""
+    shards = ShardedImageSet(directory)
+    if shards.image_size != tuple(image_size):
+        raise ValueError(f"'{directory}' holds {shards.image_size} images, expected {tuple(image_size)}")
+    if class_names is not None and list(class_names) != shards.class_names:
+        raise ValueError(f"Classes in '{directory}' differ from the training classes")
+    dataset = shards.to_tf_dataset(batch_size, shuffle, seed, num_shards, shard_index)
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.OFF
+    return dataset.with_options(options), shards.class_names
+
+
+def clear_partial_cache(prefix):
+    """
+    Delete the files of an on-disk tf.data cache that was never completed. tf.data writes
+    `<prefix>.index` only after a full pass; a process that died before that leaves
+    `<prefix>_0.lockfile` (and partial data) behind, and every later run then fails with
+    "cache lockfile already exists". Returns the number of files removed.
+    """
+    if os.path.exists(prefix + '.index'):
+        return 0
+    leftovers = glob.glob(glob.escape(prefix) + '_*')
+    for path in leftovers:
+        os.remove(path)
+    if leftovers:
+        print(f"⚠ Removed {len(leftovers)} files of an interrupted cache at {prefix}")
+    return len(leftovers)
+
+
+def cache_path(cache_dir, split, image_size=IMAGE_SIZE):
+    """On-disk cache prefix for a split; the image size is part of the name so a resize never reads a stale cache"""
+    return os.path.join(cache_dir, f"{split}_{image_size[0]}x{image_size[1]}")
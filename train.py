@@ -1,82 +1,428 @@
+"""
+Train the AgriShield disease classification CNN on the train/ and valid/ image folders
+
+Usage:
+    python train.py                                   # up to 10 epochs, best epoch -> trained_model_tf215.keras
+    python train.py --output AgriShield.keras         # ... for the Streamlit app (main.py)
+    python train.py --cache memory --epochs 20        # decode every image once, keep it in RAM
+    python train.py --cache .tf_cache                 # ... or in cache files on disk
+    python train.py --train-dir shards/train --valid-dir shards/valid   # pre-decoded shards (backend/dataset_shards.py)
+    python train.py --probe-steps 50                  # input pipeline vs. training step throughput only
+    python train.py --fast [--xla]                    # bfloat16 mixed precision where the CPU has it [+ XLA]
+    python train.py --compare [--xla] --epochs 5 --target-accuracy 0.9   # baseline vs. fast, to training_comparison.json
+
+Training checkpoints the model and optimizer to --checkpoint-dir after every epoch (or every
+--checkpoint-every batches); rerunning the same command resumes from the latest checkpoint, and
+once a run has finished a rerun only re-exports its best epoch. --restart starts over. A --cache
+directory that a crash left half-written is cleared and written again by the resumed run.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+
 import tensorflow as tf
-import matplotlib.pyplot as plt
-import pandas as pd
-import seaborn as sns
-def preprocess_image(image, label):
-    image = tf.image.resize(image, (128, 128))  # Resize image
-    image = image / 255.0  # Normalize image
-    return image, label
-training_set = tf.keras.utils.image_dataset_from_directory(
-    'train',
-    labels="inferred",
-    label_mode="categorical",
-    class_names=None,
-    color_mode="rgb",
-    batch_size=32,
-    image_size=(128, 128),
-    shuffle=True,
-    seed=None,
-    validation_split=None,
-    subset=None,
-    interpolation="bilinear",
-    follow_links=False,
-    crop_to_aspect_ratio=False
-)
-validation_set = tf.keras.utils.image_dataset_from_directory(
-    'valid',
-    labels="inferred",
-    label_mode="categorical",
-    class_names=None,
-    color_mode="rgb",
-    batch_size=32,
-    image_size=(128, 128),
-    shuffle=True,
-    seed=None,
-    validation_split=None,
-    subset=None,
-    interpolation="bilinear",
-    follow_links=False,
-    crop_to_aspect_ratio=False
-)
-training_set
-training_set = training_set.map(preprocess_image)
-validation_set = validation_set.map(preprocess_image)
-from tensorflow.keras.layers import Dense,Conv2D,MaxPool2D,Flatten,Dropout
+from tensorflow.keras.layers import Dense, Conv2D, MaxPool2D, Flatten, Dropout
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-model = Sequential()
-model.add(Conv2D(filters=32,kernel_size=3,padding='same',activation='relu',input_shape=[128,128,3]))
-model.add(Conv2D(filters=32,kernel_size=3,activation='relu'))
-model.add(MaxPool2D(pool_size=2,strides=2))
-model.add(Conv2D(filters=64,kernel_size=3,padding='same',activation='relu'))
-model.add(Conv2D(filters=64,kernel_size=3,activation='relu'))
-model.add(MaxPool2D(pool_size=2,strides=2))
-model.add(Conv2D(filters=128,kernel_size=3,padding='same',activation='relu'))
-model.add(Conv2D(filters=128,kernel_size=3,activation='relu'))
-model.add(MaxPool2D(pool_size=2,strides=2))
-model.add(Conv2D(filters=256,kernel_size=3,padding='same',activation='relu'))
-model.add(Conv2D(filters=256,kernel_size=3,activation='relu'))
-model.add(MaxPool2D(pool_size=2,strides=2))
-model.add(Conv2D(filters=512,kernel_size=3,padding='same',activation='relu'))
-model.add(Conv2D(filters=512,kernel_size=3,activation='relu'))
-model.add(MaxPool2D(pool_size=2,strides=2))
-model.add(Dropout(0,25))
-model.add(Flatten())
-model.add(Dense(units=1500,activation='relu'))
-model.add(Dropout(0.4))
-#Output Lyaer
-model.add(Dense(units=23,activation='softmax'))
-import tensorflow as tf
 
-model.compile(
-    optimizer=tf.keras.optimizers.Adam(learning_rate=0.0001),
-    loss='categorical_crossentropy',
-    metrics=['accuracy']
-)
-model.summary()
-training_history = model.fit(x=training_set, validation_data=validation_set, epochs=10)
-model.save("AgriShield.keras")
-#Recording history in json 
-import json
-with open('training_hist.open','w') as f:
-    json.dump(training_history.history,f)
\ No newline at end of file
+from data_pipeline import IMAGE_SIZE, cache_path, make_dataset
+
+PRECISIONS = ('float32', 'mixed_bfloat16', 'mixed_float16')
+
+
+def build_model(input_shape=(128, 128, 3), num_classes=23):
+    model = Sequential()
+    model.add(Conv2D(filters=32, kernel_size=3, padding='same', activation='relu', input_shape=input_shape))
+    model.add(Conv2D(filters=32, kernel_size=3, activation='relu'))
+    model.add(MaxPool2D(pool_size=2, strides=2))
+    model.add(Conv2D(filters=64, kernel_size=3, padding='same', activation='relu'))
+    model.add(Conv2D(filters=64, kernel_size=3, activation='relu'))
+    model.add(MaxPool2D(pool_size=2, strides=2))
+    model.add(Conv2D(filters=128, kernel_size=3, padding='same', activation='relu'))
+    model.add(Conv2D(filters=128, kernel_size=3, activation='relu'))
+    model.add(MaxPool2D(pool_size=2, strides=2))
+    model.add(Conv2D(filters=256, kernel_size=3, padding='same', activation='relu'))
+    model.add(Conv2D(filters=256, kernel_size=3, activation='relu'))
+    model.add(MaxPool2D(pool_size=2, strides=2))
+    model.add(Conv2D(filters=512, kernel_size=3, padding='same', activation='relu'))
+    model.add(Conv2D(filters=512, kernel_size=3, activation='relu'))
+    model.add(MaxPool2D(pool_size=2, strides=2))
+    model.add(Dropout(0.25))
+    model.add(Flatten())
+    model.add(Dense(units=1500, activation='relu'))
+    model.add(Dropout(0.4))
+    # Output layer, kept in float32 under mixed precision so the softmax and the loss are computed in float32
+    model.add(Dense(units=num_classes, activation='softmax', dtype='float32'))
+    return model
+
+
+def compile_model(model, learning_rate=0.0001, precision='float32', xla=False):
+    optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
+    if precision == 'mixed_float16':
+        # float16 gradients underflow without loss scaling; bfloat16 has float32's exponent range and needs none
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+    model.compile(
+        optimizer=optimizer,
+        loss='categorical_crossentropy',
+        metrics=['accuracy'],
+        jit_compile=xla
+    )
+    return model
+
+
+def create_model(num_classes, learning_rate=0.0001, precision='float32', xla=False):
+    """Build and compile the CNN with `precision` as the Keras dtype policy and optionally an XLA-compiled train step"""
+    tf.keras.mixed_precision.set_global_policy(precision)
+    return compile_model(build_model(IMAGE_SIZE + (3,), num_classes), learning_rate, precision, xla)
+
+
+def float32_copy(model):
+    """
+    The same model with float32 layers, for serving. Mixed-precision layers
+    keep their weights in float32 already, so they are copied over as is.
+    """
+    tf.keras.mixed_precision.set_global_policy('float32')
+    copy = build_model(tuple(model.input_shape[1:]), int(model.output_shape[-1]))
+    copy.set_weights(model.get_weights())
+    return copy
+
+
+def cpu_supports_bfloat16():
+    """True if the CPU has native bfloat16 instructions (AVX512-BF16 or AMX); elsewhere bfloat16 is emulated and slower"""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def fast_precision():
+    """Dtype policy for --fast: bfloat16 mixed precision only where the CPU computes bfloat16 natively"""
+    if cpu_supports_bfloat16():
+        return 'mixed_bfloat16'
+    print("⚠ This CPU has no native bfloat16; fast mode keeps float32")
+    return 'float32'
+
+
+class TrainingSpeed(tf.keras.callbacks.Callback):
+    """
+    Training steps per second (validation excluded) per epoch, and the wall
+    time from the start of fit() until val_accuracy first reaches `target_accuracy`.
+    """
+
+    def __init__(self, target_accuracy=None):
+        super().__init__()
+        self.target_accuracy = target_accuracy
+        self.epoch_steps_per_sec = []
+        self.time_to_target = None
+        self._epoch_started = None
+
+    def on_train_begin(self, logs=None):
+        self.started = time.perf_counter()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_started = time.perf_counter()
+        self._epoch_steps = 0
+        self._train_seconds = None
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._epoch_steps += 1
+
+    def on_test_begin(self, logs=None):
+        # fit() validates at the end of each epoch: that is where the training part ends
+        if self._epoch_started is not None and self._train_seconds is None:
+            self._train_seconds = time.perf_counter() - self._epoch_started
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = self._train_seconds or (time.perf_counter() - self._epoch_started)
+        self.epoch_steps_per_sec.append(round(self._epoch_steps / seconds, 3))
+        accuracy = (logs or {}).get('val_accuracy')
+        if (self.target_accuracy is not None and self.time_to_target is None
+                and accuracy is not None and accuracy >= self.target_accuracy):
+            self.time_to_target = round(time.perf_counter() - self.started, 1)
+
+    def report(self):
+        # The first epoch includes tracing (and XLA compilation), so it is reported separately
+        steady = self.epoch_steps_per_sec[1:] or self.epoch_steps_per_sec
+        return {
+            'steps_per_sec': round(sum(steady) / len(steady), 3) if steady else None,
+            'steps_per_sec_first_epoch': self.epoch_steps_per_sec[0] if self.epoch_steps_per_sec else None,
+            'epoch_steps_per_sec': self.epoch_steps_per_sec,
+            'target_accuracy': self.target_accuracy,
+            'seconds_to_target': self.time_to_target,
+            'wall_seconds': round(time.perf_counter() - self.started, 1),
+        }
+
+
+def images_per_second(batches, steps, warmup=3):
+    """Iterate `steps` batches after `warmup` untimed ones; images per second"""
+    iterator = iter(batches)
+    for _ in range(warmup):
+        next(iterator)
+    images = 0
+    started = time.perf_counter()
+    for _ in range(steps):
+        batch = next(iterator)
+        images += int(tf.shape(batch[0])[0])
+    return images / (time.perf_counter() - started)
+
+
+def probe_throughput(model, dataset, steps=50):
+    """
+    Images/sec of the input pipeline alone, of the training step alone (one
+    in-memory batch replayed) and of both together. Training is input-bound
+    when the pipeline alone is slower than the step alone.
+    """
+    batch = next(iter(dataset))
+
+    def step_only():
+        for _ in range(steps + 3):
+            model.train_on_batch(*batch)
+            yield batch
+
+    def end_to_end():
+        for images, labels in dataset.repeat():
+            model.train_on_batch(images, labels)
+            yield images, labels
+
+    report = {
+        'input_pipeline': images_per_second(dataset.repeat(), steps),
+        'train_step': images_per_second(step_only(), steps),
+        'end_to_end': images_per_second(end_to_end(), steps),
+    }
+    print(f"\nInput pipeline only: {report['input_pipeline']:>8.1f} img/s")
+    print(f"Training step only:  {report['train_step']:>8.1f} img/s")
+    print(f"End to end:          {report['end_to_end']:>8.1f} img/s")
+    bound = 'input' if report['input_pipeline'] < report['train_step'] else 'compute'
+    print(f"→ training is {bound}-bound")
+    return report
+
+
+def train(training_set, validation_set, num_classes, epochs, learning_rate=0.0001, precision='float32',
+          xla=False, seed=123, target_accuracy=None, callbacks=()):
+    """Fit a fresh model; returns (model, history, TrainingSpeed)"""
+    tf.keras.backend.clear_session()
+    tf.keras.utils.set_random_seed(seed)
+    model = create_model(num_classes, learning_rate, precision, xla)
+    speed = TrainingSpeed(target_accuracy)
+    history = model.fit(x=training_set, validation_data=validation_set, epochs=epochs,
+                        callbacks=[speed, *callbacks])
+    return model, history, speed
+
+
+def compare_modes(datasets, epochs, learning_rate, seed, target_accuracy, xla=False, report_path=None):
+    """
+    Train the baseline (float32) and the fast mode (plus XLA if `xla`) from
+    the same seed on the same data and report steps/sec, time to
+    `target_accuracy` and final accuracy. `datasets()` returns fresh
+    (training_set, validation_set, class_names).
+    """
+    modes = {'baseline': ('float32', False), 'fast': (fast_precision(), xla)}
+    report = {}
+    for name, (precision, jit_compile) in modes.items():
+        print(f"\n=== {name}: {precision}{' + XLA' if jit_compile else ''} ===")
+        training_set, validation_set, class_names = datasets()
+        _, history, speed = train(training_set, validation_set, len(class_names), epochs, learning_rate,
+                                  precision, jit_compile, seed, target_accuracy)
+        report[name] = {'precision': precision, 'xla': jit_compile, **speed.report(),
+                        'final_val_accuracy': round(float(history.history['val_accuracy'][-1]), 4)}
+
+    print(f"\n{'mode':>10} {'precision':>15} {'XLA':>4} {'steps/s':>8} {'1st epoch':>10} "
+          f"{'to target':>10} {'val acc':>8} {'wall':>8}")
+    for name, r in report.items():
+        to_target = f"{r['seconds_to_target']:.0f}s" if r['seconds_to_target'] is not None else 'never'
+        print(f"{name:>10} {r['precision']:>15} {'yes' if r['xla'] else 'no':>4} {r['steps_per_sec']:>8.2f} "
+              f"{r['steps_per_sec_first_epoch']:>10.2f} {to_target:>10} {r['final_val_accuracy']:>8.2%} "
+              f"{r['wall_seconds']:>7.0f}s")
+    if report['baseline']['steps_per_sec']:
+        print(f"→ fast mode: {report['fast']['steps_per_sec'] / report['baseline']['steps_per_sec']:.2f}x "
+              "the baseline training steps/sec")
+
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Comparison saved to: {report_path}")
+    return report
+
+
+class HistoryFile(tf.keras.callbacks.Callback):
+    """
+    Per-epoch metrics written to `path` after every epoch, in the layout of
+    History.history plus an 'epoch' list. With `resume`, the epochs already
+    in the file are kept and an epoch that is trained again replaces its entry.
+    """
+
+    def __init__(self, path, resume=False):
+        super().__init__()
+        self.path = path
+        self.epochs = {}
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                history = json.load(f)
+            for i, epoch in enumerate(history.get('epoch', [])):
+                self.epochs[epoch] = {key: values[i] for key, values in history.items()
+                                      if key != 'epoch' and values[i] is not None}
+
+    def best(self, monitor):
+        values = [record[monitor] for record in self.epochs.values() if monitor in record]
+        return max(values) if values else None
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epochs[epoch] = {key: float(value) for key, value in (logs or {}).items()}
+        epochs = sorted(self.epochs)
+        keys = sorted({key for record in self.epochs.values() for key in record})
+        history = {'epoch': epochs, **{key: [self.epochs[e].get(key) for e in epochs] for key in keys}}
+        write_json(self.path, history)
+
+
+def write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def training_callbacks(checkpoint_dir, history_path, monitor='val_accuracy', checkpoint_every=None,
+                       patience=3, lr_patience=2, lr_factor=0.5, min_lr=1e-6):
+    """
+    Callbacks for a resumable run, plus the EarlyStopping one (to tell why fit() ended):
+      <checkpoint_dir>/backup/     model + optimizer + epoch, restored automatically by fit()
+      <checkpoint_dir>/best.keras  the epoch with the best `monitor` so far
+    After a resume, the best value so far (from the history file) is what
+    later epochs have to beat, for both the best-epoch checkpoint and early stopping.
+    """
+    backup_dir = os.path.join(checkpoint_dir, 'backup')
+    resume = os.path.isdir(backup_dir)
+    history = HistoryFile(history_path, resume)
+    best_so_far = history.best(monitor) if resume else None
+    if best_so_far is not None:
+        print(f"✓ Resuming from {backup_dir} (best {monitor} so far {best_so_far:.4f})")
+
+    early_stopping = tf.keras.callbacks.EarlyStopping(monitor=monitor, mode='max', patience=patience,
+                                                      baseline=best_so_far, verbose=1)
+    callbacks = [
+        tf.keras.callbacks.BackupAndRestore(backup_dir, save_freq=checkpoint_every or 'epoch',
+                                            delete_checkpoint=False),
+        tf.keras.callbacks.ModelCheckpoint(os.path.join(checkpoint_dir, 'best.keras'), monitor=monitor, mode='max',
+                                           save_best_only=True, initial_value_threshold=best_so_far),
+        early_stopping,
+        tf.keras.callbacks.ReduceLROnPlateau(monitor=monitor, mode='max', factor=lr_factor, patience=lr_patience,
+                                             min_lr=min_lr, verbose=1),
+        history,  # last, so it records the learning rate ReduceLROnPlateau adds to the logs
+    ]
+    return callbacks, early_stopping
+
+
+def export_best(checkpoint_dir, output):
+    """Write the best epoch as a float32 .keras model (what backend/app.py loads), atomically"""
+    model = float32_copy(tf.keras.models.load_model(os.path.join(checkpoint_dir, 'best.keras'), compile=False))
+    root, extension = os.path.splitext(output)
+    tmp_path = f"{root}.part{extension}"
+    model.save(tmp_path)
+    os.replace(tmp_path, output)
+    print(f"✅ Best epoch exported to: {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the AgriShield disease classification CNN')
+    parser.add_argument('--train-dir', default='train', help='Training images (one folder per class) or shards')
+    parser.add_argument('--valid-dir', default='valid', help='Validation images (one folder per class) or shards')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--learning-rate', type=float, default=0.0001)
+    parser.add_argument('--cache', help="Cache decoded images: 'memory' or a directory for cache files")
+    parser.add_argument('--seed', type=int, default=123, help='Seed for weights, shuffling and dropout')
+    parser.add_argument('--deterministic-ops', action='store_true',
+                        help='Also make TF ops deterministic (bit-identical reruns, slower)')
+    parser.add_argument('--precision', choices=PRECISIONS, default='float32', help='Keras dtype policy')
+    parser.add_argument('--xla', action='store_true',
+                        help='Compile the train step with XLA (on CPU its convolutions bypass oneDNN: measure first)')
+    parser.add_argument('--fast', action='store_true',
+                        help='Fast mode: --precision mixed_bfloat16 if the CPU supports bfloat16 natively')
+    parser.add_argument('--compare', action='store_true',
+                        help='Train the baseline and the fast mode and compare them (no model is saved)')
+    parser.add_argument('--target-accuracy', type=float, default=0.9,
+                        help='Validation accuracy whose time-to-reach --compare reports')
+    parser.add_argument('--comparison-report', default='training_comparison.json')
+    parser.add_argument('--probe-steps', type=int, help='Only measure input vs. training throughput over N batches')
+    parser.add_argument('--output', default='trained_model_tf215.keras', help='Where to export the best epoch')
+    parser.add_argument('--checkpoint-dir', default='checkpoints', help='Checkpoints of this run (resumed if present)')
+    parser.add_argument('--checkpoint-every', type=int, help='Also checkpoint every N batches (default: every epoch)')
+    parser.add_argument('--restart', action='store_true', help='Discard the checkpoints and train from scratch')
+    parser.add_argument('--history', default='training_history.json', help='Per-epoch metrics')
+    parser.add_argument('--patience', type=int, default=3, help='Epochs without val_accuracy improvement before stopping')
+    parser.add_argument('--lr-patience', type=int, default=2, help='Epochs without improvement before halving the learning rate')
+    parser.add_argument('--min-lr', type=float, default=1e-6)
+    args = parser.parse_args()
+
+    tf.keras.utils.set_random_seed(args.seed)
+    if args.deterministic_ops:
+        tf.config.experimental.enable_op_determinism()
+    precision = fast_precision() if args.fast else args.precision
+
+    def cache_for(split):
+        if args.cache is None or args.cache == 'memory':
+            return args.cache
+        return cache_path(args.cache, split)
+
+    def datasets():
+        training_set, class_names = make_dataset(args.train_dir, args.batch_size, IMAGE_SIZE, shuffle=True,
+                                                 seed=args.seed, cache=cache_for('train'))
+        validation_set, _ = make_dataset(args.valid_dir, args.batch_size, IMAGE_SIZE, shuffle=False,
+                                         cache=cache_for('valid'), class_names=class_names)
+        return training_set, validation_set, class_names
+
+    if args.probe_steps:
+        training_set, class_names = make_dataset(args.train_dir, args.batch_size, IMAGE_SIZE, shuffle=True,
+                                                 seed=args.seed, cache=cache_for('train'))
+        model = create_model(len(class_names), args.learning_rate, precision, args.xla)
+        probe_throughput(model, training_set, args.probe_steps)
+        return
+
+    if args.compare:
+        compare_modes(datasets, args.epochs, args.learning_rate, args.seed, args.target_accuracy,
+                      args.xla, args.comparison_report)
+        return
+
+    if args.restart:
+        shutil.rmtree(args.checkpoint_dir, ignore_errors=True)
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+    finished_path = os.path.join(args.checkpoint_dir, 'finished.json')
+    finished = read_json(finished_path)
+    if finished and (finished['stopped_early'] or finished['epochs'] >= args.epochs):
+        print(f"✓ Training in {args.checkpoint_dir} already finished at epoch {finished['last_epoch']} "
+              f"(best val_accuracy {finished['best_val_accuracy']:.4f}); exporting it again")
+    else:
+        training_set, validation_set, class_names = datasets()
+        print(f"Training with {precision}{' and XLA' if args.xla else ''}")
+        callbacks, early_stopping = training_callbacks(args.checkpoint_dir, args.history,
+                                                       checkpoint_every=args.checkpoint_every,
+                                                       patience=args.patience, lr_patience=args.lr_patience,
+                                                       min_lr=args.min_lr)
+        model, _, _ = train(training_set, validation_set, len(class_names), args.epochs, args.learning_rate,
+                            precision, args.xla, args.seed, callbacks=callbacks)
+        model.summary()
+        history = read_json(args.history)
+        write_json(finished_path, {
+            'epochs': args.epochs,
+            'last_epoch': history['epoch'][-1] + 1,
+            'stopped_early': early_stopping.stopped_epoch > 0,
+            'best_val_accuracy': max(v for v in history['val_accuracy'] if v is not None),
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+    export_best(args.checkpoint_dir, args.output)
+
+
+if __name__ == '__main__':
+    main()
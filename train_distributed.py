@@ -0,0 +1,254 @@
+"""
+Multi-worker data-parallel training of the AgriShield CNN
+Trains train.py's model under MultiWorkerMirroredStrategy: every worker holds a replica of the model,
+reads its own shard of the data and all-reduces gradients with the others after each step.
+The cluster comes from TF_CONFIG (or --workers / --task-index, which build it).
+
+Usage:
+    # on every node, same command with its own --task-index (the first worker is the chief)
+    python train_distributed.py --workers node1:12345,node2:12345 --task-index 0 \\
+        --train-dir shards/train --valid-dir shards/valid
+    # TF_CONFIG already set by the scheduler
+    python train_distributed.py --train-dir shards/train --valid-dir shards/valid
+    # 2 worker processes on this machine (for testing)
+    python train_distributed.py --local 2 --epochs 1 --train-dir shards/train --valid-dir shards/valid
+    # scaling efficiency of 1, 2 and 4 local workers, to scaling_report.json
+    python train_distributed.py --scaling 1,2,4 --epochs 2 --train-dir shards/train --valid-dir shards/valid
+
+--batch-size is per worker; the global batch grows with the number of workers.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from backend.runtime_config import available_cpus, configure_threading
+
+
+def build_tf_config(workers, task_index):
+    return {'cluster': {'worker': list(workers)}, 'task': {'type': 'worker', 'index': int(task_index)}}
+
+
+def cluster_from_env():
+    """(worker addresses, this worker's index) from TF_CONFIG; a single local worker if it is unset"""
+    config = json.loads(os.environ.get('TF_CONFIG') or '{}')
+    workers = config.get('cluster', {}).get('worker') or []
+    return workers, int(config.get('task', {}).get('index', 0))
+
+
+def run_worker(args):
+    """Train as one worker of the cluster in TF_CONFIG; the chief saves the model and writes --result-file"""
+    workers, task_index = cluster_from_env()
+    num_workers = max(1, len(workers))
+    is_chief = task_index == 0
+    # Before TensorFlow starts its runtime: workers on one host split its cores
+    threading = configure_threading('keras', workers=args.processes_per_host, affinity=args.affinity)
+
+    import tensorflow as tf
+
+    if num_workers > 1 and getattr(tf.keras, '__version__', '2').startswith('3'):
+        # Keras 3's fit() cannot take the per-replica batches of a multi-worker strategy
+        raise SystemExit("❌ Multi-worker training needs Keras 2: TensorFlow 2.15, or a newer TensorFlow "
+                         "with tf_keras installed and TF_USE_LEGACY_KERAS=1")
+
+    from data_pipeline import IMAGE_SIZE, cache_path, dataset_class_names, make_dataset
+    from train import TrainingSpeed, create_model, fast_precision, float32_copy
+
+    # CPU workers all-reduce over gRPC with the ring implementation
+    strategy = tf.distribute.MultiWorkerMirroredStrategy(
+        communication_options=tf.distribute.experimental.CommunicationOptions(
+            implementation=tf.distribute.experimental.CommunicationImplementation.RING))
+    tf.keras.utils.set_random_seed(args.seed)
+    precision = fast_precision() if args.fast else args.precision
+    class_names = dataset_class_names(args.train_dir)
+    global_batch_size = args.batch_size * num_workers
+    print(f"Worker {task_index}/{num_workers}: {strategy.num_replicas_in_sync} replicas, "
+          f"global batch {global_batch_size}, {precision}, {threading['intra_op']} intra-op threads")
+
+    def dataset(directory, split, shuffle):
+        # Sharded here, one part per worker. Keras splits every batch of a worker's dataset
+        # across all replicas in the cluster, so batching at the global size gives each
+        # replica --batch-size images of its own worker's part per step
+        cache = args.cache
+        if cache is not None and cache != 'memory':
+            cache = cache_path(cache, f"{split}-{task_index}of{num_workers}")  # each worker caches its own part
+        dataset, _ = make_dataset(directory, global_batch_size, IMAGE_SIZE, shuffle=shuffle, seed=args.seed,
+                                  cache=cache, class_names=class_names, num_shards=num_workers,
+                                  shard_index=task_index)
+        return dataset
+
+    training_set = dataset(args.train_dir, 'train', shuffle=True)
+    validation_set = dataset(args.valid_dir, 'valid', shuffle=False) if args.valid_dir else None
+
+    with strategy.scope():
+        model = create_model(len(class_names), args.learning_rate, precision, args.xla)
+    speed = TrainingSpeed(args.target_accuracy)
+    history = model.fit(x=training_set, validation_data=validation_set, epochs=args.epochs, callbacks=[speed])
+
+    # Every worker saves (the variables may be read collectively); only the chief keeps its copy
+    output = args.output if is_chief else os.path.join(tempfile.mkdtemp(), os.path.basename(args.output))
+    if precision != 'float32':
+        model = float32_copy(model)
+    model.save(output)
+    if not is_chief:
+        shutil.rmtree(os.path.dirname(output), ignore_errors=True)
+        return
+    print(f"✅ Model saved to: {output}")
+
+    if args.result_file:
+        report = speed.report()
+        result = {
+            'workers': num_workers,
+            'global_batch_size': global_batch_size,
+            'precision': precision,
+            'intra_op_threads': threading['intra_op'],
+            **report,
+            'images_per_sec': round(report['steps_per_sec'] * global_batch_size, 2) if report['steps_per_sec'] else None,
+            'final_val_accuracy': (round(float(history.history['val_accuracy'][-1]), 4)
+                                   if 'val_accuracy' in history.history else None),
+        }
+        with open(args.result_file, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+def free_ports(count):
+    sockets = [socket.socket() for _ in range(count)]
+    for s in sockets:
+        s.bind(('localhost', 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def worker_argv(args):
+    """Command line for one worker process, forwarding the training options"""
+    argv = [sys.executable, os.path.abspath(__file__),
+            '--train-dir', args.train_dir, '--valid-dir', args.valid_dir,
+            '--epochs', str(args.epochs), '--batch-size', str(args.batch_size),
+            '--learning-rate', str(args.learning_rate), '--seed', str(args.seed),
+            '--precision', args.precision, '--target-accuracy', str(args.target_accuracy)]
+    for flag in ('fast', 'xla', 'affinity'):
+        if getattr(args, flag):
+            argv.append(f"--{flag}")
+    if args.cache:
+        argv += ['--cache', args.cache]
+    return argv
+
+
+def launch_local(args, num_workers, output, workdir):
+    """
+    Run `num_workers` worker processes on this machine as one cluster and
+    return the chief's result. Worker logs go to `workdir`; the chief's
+    output is shown.
+    """
+    addresses = [f"localhost:{port}" for port in free_ports(num_workers)]
+    result_file = os.path.join(workdir, f'result-{num_workers}.json')
+    processes, logs = [], []
+    for index in range(num_workers):
+        env = dict(os.environ, TF_CONFIG=json.dumps(build_tf_config(addresses, index)))
+        argv = worker_argv(args) + ['--processes-per-host', str(num_workers), '--output', output]
+        if index == 0:
+            argv += ['--result-file', result_file]
+            processes.append(subprocess.Popen(argv, env=env))
+        else:
+            log = open(os.path.join(workdir, f'worker-{num_workers}-{index}.log'), 'w')
+            logs.append(log)
+            processes.append(subprocess.Popen(argv, env=env, stdout=log, stderr=subprocess.STDOUT))
+    try:
+        codes = [process.wait() for process in processes]
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        for log in logs:
+            log.close()
+    if any(codes):
+        raise RuntimeError(f"Worker exit codes {codes} (worker logs in {workdir})")
+    with open(result_file) as f:
+        return json.load(f)
+
+
+def scaling_report(args, counts):
+    """
+    Train with each local worker count and compare throughput to perfect
+    linear scaling from the smallest count. Local workers split this
+    machine's cores, so a run on one host shows the all-reduce and input
+    overhead; spread over nodes, the same workers add compute.
+    """
+    workdir = tempfile.mkdtemp(prefix='agrishield-scaling-')
+    results = {}
+    for count in counts:
+        print(f"\n=== {count} worker{'s' if count > 1 else ''} ===")
+        try:
+            results[count] = launch_local(args, count, os.path.join(workdir, f'model-{count}.keras'), workdir)
+        except RuntimeError as e:
+            print(f"⚠ {count} workers: {e}")
+    if not results:
+        raise SystemExit("❌ No worker count completed")
+
+    base_count = min(results)
+    base = results[base_count]
+    per_worker_base = base['images_per_sec'] / base_count
+    print(f"\n{'workers':>8} {'global batch':>13} {'steps/s':>8} {'img/s':>8} {'speedup':>8} {'efficiency':>11}")
+    for count, result in results.items():
+        result['speedup'] = round(result['images_per_sec'] / base['images_per_sec'], 3)
+        result['efficiency'] = round(result['images_per_sec'] / (per_worker_base * count), 3)
+        print(f"{count:>8} {result['global_batch_size']:>13} {result['steps_per_sec']:>8.2f} "
+              f"{result['images_per_sec']:>8.1f} {result['speedup']:>7.2f}x {result['efficiency']:>10.0%}")
+
+    report = {
+        'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'host': socket.gethostname(),
+                 'cpus': available_cpus(), 'per_worker_batch_size': args.batch_size, 'epochs': args.epochs},
+        'results': {str(count): result for count, result in results.items()},
+    }
+    with open(args.scaling_report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Scaling report saved to: {args.scaling_report} (worker logs in {workdir})")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-worker data-parallel training of the AgriShield CNN')
+    parser.add_argument('--train-dir', default='train', help='Training images (one folder per class) or shards')
+    parser.add_argument('--valid-dir', default='valid', help="Validation images or shards ('' to skip validation)")
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32, help='Batch size per worker')
+    parser.add_argument('--learning-rate', type=float, default=0.0001)
+    parser.add_argument('--cache', help="Cache decoded images: 'memory' or a directory for cache files")
+    parser.add_argument('--seed', type=int, default=123)
+    parser.add_argument('--precision', choices=('float32', 'mixed_bfloat16', 'mixed_float16'), default='float32')
+    parser.add_argument('--fast', action='store_true', help='bfloat16 mixed precision if the CPU supports it')
+    parser.add_argument('--xla', action='store_true', help='Compile the train step with XLA')
+    parser.add_argument('--target-accuracy', type=float, default=0.9)
+    parser.add_argument('--output', default='AgriShield.keras', help='Where the chief saves the model')
+    parser.add_argument('--workers', help='Comma separated host:port of every worker (instead of TF_CONFIG)')
+    parser.add_argument('--task-index', type=int, default=0, help="This worker's position in --workers")
+    parser.add_argument('--processes-per-host', type=int, default=1,
+                        help='Workers sharing this machine, which split its cores between them')
+    parser.add_argument('--affinity', action='store_true', help='Pin each worker on a host to its own cores')
+    parser.add_argument('--local', type=int, help='Launch this many worker processes on this machine')
+    parser.add_argument('--scaling', help='Comma separated local worker counts to measure, e.g. 1,2,4')
+    parser.add_argument('--scaling-report', default='scaling_report.json')
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scaling:
+        scaling_report(args, [int(count) for count in args.scaling.split(',') if count.strip()])
+    elif args.local:
+        workdir = tempfile.mkdtemp(prefix='agrishield-workers-')
+        print(json.dumps(launch_local(args, args.local, args.output, workdir), indent=2))
+    else:
+        if args.workers:
+            os.environ['TF_CONFIG'] = json.dumps(build_tf_config(args.workers.split(','), args.task_index))
+        run_worker(args)
+
+
+if __name__ == '__main__':
+    main()